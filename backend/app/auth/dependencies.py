@@ -0,0 +1,73 @@
+import os
+from typing import NamedTuple
+
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.auth.jwt import AuthHandler
+from app.db import get_async_db
+from app.models.users import User
+from app.utils.cache import TTLCache
+
+auth_handler = AuthHandler()
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+
+# Authenticated users by email, so most requests skip the user lookup
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+
+# Lightweight record of the authenticated user, detached from any session
+class CurrentUser(NamedTuple):
+    id: int
+    username: str
+    email: str
+
+
+def _load_user(db: Session, email: str):
+    # Only the needed columns, never the user's relationships
+    return (
+        db.query(User.id, User.username, User.email)
+        .filter(User.email == email)
+        .first()
+    )
+
+
+# Resolve the authenticated user once per request. The lookup awaits the
+# database driver, and routes on get_async_db share the request's session.
+async def get_current_user(
+    request: Request, db: AsyncSession = Depends(get_async_db)
+) -> CurrentUser:
+    email = auth_handler.get_current_user(request)
+
+    current_user = _user_cache.get(email)
+    if current_user is None:
+        row = await db.run_sync(_load_user, email)
+        if not row:
+            raise HTTPException(status_code=401, detail="User not found.")
+        current_user = CurrentUser(*row)
+        _user_cache.set(email, current_user)
+
+    return current_user
+
+
+# Drop a cached user, e.g. after it changed
+def invalidate_user(email: str):
+    _user_cache.pop(email)
+
+
+def clear_user_cache():
+    _user_cache.clear()
+
+
+# Invalidate cached users when they are updated or deleted through the ORM
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target: User):
+    invalidate_user(target.email)
+    # The email itself may have changed
+    for email in inspect(target).attrs.email.history.deleted or ():
+        invalidate_user(email)
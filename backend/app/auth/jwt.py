@@ -1,9 +1,13 @@
 from dotenv import load_dotenv
+import hashlib
+import math
 import os
+import time
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from fastapi import HTTPException, Request
 from pydantic import BaseModel
+from app.utils.cache import ExpiringSet, TTLCache
 
 
 load_dotenv()
@@ -17,6 +21,16 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Verified tokens, so repeated requests skip parsing and signature checks.
+# Entries are keyed by a digest of the raw token and expire with the token.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 4096))
+_token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+# Revoked tokens are remembered until their own expiry, never less: only
+# tokens with a valid signature are added, so the set holds at most the
+# tokens logged out of within one token lifetime
+_revoked_tokens = ExpiringSet()
+
 
 # Data model for token
 class TokenData(BaseModel):
@@ -43,6 +57,12 @@ class AuthHandler:
         return encoded_jwt
 
     def decode_token(self, token: str) -> TokenData:
+        # Reuse a previous verification of the same token while it is valid.
+        key = self._token_key(token)
+        token_data = _token_cache.get(key)
+        if token_data is not None:
+            return token_data
+
         # Decode and validate the JWT token.
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
@@ -52,10 +72,50 @@ class AuthHandler:
             exp = payload.get("exp")
             if exp and datetime.utcfromtimestamp(exp) < datetime.utcnow():
                 raise HTTPException(status_code=401, detail="Token expired")
-            return TokenData(email=email)
         except JWTError:
             raise HTTPException(status_code=401, detail="Invalid or expired token")
 
+        # Revoked tokens are never cached, so a hit above is always still valid
+        if key in _revoked_tokens:
+            raise HTTPException(status_code=401, detail="Token revoked")
+
+        token_data = TokenData(email=email)
+        ttl = exp - time.time() if exp else None
+        if ttl is None or ttl > 0:
+            _token_cache.set(key, token_data, ttl=ttl)
+        return token_data
+
+    @staticmethod
+    def _token_key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def invalidate_token(self, token: str):
+        # Forget a verified token so the next request verifies it again.
+        _token_cache.pop(self._token_key(token))
+
+    def revoke_token(self, token: str):
+        # Reject a token from now on, even though its signature is still valid.
+        # Invalid or expired tokens are rejected anyway and are not kept.
+        key = self._token_key(token)
+        _token_cache.pop(key)
+        try:
+            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except JWTError:
+            return
+        exp = payload.get("exp")
+        ttl = exp - time.time() if exp else math.inf
+        if ttl > 0:
+            _revoked_tokens.add(key, ttl)
+
+    @staticmethod
+    def token_cache_stats() -> dict:
+        return _token_cache.stats()
+
+    @staticmethod
+    def clear_token_cache():
+        _token_cache.clear()
+        _revoked_tokens.clear()
+
     def get_current_user(self, request: Request) -> str:
         # Retrieve the current user from the request cookies.
         token = request.cookies.get("access_token")
@@ -1,5 +1,9 @@
+import time
+
 import openai
 
+from app.utils.metrics import CHATBOT_UPSTREAM_SECONDS
+
 """ 
 Hi there! 👋
 how are you doing? 
@@ -55,10 +59,7 @@ class Chatbot:
     def send_message(self, message):
         try:
             self.messages.append({"role": "user", "content": message})
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-            )
+            response = self._complete()
             assistant_message = response.choices[0].message
             self.messages.append(
                 {"role": "assistant", "content": assistant_message.content}
@@ -67,6 +68,22 @@ class Chatbot:
         except Exception as e:
             return f"Error communicating with the API: {str(e)}"
 
+    # Chat completion call to the upstream API, timed by outcome
+    def _complete(self):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=self.messages,
+            )
+            outcome = "ok"
+            return response
+        finally:
+            CHATBOT_UPSTREAM_SECONDS.labels(outcome).observe(
+                time.perf_counter() - started
+            )
+
     # Linear help mode
     def help_mode(self, message=None):
         if message is None:
@@ -87,10 +104,7 @@ class Chatbot:
             return self.end_help()
         else:
             self.messages.append({"role": "user", "content": message})
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-            )
+            response = self._complete()
             assistant_message = response.choices[0].message
             self.messages.append(
                 {"role": "assistant", "content": assistant_message.content}
@@ -1,18 +1,131 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 
+# Listings and downloads can be served from a replica; defaults to the same database
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL", SQLALCHEMY_DATABASE_URL)
+
+# Connection pool, for databases other than in-memory SQLite
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# SQLite pragmas applied to every new connection. WAL lets readers run
+# alongside the single writer, and busy_timeout makes writers wait for the
+# lock instead of failing with "database is locked".
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def sqlite_pragmas(read_only: bool = False) -> list:
+    pragmas = [
+        f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+
+def _engine_options(url, read_only: bool) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.get_backend_name() == "sqlite":
+        if url.get_driver_name() == "pysqlite":
+            options["connect_args"] = {"check_same_thread": False}
+        if _is_memory_sqlite(url):
+            return options
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    if read_only and url.get_backend_name() == "postgresql":
+        options["execution_options"] = {"postgresql_readonly": True}
+    return options
+
+
+def _apply_sqlite_pragmas(sync_engine, read_only: bool):
+    pragmas = sqlite_pragmas(read_only)
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+# Build an engine with the pool and SQLite settings above
+def create_db_engine(database_url: str, read_only: bool = False):
+    url = make_url(database_url)
+    engine = create_engine(url, **_engine_options(url, read_only))
+    if url.get_backend_name() == "sqlite" and not _is_memory_sqlite(url):
+        _apply_sqlite_pragmas(engine, read_only)
+    return engine
+
+
+# Same database through an async driver: aiosqlite for SQLite, asyncpg for Postgres
+def async_database_url(url: str) -> str:
+    scheme, _, rest = url.partition("://")
+    driver = {
+        "sqlite": "sqlite+aiosqlite",
+        "postgres": "postgresql+asyncpg",
+        "postgresql": "postgresql+asyncpg",
+        "mysql": "mysql+aiomysql",
+    }.get(scheme.split("+")[0], scheme)
+    return f"{driver}://{rest}"
+
+
+# Async counterpart of create_db_engine
+def create_async_db_engine(database_url: str, read_only: bool = False):
+    url = make_url(async_database_url(database_url))
+    options = _engine_options(url, read_only)
+    options.pop("execution_options", None)
+    engine = create_async_engine(url, **options)
+    if url.get_backend_name() == "sqlite" and not _is_memory_sqlite(url):
+        _apply_sqlite_pragmas(engine.sync_engine, read_only)
+    return engine
+
+
 # Create the database engine
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-)
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
+
+# Read-only engine for listing and download queries
+read_engine = create_db_engine(READ_DATABASE_URL, read_only=True)
 
 # Create the local session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+async_engine = create_async_db_engine(SQLALCHEMY_DATABASE_URL)
+async_read_engine = create_async_db_engine(READ_DATABASE_URL, read_only=True)
+
+# Async sessions for routes running on the event loop. Queries await the
+# driver, so concurrency is bounded by the connection pool, not the threadpool.
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False
+)
+AsyncReadSessionLocal = async_sessionmaker(
+    async_read_engine, class_=AsyncSession, autoflush=False
+)
 
 # Base for creating models
 Base = declarative_base()
@@ -25,3 +138,24 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Function to get a read-only database session
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Function to get an async database session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Function to get a read-only async database session
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
@@ -1,11 +1,15 @@
+import asyncio
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.routes import users, folders, chatbot
-from app.db import Base, engine
-
-# Create the tables
-Base.metadata.create_all(bind=engine)
+from app.routes import users, folders, chatbot, debug
+from app.db import async_engine, async_read_engine, engine, read_engine
+from app.migrations import check_schema, run_migrations
+from app.services.trash import run_trash_purger
+from app.services.uploads import run_upload_session_sweeper
+from app.utils.metrics import MetricsMiddleware, instrument_pool, metrics_response
+from app.utils.sql_metrics import SQLInstrumentationMiddleware
 
 app = FastAPI()
 
@@ -21,14 +25,59 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
+# Query count and database time of each request, sent as Server-Timing
+app.add_middleware(SQLInstrumentationMiddleware)
+
+# Route latency and in-flight requests for /metrics
+app.add_middleware(MetricsMiddleware)
+instrument_pool(engine, "primary")
+instrument_pool(read_engine, "read")
+instrument_pool(async_engine.sync_engine, "async")
+instrument_pool(async_read_engine.sync_engine, "async_read")
+
 # Routes
 app.include_router(users.router)
 app.include_router(folders.router)
 app.include_router(chatbot.router)
+app.include_router(debug.router)
+
+
+# Bring the schema up to date, and refuse to start if it differs from the
+# models. Read at startup, not import, so importing the app (e.g. in tests)
+# never touches the configured database.
+def prepare_database():
+    if os.getenv("MIGRATE_ON_STARTUP", "true").lower() == "true":
+        run_migrations(engine)
+    if os.getenv("CHECK_SCHEMA_ON_STARTUP", "true").lower() == "true":
+        check_schema(engine)
+
+
+# Startup handlers run in order: the schema is ready before background tasks
+app.add_event_handler("startup", prepare_database)
+
+
+# Background sweep of abandoned resumable uploads and purge of the trash
+@app.on_event("startup")
+async def start_background_tasks():
+    app.state.upload_sweeper = asyncio.create_task(run_upload_session_sweeper())
+    app.state.trash_purger = asyncio.create_task(run_trash_purger())
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    app.state.upload_sweeper.cancel()
+    app.state.trash_purger.cancel()
 
 
 @app.get("/")
 def read_root():
     return {"message": "API Running.."}
+
+
+# Prometheus metrics of the app, merged across workers in multiprocess mode
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
@@ -0,0 +1,19 @@
+from app.migrations.runner import (
+    Migration,
+    SchemaDriftError,
+    check_schema,
+    load_migrations,
+    pending_migrations,
+    run_migrations,
+    schema_drift,
+)
+
+__all__ = [
+    "Migration",
+    "SchemaDriftError",
+    "check_schema",
+    "load_migrations",
+    "pending_migrations",
+    "run_migrations",
+    "schema_drift",
+]
@@ -0,0 +1,39 @@
+import argparse
+import logging
+import sys
+
+from app.db import engine
+from app.migrations.runner import (
+    load_migrations,
+    pending_migrations,
+    run_migrations,
+    schema_drift,
+)
+
+
+# python -m app.migrations [upgrade|status|check]
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.migrations")
+    parser.add_argument("command", choices=["upgrade", "status", "check"])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "upgrade":
+        applied = run_migrations(engine)
+        print(f"Applied {len(applied)} migration(s).")
+    elif args.command == "status":
+        pending = {m.version for m in pending_migrations(engine)}
+        for migration in load_migrations():
+            state = "pending" if migration.version in pending else "applied"
+            print(f"{migration.version:04d} {migration.name:<24} {state}")
+    else:
+        problems = schema_drift(engine)
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit(1)
+        print("Schema is up to date.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from typing import Optional, Sequence
+
+from sqlalchemy import Table, inspect
+from sqlalchemy.engine import Connection
+
+# Schema operations for migrations. Each one checks the current schema first,
+# so a migration can be re-run, or applied to a database whose tables were
+# created by Base.metadata.create_all before migrations existed.
+
+
+def has_table(connection: Connection, table: str) -> bool:
+    return inspect(connection).has_table(table)
+
+
+def has_column(connection: Connection, table: str, column: str) -> bool:
+    return column in {c["name"] for c in inspect(connection).get_columns(table)}
+
+
+def has_index(connection: Connection, table: str, name: str) -> bool:
+    return name in {index["name"] for index in inspect(connection).get_indexes(table)}
+
+
+def has_unique_constraint(connection: Connection, table: str, name: str) -> bool:
+    return name in {
+        constraint["name"]
+        for constraint in inspect(connection).get_unique_constraints(table)
+    }
+
+
+# Create a table from a frozen definition kept in the migration
+def create_table(connection: Connection, table: Table):
+    table.create(connection, checkfirst=True)
+
+
+# Add a column given its DDL, e.g. "blob_id INTEGER REFERENCES blobs (id)"
+def add_column(connection: Connection, table: str, column: str, ddl: str):
+    if not has_column(connection, table, column):
+        connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def create_index(
+    connection: Connection,
+    name: str,
+    table: str,
+    columns: Sequence[str],
+    unique: bool = False,
+    where: Optional[str] = None,
+):
+    if has_index(connection, table, name):
+        return
+    statement = (
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} "
+        f"ON {table} ({', '.join(columns)})"
+    )
+    if where:
+        statement += f" WHERE {where}"
+    connection.exec_driver_sql(statement)
+
+
+def drop_index(connection: Connection, table: str, name: str):
+    if has_index(connection, table, name):
+        connection.exec_driver_sql(f"DROP INDEX {name}")
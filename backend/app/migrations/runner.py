@@ -0,0 +1,150 @@
+import importlib
+import logging
+import pkgutil
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    inspect,
+    select,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from app.db import Base
+from app.migrations import versions
+
+logger = logging.getLogger(__name__)
+
+# One row per applied migration
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    upgrade: Callable
+
+
+class SchemaDriftError(RuntimeError):
+    def __init__(self, problems: List[str]):
+        self.problems = problems
+        super().__init__(
+            "Database schema does not match the models:\n  " + "\n  ".join(problems)
+        )
+
+
+# Migrations are the modules of app/migrations/versions, named v<version>_<name>
+def load_migrations() -> List[Migration]:
+    migrations = []
+    for module_info in pkgutil.iter_modules(versions.__path__):
+        version, _, name = module_info.name.partition("_")
+        module = importlib.import_module(f"{versions.__name__}.{module_info.name}")
+        migrations.append(Migration(int(version[1:]), name, module.upgrade))
+    migrations.sort()
+    return migrations
+
+
+def applied_versions(engine: Engine) -> set:
+    with engine.connect() as connection:
+        if not inspect(connection).has_table(schema_migrations.name):
+            return set()
+        return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending_migrations(engine: Engine) -> List[Migration]:
+    applied = applied_versions(engine)
+    return [m for m in load_migrations() if m.version not in applied]
+
+
+# Apply pending migrations in order, each in its own transaction
+def run_migrations(engine: Engine) -> List[Migration]:
+    schema_migrations.create(engine, checkfirst=True)
+
+    applied = []
+    for migration in pending_migrations(engine):
+        try:
+            with engine.begin() as connection:
+                if connection.dialect.name == "sqlite":
+                    # pysqlite only opens transactions before DML; a failed
+                    # migration must not leave its DDL half applied
+                    connection.exec_driver_sql("BEGIN")
+                migration.upgrade(connection)
+                connection.execute(
+                    schema_migrations.insert().values(
+                        version=migration.version,
+                        name=migration.name,
+                        applied_at=datetime.utcnow(),
+                    )
+                )
+        except IntegrityError:
+            # Applied concurrently by another worker starting up
+            continue
+        logger.info("Applied migration %04d %s", migration.version, migration.name)
+        applied.append(migration)
+    return applied
+
+
+# Differences between the database and the models that the app relies on
+def schema_drift(engine: Engine) -> List[str]:
+    import app.models.folders  # noqa: F401
+    import app.models.users  # noqa: F401
+
+    problems = [
+        f"migration {m.version:04d} {m.name} is not applied"
+        for m in pending_migrations(engine)
+    ]
+
+    with engine.connect() as connection:
+        inspector = inspect(connection)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                problems.append(f"table {table.name} is missing")
+                continue
+
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    problems.append(f"column {table.name}.{column.name} is missing")
+
+            indexes = {
+                index["name"]: index for index in inspector.get_indexes(table.name)
+            }
+            for index in table.indexes:
+                found = indexes.get(index.name)
+                expected = [column.name for column in index.columns]
+                if found is None:
+                    problems.append(f"index {index.name} is missing")
+                elif found["column_names"] != expected or bool(
+                    found["unique"]
+                ) != bool(index.unique):
+                    problems.append(f"index {index.name} differs from the model")
+
+            # A leftover unique constraint silently changes what can be stored
+            expected_constraints = {constraint.name for constraint in table.constraints}
+            for constraint in inspector.get_unique_constraints(table.name):
+                if constraint["name"] not in expected_constraints:
+                    problems.append(
+                        f"unexpected unique constraint {constraint['name']} "
+                        f"on {table.name}"
+                    )
+    return problems
+
+
+# Refuse to run against a database that does not match the models
+def check_schema(engine: Engine):
+    problems = schema_drift(engine)
+    if problems:
+        raise SchemaDriftError(problems)
@@ -0,0 +1,57 @@
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    UniqueConstraint,
+)
+
+from app.migrations.ops import create_index, create_table
+
+# Schema of the first release, frozen as it was
+metadata = MetaData()
+
+users = Table(
+    "users",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("username", String),
+    Column("email", String),
+    Column("hashed_password", String),
+)
+
+folders = Table(
+    "folders",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("path", String, nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    UniqueConstraint("path", "user_id", name="unique_user_folder"),
+)
+
+files = Table(
+    "files",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("filename", String, nullable=False),
+    Column("file_path", String, nullable=False),
+    Column("uploaded_at", DateTime),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    Column("folder_id", Integer, ForeignKey("folders.id")),
+    Column("revision", Integer),
+)
+
+
+def upgrade(connection):
+    for table in (users, folders, files):
+        create_table(connection, table)
+
+    create_index(connection, "ix_users_id", "users", ["id"])
+    create_index(connection, "ix_users_username", "users", ["username"])
+    create_index(connection, "ix_users_email", "users", ["email"], unique=True)
+    create_index(connection, "ix_folders_id", "folders", ["id"])
+    create_index(connection, "ix_files_id", "files", ["id"])
+    create_index(connection, "ix_files_filename", "files", ["filename"])
@@ -0,0 +1,118 @@
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    MetaData,
+    String,
+    Table,
+)
+
+from app.migrations.ops import add_column, create_index, create_table
+
+# Blob store, revision counters, resumable uploads, folder tree and trash,
+# frozen as they were first released
+metadata = MetaData()
+
+Table("users", metadata, Column("id", Integer, primary_key=True))
+Table("folders", metadata, Column("id", Integer, primary_key=True))
+
+blobs = Table(
+    "blobs",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("sha256", String(64), nullable=False),
+    Column("size", BigInteger, nullable=False),
+    Column("refcount", Integer, nullable=False),
+    Column("created_at", DateTime),
+)
+
+trash = Table(
+    "trash",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("kind", String, nullable=False),
+    Column("path", String, nullable=False),
+    Column("deleted_at", DateTime, nullable=False),
+    Column("purge_after", DateTime, nullable=False),
+)
+
+revision_counters = Table(
+    "revision_counters",
+    metadata,
+    Column("folder_id", Integer, ForeignKey("folders.id"), primary_key=True),
+    Column("base_name", String, primary_key=True),
+    Column("last_revision", Integer, nullable=False),
+)
+
+upload_sessions = Table(
+    "upload_sessions",
+    metadata,
+    Column("id", String(32), primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("folder_id", Integer, ForeignKey("folders.id"), nullable=False),
+    Column("filename", String, nullable=False),
+    Column("size", BigInteger),
+    Column("offset", BigInteger, nullable=False),
+    Column("created_at", DateTime),
+    Column("expires_at", DateTime, nullable=False),
+)
+
+
+def upgrade(connection):
+    for table in (blobs, trash, revision_counters, upload_sessions):
+        create_table(connection, table)
+
+    add_column(connection, "files", "base_name", "VARCHAR")
+    add_column(connection, "files", "blob_id", "INTEGER REFERENCES blobs (id)")
+    add_column(connection, "files", "trash_id", "INTEGER REFERENCES trash (id)")
+    add_column(connection, "folders", "parent_id", "INTEGER REFERENCES folders (id)")
+    add_column(connection, "folders", "trash_id", "INTEGER REFERENCES trash (id)")
+
+    create_index(connection, "ix_blobs_id", "blobs", ["id"])
+    create_index(connection, "ix_blobs_sha256", "blobs", ["sha256"], unique=True)
+    create_index(connection, "ix_trash_id", "trash", ["id"])
+    create_index(connection, "ix_trash_user_id", "trash", ["user_id"])
+    create_index(connection, "ix_trash_purge_after", "trash", ["purge_after"])
+    create_index(
+        connection, "ix_upload_sessions_user_id", "upload_sessions", ["user_id"]
+    )
+    create_index(
+        connection, "ix_upload_sessions_expires_at", "upload_sessions", ["expires_at"]
+    )
+
+    create_index(connection, "ix_files_blob_id", "files", ["blob_id"])
+    create_index(connection, "ix_files_trash_id", "files", ["trash_id"])
+    create_index(
+        connection, "ix_files_folder_base_name", "files", ["folder_id", "base_name"]
+    )
+    create_index(
+        connection,
+        "ix_files_folder_filename",
+        "files",
+        ["folder_id", "filename", "id"],
+    )
+    create_index(
+        connection,
+        "ix_files_folder_uploaded_at",
+        "files",
+        ["folder_id", "uploaded_at", "id"],
+    )
+    create_index(
+        connection,
+        "ix_files_folder_revision",
+        "files",
+        ["folder_id", "revision", "id"],
+    )
+    create_index(connection, "ix_folders_trash_id", "folders", ["trash_id"])
+    create_index(
+        connection, "ix_folders_user_path", "folders", ["user_id", "path", "id"]
+    )
+    create_index(
+        connection,
+        "ix_folders_user_parent_path",
+        "folders",
+        ["user_id", "parent_id", "path"],
+    )
@@ -0,0 +1,64 @@
+from app.migrations.ops import create_index, has_unique_constraint
+
+# Folder paths were unique per user, which stops a trashed folder from being
+# recreated. They become unique among live folders only, a partial index.
+FOLDER_INDEXES = [
+    ("ix_folders_id", ["id"]),
+    ("ix_folders_trash_id", ["trash_id"]),
+    ("ix_folders_user_path", ["user_id", "path", "id"]),
+    ("ix_folders_user_parent_path", ["user_id", "parent_id", "path"]),
+]
+
+# SQLite cannot drop a table constraint, so the table is rebuilt. Triggers
+# mentioning folders are dropped around the rebuild and created again after.
+SQLITE_REBUILD = [
+    """
+    CREATE TABLE folders_rebuild (
+        id INTEGER NOT NULL,
+        path VARCHAR NOT NULL,
+        user_id INTEGER,
+        parent_id INTEGER,
+        trash_id INTEGER,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES users (id),
+        FOREIGN KEY(parent_id) REFERENCES folders (id),
+        FOREIGN KEY(trash_id) REFERENCES trash (id)
+    )
+    """,
+    """
+    INSERT INTO folders_rebuild (id, path, user_id, parent_id, trash_id)
+    SELECT id, path, user_id, parent_id, trash_id FROM folders
+    """,
+    "DROP TABLE folders",
+    "ALTER TABLE folders_rebuild RENAME TO folders",
+]
+
+
+def upgrade(connection):
+    if has_unique_constraint(connection, "folders", "unique_user_folder"):
+        if connection.dialect.name == "sqlite":
+            triggers = connection.exec_driver_sql(
+                "SELECT name, sql FROM sqlite_master "
+                "WHERE type = 'trigger' AND sql LIKE '%folders%'"
+            ).all()
+            for name, _ in triggers:
+                connection.exec_driver_sql(f"DROP TRIGGER {name}")
+            for statement in SQLITE_REBUILD:
+                connection.exec_driver_sql(statement)
+            for _, sql in triggers:
+                connection.exec_driver_sql(sql)
+        else:
+            connection.exec_driver_sql(
+                "ALTER TABLE folders DROP CONSTRAINT unique_user_folder"
+            )
+
+    for name, columns in FOLDER_INDEXES:
+        create_index(connection, name, "folders", columns)
+    create_index(
+        connection,
+        "unique_user_folder",
+        "folders",
+        ["path", "user_id"],
+        unique=True,
+        where="trash_id IS NULL",
+    )
@@ -0,0 +1,72 @@
+import sqlite3
+
+from app.migrations.ops import has_table
+
+# Full-text index of file names, frozen as it was first released
+FILE_SEARCH_TABLE = "files_fts"
+
+FILE_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS files_fts
+    USING fts5(filename, folder_path, owner, tokenize='trigram')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+        INSERT INTO files_fts(rowid, filename, folder_path, owner) VALUES (
+            new.id,
+            new.filename,
+            (SELECT path FROM folders WHERE id = new.folder_id),
+            '<' || new.user_id || '>'
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS files_fts_update
+    AFTER UPDATE OF filename, folder_id, user_id ON files BEGIN
+        DELETE FROM files_fts WHERE rowid = old.id;
+        INSERT INTO files_fts(rowid, filename, folder_path, owner) VALUES (
+            new.id,
+            new.filename,
+            (SELECT path FROM folders WHERE id = new.folder_id),
+            '<' || new.user_id || '>'
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+        DELETE FROM files_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS folders_fts_update
+    AFTER UPDATE OF path ON folders BEGIN
+        UPDATE files_fts SET folder_path = new.path
+        WHERE rowid IN (SELECT id FROM files WHERE folder_id = new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS folders_fts_delete AFTER DELETE ON folders BEGIN
+        DELETE FROM files_fts
+        WHERE rowid IN (SELECT id FROM files WHERE folder_id = old.id);
+    END
+    """,
+]
+
+# Index the files stored before the search table existed
+FILE_SEARCH_BACKFILL = """
+    INSERT INTO files_fts(rowid, filename, folder_path, owner)
+    SELECT files.id, files.filename, folders.path, '<' || files.user_id || '>'
+    FROM files LEFT JOIN folders ON folders.id = files.folder_id
+"""
+
+
+# On SQLite builds with the trigram tokenizer only
+def upgrade(connection):
+    if connection.dialect.name != "sqlite" or sqlite3.sqlite_version_info < (3, 34):
+        return
+
+    exists = has_table(connection, FILE_SEARCH_TABLE)
+    for statement in FILE_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        connection.exec_driver_sql(FILE_SEARCH_BACKFILL)
@@ -0,0 +1,49 @@
+from sqlalchemy import text
+
+# Folder path helpers, frozen as they were when this migration was written
+SEPARATOR = "/"
+
+
+def parent_path(path: str) -> str:
+    return path.rpartition(SEPARATOR)[0]
+
+
+# Link the folders created before the tree existed to their parent, creating
+# missing ancestors so that every folder is reachable from the root
+def upgrade(connection):
+    folders = {
+        (user_id, path): (folder_id, parent_id)
+        for folder_id, user_id, path, parent_id in connection.execute(
+            text(
+                "SELECT id, user_id, path, parent_id FROM folders "
+                "WHERE trash_id IS NULL"
+            )
+        )
+    }
+
+    def folder_id(user_id, path):
+        if (user_id, path) in folders:
+            return folders[(user_id, path)][0]
+        parent_id = folder_id(user_id, parent_path(path)) if SEPARATOR in path else None
+        new_id = connection.execute(
+            text(
+                "INSERT INTO folders (path, user_id, parent_id) "
+                "VALUES (:path, :user_id, :parent_id)"
+            ),
+            {"path": path, "user_id": user_id, "parent_id": parent_id},
+        ).lastrowid
+        folders[(user_id, path)] = (new_id, parent_id)
+        return new_id
+
+    # Shallow paths first so parents are linked before their children
+    by_depth = sorted(folders, key=lambda key: key[1].count(SEPARATOR))
+    for user_id, path in by_depth:
+        current_id, parent_id = folders[(user_id, path)]
+        if parent_id is not None or SEPARATOR not in path:
+            continue
+        parent_id = folder_id(user_id, parent_path(path))
+        connection.execute(
+            text("UPDATE folders SET parent_id = :parent_id WHERE id = :id"),
+            {"parent_id": parent_id, "id": current_id},
+        )
+        folders[(user_id, path)] = (current_id, parent_id)
@@ -0,0 +1,37 @@
+from app.migrations.ops import create_index, drop_index
+
+
+# Composite indexes for the hot query shapes of app/services
+def upgrade(connection):
+    # Seeding a revision counter reads max(revision) for (folder_id, base_name)
+    create_index(
+        connection,
+        "ix_files_folder_base_name_revision",
+        "files",
+        ["folder_id", "base_name", "revision"],
+    )
+    drop_index(connection, "files", "ix_files_folder_base_name")
+
+    # Live file counts per folder (children listing, folder size)
+    create_index(
+        connection, "ix_files_folder_trash", "files", ["folder_id", "trash_id"]
+    )
+
+    # Search: the FTS join and the short-query scan filter on user_id
+    create_index(
+        connection, "ix_files_user_filename", "files", ["user_id", "filename", "id"]
+    )
+
+    # Trash listing of a user, newest first; replaces the single column index
+    create_index(
+        connection,
+        "ix_trash_user_deleted_at",
+        "trash",
+        ["user_id", "deleted_at", "id"],
+    )
+    drop_index(connection, "trash", "ix_trash_user_id")
+
+    # Purging a folder checks the foreign key from upload sessions
+    create_index(
+        connection, "ix_upload_sessions_folder_id", "upload_sessions", ["folder_id"]
+    )
@@ -0,0 +1,6 @@
+from app.migrations.ops import add_column
+
+
+# Blobs may be stored compressed by the storage codec
+def upgrade(connection):
+    add_column(connection, "blobs", "encoding", "VARCHAR(16)")
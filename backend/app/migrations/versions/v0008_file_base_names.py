@@ -0,0 +1,38 @@
+import os
+
+from sqlalchemy import text
+
+BATCH_SIZE = 1000
+
+
+# Document name of a file stored before base_name existed: "report_v2.pdf"
+# at revision 2 is a revision of "report"
+def legacy_base_name(filename: str, revision: int) -> str:
+    stem = os.path.splitext(filename)[0]
+    suffix = f"_v{revision}"
+    if revision and stem.endswith(suffix):
+        return stem[: -len(suffix)]
+    return stem
+
+
+# Fill base_name of the files uploaded before it was recorded. Without it,
+# revision counters are seeded too low and latest-only listings skip them.
+def upgrade(connection):
+    update = text("UPDATE files SET base_name = :base_name WHERE id = :id")
+    while True:
+        rows = connection.execute(
+            text(
+                "SELECT id, filename, COALESCE(revision, 0) FROM files "
+                "WHERE base_name IS NULL LIMIT :limit"
+            ),
+            {"limit": BATCH_SIZE},
+        ).all()
+        if not rows:
+            return
+        connection.execute(
+            update,
+            [
+                {"id": file_id, "base_name": legacy_base_name(filename, revision)}
+                for file_id, filename, revision in rows
+            ],
+        )
@@ -1,22 +1,66 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+import sqlite3
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Integer,
+    String,
+    DateTime,
+    ForeignKey,
+    Index,
+    event,
+)
 from app.db import Base
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
 
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, index=True, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0)
+    # Content-Encoding of the stored bytes (e.g. "gzip"), None when stored as is
+    encoding = Column(String(16), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    files = relationship("File", back_populates="blob")
+
+
 class File(Base):
     __tablename__ = "files"
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True, nullable=False)
+    base_name = Column(String)
     file_path = Column(String, nullable=False)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     user_id = Column(Integer, ForeignKey("users.id"))
     folder_id = Column(Integer, ForeignKey("folders.id"))
     revision = Column(Integer, default=0)
+    blob_id = Column(Integer, ForeignKey("blobs.id"), index=True)
+    trash_id = Column(Integer, ForeignKey("trash.id"), index=True)
 
     user = relationship("User", back_populates="files")
     folder = relationship("Folder", back_populates="files")
+    blob = relationship("Blob", back_populates="files")
+
+    __table_args__ = (
+        # Covers seeding a revision counter from the latest stored revision
+        Index(
+            "ix_files_folder_base_name_revision", "folder_id", "base_name", "revision"
+        ),
+        # Keyset pagination of folder listings, one index per sort key
+        Index("ix_files_folder_filename", "folder_id", "filename", "id"),
+        Index("ix_files_folder_uploaded_at", "folder_id", "uploaded_at", "id"),
+        Index("ix_files_folder_revision", "folder_id", "revision", "id"),
+        # Live file counts per folder without visiting the rows
+        Index("ix_files_folder_trash", "folder_id", "trash_id"),
+        # Search results of one user, ordered by name
+        Index("ix_files_user_filename", "user_id", "filename", "id"),
+    )
 
 
 class Folder(Base):
@@ -25,8 +69,141 @@ class Folder(Base):
     id = Column(Integer, primary_key=True, index=True)
     path = Column(String, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"))
+    parent_id = Column(Integer, ForeignKey("folders.id"))
+    trash_id = Column(Integer, ForeignKey("trash.id"), index=True)
 
     user = relationship("User", back_populates="folders")
     files = relationship("File", back_populates="folder")
 
-    __table_args__ = (UniqueConstraint("path", "user_id", name="unique_user_folder"),)
+    __table_args__ = (
+        # Paths are unique among live folders; trashed ones keep their path
+        Index(
+            "unique_user_folder",
+            "path",
+            "user_id",
+            unique=True,
+            sqlite_where=trash_id.is_(None),
+            postgresql_where=trash_id.is_(None),
+        ),
+        # Subtrees are path ranges: "a/b" and everything from "a/b/" to "a/b0"
+        Index("ix_folders_user_path", "user_id", "path", "id"),
+        # Immediate children of a folder, or of the root when parent_id is null
+        Index("ix_folders_user_parent_path", "user_id", "parent_id", "path"),
+    )
+
+
+class Trash(Base):
+    __tablename__ = "trash"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False)  # "folder" or "file"
+    path = Column(String, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    purge_after = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        # Trash listing of one user, most recent first
+        Index("ix_trash_user_deleted_at", "user_id", "deleted_at", "id"),
+    )
+
+
+class RevisionCounter(Base):
+    __tablename__ = "revision_counters"
+
+    folder_id = Column(Integer, ForeignKey("folders.id"), primary_key=True)
+    base_name = Column(String, primary_key=True)
+    last_revision = Column(Integer, nullable=False, default=0)
+
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    folder_id = Column(Integer, ForeignKey("folders.id"), nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    size = Column(BigInteger)
+    offset = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+# Full-text index of file names (SQLite FTS5 trigram tokenizer, 3.34+).
+# Each row is keyed by the file id; "owner" holds "<user_id>" so a search can
+# be restricted to one user inside the index. Triggers keep it in sync with
+# inserts, renames and deletes of files and folders.
+FILE_SEARCH_TABLE = "files_fts"
+
+FILE_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS files_fts
+    USING fts5(filename, folder_path, owner, tokenize='trigram')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+        INSERT INTO files_fts(rowid, filename, folder_path, owner) VALUES (
+            new.id,
+            new.filename,
+            (SELECT path FROM folders WHERE id = new.folder_id),
+            '<' || new.user_id || '>'
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS files_fts_update
+    AFTER UPDATE OF filename, folder_id, user_id ON files BEGIN
+        DELETE FROM files_fts WHERE rowid = old.id;
+        INSERT INTO files_fts(rowid, filename, folder_path, owner) VALUES (
+            new.id,
+            new.filename,
+            (SELECT path FROM folders WHERE id = new.folder_id),
+            '<' || new.user_id || '>'
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+        DELETE FROM files_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS folders_fts_update
+    AFTER UPDATE OF path ON folders BEGIN
+        UPDATE files_fts SET folder_path = new.path
+        WHERE rowid IN (SELECT id FROM files WHERE folder_id = new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS folders_fts_delete AFTER DELETE ON folders BEGIN
+        DELETE FROM files_fts
+        WHERE rowid IN (SELECT id FROM files WHERE folder_id = old.id);
+    END
+    """,
+]
+
+# Index the files stored before the search table existed
+FILE_SEARCH_BACKFILL = """
+    INSERT INTO files_fts(rowid, filename, folder_path, owner)
+    SELECT files.id, files.filename, folders.path, '<' || files.user_id || '>'
+    FROM files LEFT JOIN folders ON folders.id = files.folder_id
+"""
+
+
+def file_search_supported(dialect) -> bool:
+    return dialect.name == "sqlite" and sqlite3.sqlite_version_info >= (3, 34)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_file_search_index(target, connection, **kw):
+    if not file_search_supported(connection.dialect):
+        return
+
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (FILE_SEARCH_TABLE,),
+    ).scalar()
+    for statement in FILE_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        connection.exec_driver_sql(FILE_SEARCH_BACKFILL)
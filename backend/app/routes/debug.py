@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.auth.dependencies import CurrentUser, get_current_user
+from app.utils import sql_metrics
+
+router = APIRouter()
+
+
+# Query counts, timings and likely N+1 statements of recent requests
+@router.get("/debug/sql")
+def debug_sql(current_user: CurrentUser = Depends(get_current_user)):
+    if not sql_metrics.SQL_DEBUG_ENDPOINT:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return {"requests": sql_metrics.recent_requests()}
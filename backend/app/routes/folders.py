@@ -1,53 +1,99 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form, Request
+from fastapi import APIRouter, Depends, File, UploadFile, Form, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List
 from fastapi import Query
-from app.db import get_db
-from app.auth.jwt import AuthHandler
+from app.db import get_async_db, get_async_read_db, get_db
+from app.auth.dependencies import CurrentUser, get_current_user
+from app.schemas import folders as schemas
+from app.utils.pagination import (
+    MAX_PAGE_SIZE,
+    PageRequest,
+    page_params,
+    set_page_headers,
+)
 import os
 
 # Services
 from app.services.folders import (
-    create_folder_service,
-    get_user_folders,
-    delete_folder_from_path,
+    create_folder_service_async,
+    get_user_folders_async,
+    get_folder_children_async,
+    get_folder_size_async,
+    delete_folder_from_path_async,
+    download_folder_archive_async,
+)
+from app.services.uploads import (
+    create_upload_session,
+    get_upload_session,
+    put_upload_chunk,
+    complete_upload_session,
+    delete_upload_session,
 )
+from app.services.archives import upload_archive
+from app.services.batch import run_batch_async
+from app.services.search import search_files_async
+from app.services.trash import list_trash_async, restore_trash_async
 from app.services.files import (
     upload_user_file,
-    get_files_from_folder,
-    delete_file_from_path,
-    download_file_from_path,
-    preview_file_from_path,
+    get_files_from_folder_async,
+    delete_file_from_path_async,
+    download_file_from_path_async,
+    preview_file_from_path_async,
 )
 
 router = APIRouter()
 
-# AuthHandler instance
-auth_handler = AuthHandler()
-
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 
 # Create a folder
 @router.post("/create_folder/")
-def create_folder(
+async def create_folder(
     folder_path: str = Form(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     files: List[UploadFile] = File(default=[]),
-    request: Request = None,
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    current_user = auth_handler.get_current_user(request)
-    if not current_user:
-        raise HTTPException(status_code=401, detail="User not authenticated.")
-
-    return create_folder_service(folder_path, current_user, db, files)
+    return await create_folder_service_async(folder_path, current_user, db, files)
 
 
 # List user folders
 @router.get("/folders/")
-def list_folders(db: Session = Depends(get_db), request: Request = None):
-    return get_user_folders(db, request)
+async def list_folders(
+    response: Response,
+    page: PageRequest = Depends(page_params),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    result = await get_user_folders_async(db, current_user, page)
+    set_page_headers(response, result)
+    return result.items
+
+
+# List the immediate children of a folder, or the top-level folders
+@router.get("/folder_children/{folder_path:path}")
+async def list_folder_children(
+    folder_path: str,
+    response: Response,
+    page: PageRequest = Depends(page_params),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    result = await get_folder_children_async(folder_path, db, current_user, page)
+    set_page_headers(response, result)
+    return result.items
+
+
+# Size of a folder and everything nested inside it
+@router.get("/folder_size/{folder_path:path}")
+async def folder_size(
+    folder_path: str,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    return await get_folder_size_async(folder_path, db, current_user)
 
 
 # Upload a file
@@ -55,57 +101,201 @@ def list_folders(db: Session = Depends(get_db), request: Request = None):
 async def upload_file(
     folder_name: str,
     file: UploadFile,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    return await upload_user_file(folder_name, file, db, current_user)
+
+
+# Upload a ZIP or tar(.gz) archive, extracted into a folder. Extraction reads
+# and writes files between its queries, progress events included, so the
+# route stays sync and runs in the threadpool as a whole.
+@router.post("/upload_archive/{folder_path:path}")
+def upload_archive_file(
+    folder_path: str,
+    archive: UploadFile,
+    progress: bool = Query(False, description="Stream progress events as NDJSON"),
     db: Session = Depends(get_db),
-    request: Request = None,
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    return upload_archive(folder_path, archive, db, current_user, progress)
+
+
+# Start a resumable upload
+@router.post("/upload_sessions/")
+async def start_upload_session(
+    data: schemas.UploadSessionCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    return await create_upload_session(data, db, current_user)
+
+
+# Get the current offset of a resumable upload
+@router.get("/upload_sessions/{upload_id}")
+async def read_upload_session(
+    upload_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    return await get_upload_session(upload_id, db, current_user)
+
+
+# Send a chunk of a resumable upload, starting at the given offset
+@router.put("/upload_sessions/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0, description="Offset of the first byte sent"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    return await upload_user_file(folder_name, file, db, request)
+    return await put_upload_chunk(upload_id, offset, db, current_user, request)
+
+
+# Finish a resumable upload, storing it as a new file revision
+@router.post("/upload_sessions/{upload_id}/complete")
+async def complete_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    return await complete_upload_session(upload_id, db, current_user)
+
+
+# Cancel a resumable upload
+@router.delete("/upload_sessions/{upload_id}")
+async def cancel_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    return await delete_upload_session(upload_id, db, current_user)
 
 
 # List files in a folder
 @router.get("/folder/{folder_path:path}/files/")
-def get_files_in_folder(
-    folder_path: str, db: Session = Depends(get_db), request: Request = None
+async def get_files_in_folder(
+    folder_path: str,
+    response: Response,
+    page: PageRequest = Depends(page_params),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    return get_files_from_folder(folder_path, db, request)
+    result = await get_files_from_folder_async(folder_path, db, current_user, page)
+    set_page_headers(response, result)
+    return result.items
+
+
+# Search files by name across all folders
+@router.get("/search/")
+async def search(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = Query(None),
+    include_total: bool = Query(False),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    result = await search_files_async(
+        q, limit, cursor, include_total, db, current_user
+    )
+    set_page_headers(response, result)
+    return result.items
 
 
 # Delete a folder
-@router.delete("/delete_folder/{folder_path:path}")
-def delete_folder(
-    folder_path: str, db: Session = Depends(get_db), request: Request = None
+@router.delete("/delete_folder/{folder_path:path}", status_code=202)
+async def delete_folder(
+    folder_path: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    return delete_folder_from_path(folder_path, db, request)
+    return await delete_folder_from_path_async(folder_path, db, current_user)
 
 
 # Delete a file
-@router.delete("/delete_file/{folder_path:path}/{filename}")
-def delete_file(
+@router.delete("/delete_file/{folder_path:path}/{filename}", status_code=202)
+async def delete_file(
     folder_path: str,
     filename: str,
-    db: Session = Depends(get_db),
-    request: Request = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    return delete_file_from_path(folder_path, filename, db, request)
+    return await delete_file_from_path_async(folder_path, filename, db, current_user)
+
+
+# Run several file and folder operations in one request
+@router.post("/batch/")
+async def batch(
+    operations: schemas.BatchRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    return await run_batch_async(operations, db, current_user)
+
+
+# List deleted folders and files awaiting purge
+@router.get("/trash/")
+async def read_trash(
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    return await list_trash_async(db, current_user)
+
+
+# Restore a deleted folder or file
+@router.post("/trash/{trash_id}/restore")
+async def restore_from_trash(
+    trash_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    return await restore_trash_async(trash_id, db, current_user)
+
+
+# Download a folder as a ZIP archive
+@router.get("/download_folder/{folder_path:path}")
+async def download_folder(
+    folder_path: str,
+    recursive: bool = Query(False, description="Include subfolders"),
+    latest_only: bool = Query(False, description="Only the latest revisions"),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    return await download_folder_archive_async(
+        folder_path, db, current_user, recursive, latest_only
+    )
 
 
 # Download a file
 @router.get("/download/{folder_path:path}/{filename}")
-def download_file(
+async def download_file(
     folder_path: str,
     filename: str,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    return download_file_from_path(folder_path, filename, db, request)
+    return await download_file_from_path_async(
+        folder_path, filename, db, current_user, request
+    )
 
 
 # Preview a file
 @router.get("/folder/{folder_path:path}/{filename}")
-def preview_file(
+async def preview_file(
     folder_path: str,
     filename: str,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     review: int = Query(None, description="File revision number"),
+    variant: str = Query(
+        None, description="original, thumbnail, web, text or page"
+    ),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    return preview_file_from_path(folder_path, filename, review, db, request)
+    return await preview_file_from_path_async(
+        folder_path, filename, review, db, current_user, request, variant
+    )
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Request
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import get_db
+from app.db import get_async_db
 from app.schemas import users as schemas
-from app.services.users import register_user, get_user_by_email, verify_password
+from app.services.users import authenticate_user, register_user
 from app.auth.jwt import AuthHandler
 
 
@@ -16,23 +16,16 @@ auth_handler = AuthHandler()
 
 # Register user
 @router.post("/register/")
-async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    register_user(user, db)
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    await register_user(user, db)
     return JSONResponse({"message": "User successfully created"})
 
 
 # Login
 @router.post("/login/")
-def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
-    # Find user in database
-    db_user = get_user_by_email(db, email=user.email)
-
-    # Verifying data
-    if not db_user:
-        raise HTTPException(status_code=401, detail="Invalid email or password.")
-
-    if not verify_password(user.password, db_user.hashed_password):
-        raise HTTPException(status_code=401, detail="Invalid email or password.")
+async def login(user: schemas.UserLogin, db: AsyncSession = Depends(get_async_db)):
+    # Verifying the credentials, off the event loop
+    db_user = await authenticate_user(user, db)
 
     # Generate token
     access_token = auth_handler.create_access_token(data={"sub": db_user.email})
@@ -53,7 +46,12 @@ def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
 
 # Logout
 @router.post("/logout/")
-def logout():
+def logout(request: Request):
+    # Revoking the token so a copy of the cookie cannot be reused
+    token = request.cookies.get("access_token")
+    if token:
+        auth_handler.revoke_token(token)
+
     response = JSONResponse({"message": "Logout successful"})
     # Removing the token cookie
     response.delete_cookie("access_token", path="/", domain=None)
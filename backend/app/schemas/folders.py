@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List, Literal, Optional
 
 
 class FileCreate(BaseModel):
@@ -30,3 +31,33 @@ class FolderResponse(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class UploadSessionCreate(BaseModel):
+    folder_path: str
+    filename: str
+    size: Optional[int] = None
+
+
+class UploadSessionResponse(BaseModel):
+    upload_id: str
+    filename: str
+    offset: int
+    size: Optional[int]
+    expires_at: datetime
+
+
+class BatchOperation(BaseModel):
+    op: Literal["delete_file", "delete_folder", "move_file", "stat_file", "list_folder"]
+    folder_path: str
+    filename: Optional[str] = None
+    target_folder_path: Optional[str] = None
+    # list_folder only
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
+    sort: Optional[str] = None
+    prefix: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation]
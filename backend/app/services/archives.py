@@ -0,0 +1,319 @@
+import json
+import logging
+import os
+import tarfile
+import time
+import zipfile
+import zlib
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Set
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.auth.dependencies import CurrentUser
+from app.models import folders as foldersModels
+from app.services.revisions import allocate_revisions
+from app.services.storage import (
+    StoredUpload,
+    blob_path,
+    discard_staged,
+    encode_staged,
+    hashes_to_encode,
+    staging_path,
+    store_blob,
+    write_stream,
+)
+from app.services.tree import (
+    DRIVE_PATTERN,
+    SEPARATOR,
+    ensure_folder,
+    normalize_path,
+)
+from app.utils.metrics import record_transfer
+
+logger = logging.getLogger(__name__)
+
+# Limits on what one archive may expand to. Sizes are counted on the bytes
+# actually extracted, not on the sizes the archive declares.
+ARCHIVE_MAX_ENTRIES = int(os.getenv("ARCHIVE_MAX_ENTRIES", 10_000))
+ARCHIVE_MAX_BYTES = int(os.getenv("ARCHIVE_MAX_BYTES", 1024 * 1024 * 1024))
+ARCHIVE_MAX_RATIO = float(os.getenv("ARCHIVE_MAX_RATIO", 100))
+
+# Seconds between two progress events of a streamed import
+ARCHIVE_PROGRESS_INTERVAL = float(os.getenv("ARCHIVE_PROGRESS_INTERVAL", 0.5))
+
+
+# An archive member: a directory when stream is None
+class Member(NamedTuple):
+    name: str
+    stream: Optional[BinaryIO]
+
+
+# A file extracted to staging, and the folder it goes to
+class StagedMember(NamedTuple):
+    folder_path: str
+    filename: str
+    stored: StoredUpload
+
+
+# Bytes extracted so far, checked against the size and ratio limits
+class _Budget:
+    def __init__(self, archive_size: int):
+        self.archive_size = archive_size
+        self.entries = 0
+        self.extracted = 0
+
+    def add_entry(self):
+        self.entries += 1
+        if self.entries > ARCHIVE_MAX_ENTRIES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Archive has more than {ARCHIVE_MAX_ENTRIES} entries.",
+            )
+
+    def consume(self, size: int):
+        self.extracted += size
+        if self.extracted > ARCHIVE_MAX_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Archive expands to more than {ARCHIVE_MAX_BYTES} bytes.",
+            )
+        if self.extracted > max(self.archive_size, 1) * ARCHIVE_MAX_RATIO:
+            raise HTTPException(
+                status_code=413,
+                detail="Archive compression ratio is too high.",
+            )
+
+
+# Member stream charging every byte read to the budget
+class _LimitedReader:
+    def __init__(self, stream: BinaryIO, budget: _Budget):
+        self._stream = stream
+        self._budget = budget
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self._budget.consume(len(data))
+        return data
+
+
+# Folder parts and file name of a member, refusing paths leaving the target
+def member_path(name: str) -> List[str]:
+    normalized = name.replace("\\", SEPARATOR)
+    if (
+        normalized.startswith(SEPARATOR)
+        or DRIVE_PATTERN.match(normalized)
+        or "\x00" in normalized
+    ):
+        raise HTTPException(status_code=400, detail=f"Unsafe path in archive: {name}")
+
+    parts = [part for part in normalized.split(SEPARATOR) if part not in ("", ".")]
+    if ".." in parts:
+        raise HTTPException(status_code=400, detail=f"Unsafe path in archive: {name}")
+    return parts
+
+
+def _zip_members(source: BinaryIO) -> Iterator[Member]:
+    with zipfile.ZipFile(source) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                yield Member(info.filename, None)
+                continue
+            if info.flag_bits & 0x1:
+                raise HTTPException(
+                    status_code=400, detail="Encrypted archives are not supported."
+                )
+            with archive.open(info) as stream:
+                yield Member(info.filename, stream)
+
+
+# Tar members are read in one forward pass, decompressing on the way. Links
+# and special files are skipped: only their names would be extracted.
+def _tar_members(source: BinaryIO) -> Iterator[Member]:
+    with tarfile.open(fileobj=source, mode="r|*") as archive:
+        for info in archive:
+            if info.isdir():
+                yield Member(info.name, None)
+            elif info.isfile():
+                yield Member(info.name, archive.extractfile(info))
+            else:
+                logger.info("Skipping %s in archive: not a regular file", info.name)
+
+
+# Members of a ZIP or (compressed) tar archive, recognised by content
+def archive_members(source: BinaryIO) -> Iterator[Member]:
+    if zipfile.is_zipfile(source):
+        source.seek(0)
+        return _zip_members(source)
+    source.seek(0)
+    return _tar_members(source)
+
+
+# Extract members to staging, adding to staged and folders as it goes, and
+# yield after each member so the caller can report progress
+def _stage_members(
+    source: BinaryIO,
+    root: str,
+    budget: _Budget,
+    staged: List[StagedMember],
+    folders: Set[str],
+) -> Iterator[None]:
+    try:
+        for member in archive_members(source):
+            budget.add_entry()
+            parts = member_path(member.name)
+            if not parts:
+                continue
+            if member.stream is None:
+                dirs, filename = parts, None
+            else:
+                dirs, filename = parts[:-1], parts[-1]
+
+            # Folder paths are lower case, as created by /create_folder/
+            folder_path = SEPARATOR.join([root] + dirs).lower()
+            folders.add(folder_path)
+            if filename is not None:
+                stored = write_stream(
+                    _LimitedReader(member.stream, budget), staging_path()
+                )
+                staged.append(StagedMember(folder_path, filename, stored))
+            yield
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError, zlib.error):
+        raise HTTPException(
+            status_code=400, detail="Unreadable or unsupported archive."
+        )
+
+
+# Compress the staged files with new content, each distinct content once.
+# Members are replaced as they are encoded, so a failure discards the right
+# files.
+def _encode_members(db: Session, staged: List[StagedMember]):
+    pending = hashes_to_encode(db, [member.stored for member in staged])
+    for index, member in enumerate(staged):
+        if member.stored.sha256 in pending:
+            pending.discard(member.stored.sha256)
+            staged[index] = member._replace(stored=encode_staged(member.stored))
+
+
+# Create the folders and link the staged files as new revisions, in one
+# transaction. Revisions are allocated in one batch per folder.
+def _store_members(
+    db: Session, user_id: int, folders: Set[str], staged: List[StagedMember]
+) -> int:
+    by_folder: Dict[str, List[StagedMember]] = {}
+    for member in staged:
+        by_folder.setdefault(member.folder_path, []).append(member)
+
+    new_files = []
+    for folder_path in sorted(folders):
+        folder = ensure_folder(db, user_id, folder_path)
+        members = by_folder.get(folder_path, [])
+        allocated = allocate_revisions(
+            db, folder.id, [member.filename for member in members]
+        )
+        for member, revision in zip(members, allocated):
+            blob = store_blob(db, member.stored)
+            new_files.append(
+                foldersModels.File(
+                    filename=revision.filename,
+                    base_name=revision.base_name,
+                    file_path=blob_path(blob.sha256),
+                    folder_id=folder.id,
+                    user_id=user_id,
+                    revision=revision.revision,
+                    blob_id=blob.id,
+                )
+            )
+
+    # Save file details in the database with one bulk insert
+    db.add_all(new_files)
+    db.commit()
+    return len(new_files)
+
+
+def _archive_size(source: BinaryIO) -> int:
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    return size
+
+
+# Extract an archive into a folder, yielding progress events and then the
+# result. Every file is staged and every limit checked before the database
+# is touched, so a rejected archive leaves nothing behind.
+def import_archive(
+    folder_path: str, archive: UploadFile, db: Session, current_user: CurrentUser
+) -> Iterator[dict]:
+    root = normalize_path(folder_path).lower()
+    if not root:
+        raise HTTPException(status_code=400, detail="Invalid folder path.")
+
+    source = archive.file
+    archive_size = _archive_size(source)
+    budget = _Budget(archive_size)
+    staged: List[StagedMember] = []
+    folders: Set[str] = {root}
+
+    def progress(phase: str) -> dict:
+        return {
+            "event": "progress",
+            "phase": phase,
+            "entries": budget.entries,
+            "files": len(staged),
+            "bytes": budget.extracted,
+            "archive_bytes": archive_size,
+        }
+
+    # The archive was received before the import started: there is no
+    # receive time to report, only its size
+    record_transfer("upload", archive_size)
+    try:
+        last_report = time.monotonic()
+        for _ in _stage_members(source, root, budget, staged, folders):
+            if time.monotonic() - last_report >= ARCHIVE_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                yield progress("extracting")
+
+        yield progress("storing")
+        _encode_members(db, staged)
+        stored_files = _store_members(db, current_user.id, folders, staged)
+    except BaseException:
+        db.rollback()
+        for member in staged:
+            discard_staged(member.stored)
+        raise
+
+    yield {
+        "event": "done",
+        "message": "Archive extracted successfully!",
+        "folders": len(folders),
+        "files": stored_files,
+        "bytes": budget.extracted,
+    }
+
+
+# Import an archive, answering with the result, or with a stream of progress
+# events (one JSON object per line) ending with the result or an error
+def upload_archive(
+    folder_path: str,
+    archive: UploadFile,
+    db: Session,
+    current_user: CurrentUser,
+    progress: bool = False,
+):
+    events = import_archive(folder_path, archive, db, current_user)
+    if not progress:
+        *_, result = events
+        del result["event"]
+        return result
+
+    def lines() -> Iterator[bytes]:
+        try:
+            for event in events:
+                yield json.dumps(event).encode() + b"\n"
+        except HTTPException as exc:
+            error = {"event": "error", "status": exc.status_code, "detail": exc.detail}
+            yield json.dumps(error).encode() + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
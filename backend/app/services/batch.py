@@ -0,0 +1,204 @@
+import logging
+import os
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.auth.dependencies import CurrentUser
+from app.models import folders as foldersModels
+from app.schemas import folders as schemas
+from app.services.files import list_folder_files
+from app.services.revisions import allocate_revision
+from app.services.trash import trash_file, trash_folder
+from app.utils.pagination import PageRequest, page_limit
+
+logger = logging.getLogger(__name__)
+
+# Largest number of operations accepted in one batch
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", 1000))
+
+# Operations that change data, each run in its own savepoint
+WRITE_OPERATIONS = {"delete_file", "delete_folder", "move_file"}
+
+
+# Live folders of the user by path, fetched once for the whole batch
+class FolderCache:
+    def __init__(self, db: Session, user_id: int, paths: List[str]):
+        self.db = db
+        self.user_id = user_id
+        Folder = foldersModels.Folder
+        self.folders: Dict[str, foldersModels.Folder] = {
+            folder.path: folder
+            for folder in db.query(Folder).filter(
+                Folder.user_id == user_id,
+                Folder.trash_id.is_(None),
+                Folder.path.in_(set(paths)),
+            )
+        }
+
+    def get(self, path: str) -> foldersModels.Folder:
+        folder = self.folders.get(path)
+        if folder is None:
+            raise HTTPException(status_code=404, detail="Folder not found.")
+        return folder
+
+    # Forget a deleted folder and everything below it
+    def discard_subtree(self, path: str):
+        for cached in list(self.folders):
+            if cached == path or cached.startswith(path + "/"):
+                del self.folders[cached]
+
+
+def _get_file(db: Session, folder: foldersModels.Folder, filename: Optional[str]):
+    if not filename:
+        raise HTTPException(status_code=400, detail="Missing filename.")
+    file_record = (
+        db.query(foldersModels.File, foldersModels.Blob)
+        .outerjoin(foldersModels.Blob)
+        .filter(
+            foldersModels.File.folder_id == folder.id,
+            foldersModels.File.trash_id.is_(None),
+            foldersModels.File.filename == filename,
+        )
+        .first()
+    )
+    if not file_record:
+        raise HTTPException(status_code=404, detail="File not found.")
+    return file_record
+
+
+def _delete_file(db, folders, operation):
+    folder = folders.get(operation.folder_path)
+    file, _ = _get_file(db, folder, operation.filename)
+    entry = trash_file(db, folder, file)
+    return 202, {"trash_id": entry.id}
+
+
+def _delete_folder(db, folders, operation):
+    folder = folders.get(operation.folder_path)
+    entry = trash_folder(db, folder)
+    folders.discard_subtree(folder.path)
+    return 202, {"trash_id": entry.id}
+
+
+def _move_file(db, folders, operation):
+    folder = folders.get(operation.folder_path)
+    if not operation.target_folder_path:
+        raise HTTPException(status_code=400, detail="Missing target_folder_path.")
+    target = folders.get(operation.target_folder_path)
+    file, _ = _get_file(db, folder, operation.filename)
+    if target.id == folder.id:
+        return 200, {"filename": file.filename, "revision": file.revision}
+
+    # The file becomes the next revision of its document in the target folder:
+    # "a_v2.txt" is allocated as a revision of "a.txt", not as a new document
+    ext = os.path.splitext(file.filename)[1]
+    allocated = allocate_revision(db, target.id, file.base_name + ext)
+    file.folder_id = target.id
+    file.filename = allocated.filename
+    file.base_name = allocated.base_name
+    file.revision = allocated.revision
+    return 200, {"filename": file.filename, "revision": file.revision}
+
+
+def _stat_file(db, folders, operation):
+    folder = folders.get(operation.folder_path)
+    file, blob = _get_file(db, folder, operation.filename)
+    return 200, {
+        "id": file.id,
+        "filename": file.filename,
+        "revision": file.revision,
+        "uploaded_at": file.uploaded_at,
+        "size": blob.size if blob else None,
+        "sha256": blob.sha256 if blob else None,
+    }
+
+
+def _list_folder(db, folders, operation):
+    folder = folders.get(operation.folder_path)
+    page = PageRequest(
+        limit=page_limit(operation.limit, operation.cursor),
+        cursor=operation.cursor,
+        sort=operation.sort or "name",
+        prefix=operation.prefix,
+        include_total=False,
+    )
+    result = list_folder_files(db, folder, page)
+    return 200, {"files": result.items, "next_cursor": result.next_cursor}
+
+
+OPERATIONS = {
+    "delete_file": _delete_file,
+    "delete_folder": _delete_folder,
+    "move_file": _move_file,
+    "stat_file": _stat_file,
+    "list_folder": _list_folder,
+}
+
+
+def _run_write(db, handler, folders, operation):
+    # Database errors are reported like HTTP ones, once the savepoint is undone
+    try:
+        with db.begin_nested():
+            return handler(db, folders, operation)
+    except IntegrityError:
+        raise HTTPException(
+            status_code=409, detail="Operation conflicts with existing data."
+        )
+    except SQLAlchemyError:
+        logger.exception("Batch operation %s failed", operation.op)
+        raise HTTPException(status_code=500, detail="Operation failed.")
+
+
+# Run a list of operations for one user in a single transaction.
+# A failing operation is reported and rolled back alone; the others still apply.
+def run_batch(batch: schemas.BatchRequest, db: Session, current_user: CurrentUser):
+    if len(batch.operations) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch accepts at most {BATCH_MAX_OPERATIONS} operations.",
+        )
+
+    paths = [operation.folder_path for operation in batch.operations]
+    paths += [
+        operation.target_folder_path
+        for operation in batch.operations
+        if operation.target_folder_path
+    ]
+    folders = FolderCache(db, current_user.id, paths)
+
+    results = []
+    for index, operation in enumerate(batch.operations):
+        handler = OPERATIONS[operation.op]
+        try:
+            if operation.op in WRITE_OPERATIONS:
+                status, result = _run_write(db, handler, folders, operation)
+            else:
+                status, result = handler(db, folders, operation)
+        except HTTPException as exc:
+            results.append(
+                {
+                    "index": index,
+                    "op": operation.op,
+                    "status": exc.status_code,
+                    "detail": exc.detail,
+                }
+            )
+            continue
+        results.append(
+            {"index": index, "op": operation.op, "status": status, "result": result}
+        )
+
+    db.commit()
+    return {"results": results}
+
+
+async def run_batch_async(
+    batch: schemas.BatchRequest, db: AsyncSession, current_user: CurrentUser
+):
+    return await db.run_sync(
+        lambda session: run_batch(batch, session, current_user)
+    )
@@ -1,122 +1,132 @@
 import os
-import mimetypes
+import time
+from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, UploadFile, Request
+from starlette.concurrency import run_in_threadpool
 import logging
-from app.auth.jwt import AuthHandler
-from app.models import users as usersModels
+from app.auth.dependencies import CurrentUser
 from app.models import folders as foldersModels
-from fastapi.responses import FileResponse
+from app.services.previews import ORIGINAL, Preview, render_preview
+from app.services.revisions import allocate_revision
+from app.services.trash import trash_file
+from app.services.storage import (
+    StoredUpload,
+    blob_path,
+    check_blob_files,
+    defers_file_changes,
+    discard_staged,
+    encode_staged,
+    hashes_to_encode,
+    run_sync_service,
+    save_upload,
+    staging_path,
+    store_blob,
+)
+from app.utils.http import (
+    conditional_file_response,
+    content_etag,
+    derived_etag,
+    stat_etag,
+)
+from app.utils.metrics import record_transfer
+from app.utils.pagination import Page, PageRequest, paginate
 
 logger = logging.getLogger(__name__)
-auth_handler = AuthHandler()
 UPLOAD_FOLDER = "uploads"  # Path to store uploaded files
 
 
-# Upload files
-async def upload_user_file(
-    folder_name: str, file: UploadFile, db: Session, request: Request
-):
-    current_user = auth_handler.get_current_user(request)
+# Store staged content as the next revision of a document (not committed)
+def add_file_revision(
+    db: Session, user_id: int, folder_id: int, filename: str, stored: StoredUpload
+) -> foldersModels.File:
+    # Allocating the next revision of the document in the folder
+    allocated = allocate_revision(db, folder_id, filename)
+    blob = store_blob(db, stored)
 
-    # Verifying if the user is authenticated before any other action
-    db_user = (
-        db.query(usersModels.User)
-        .filter(usersModels.User.email == current_user)
-        .first()
+    new_file = foldersModels.File(
+        filename=allocated.filename,
+        base_name=allocated.base_name,
+        file_path=blob_path(blob.sha256),
+        user_id=user_id,
+        folder_id=folder_id,
+        revision=allocated.revision,
+        blob_id=blob.id,
     )
-    if not db_user:
-        raise HTTPException(status_code=401, detail="User not found.")
+    db.add(new_file)
+    return new_file
+
 
+def _get_upload_folder_id(db: Session, folder_name: str, current_user: CurrentUser):
     folder = (
-        db.query(foldersModels.Folder)
+        db.query(foldersModels.Folder.id)
         .filter(
             foldersModels.Folder.path == folder_name,
-            foldersModels.Folder.user_id == db_user.id,
+            foldersModels.Folder.user_id == current_user.id,
+            foldersModels.Folder.trash_id.is_(None),
         )
         .first()
     )
 
     if not folder:
         raise HTTPException(status_code=404, detail="Folder not found.")
+    return folder.id
 
-    # Creating the folder path
-    folder_path_full = os.path.join(UPLOAD_FOLDER, db_user.email, folder.path)
-    os.makedirs(folder_path_full, exist_ok=True)
-
-    base_name, ext = os.path.splitext(file.filename)
 
-    # Verifying if the file already exists
-    existing_files = (
-        db.query(foldersModels.File)
-        .filter(
-            foldersModels.File.folder_id == folder.id,
-            foldersModels.File.filename.like(f"{base_name}_v%"),
-        )
-        .all()
-    )
-
-    # Defining the file name considering the version
-    if existing_files:
-        version_numbers = [
-            int(f.filename.split("_v")[-1].split(".")[0]) for f in existing_files
-        ]
-        new_version = max(version_numbers) + 1
-    else:
-        new_version = 0
-
-    # Defining the file path name
-    new_filename = (
-        f"{base_name}_v{new_version}{ext}" if new_version > 0 else f"{base_name}{ext}"
-    )
-    file_path = os.path.join(folder_path_full, new_filename)
-
-    # Verifying if the file already exists, if so, increment the version
-    while os.path.exists(file_path):
-        new_version += 1
-        new_filename = f"{base_name}_v{new_version}{ext}"
-        file_path = os.path.join(folder_path_full, new_filename)
-
-    with open(file_path, "wb") as buffer:
-        buffer.write(await file.read())
-
-    new_file = foldersModels.File(
-        filename=new_filename,
-        file_path=file_path,
-        user_id=db_user.id,
-        folder_id=folder.id,
-        revision=new_version,
-    )
-    db.add(new_file)
-    db.commit()
+def _store_upload(
+    db: Session, user_id: int, folder_id: int, filename: str, stored: StoredUpload
+):
+    try:
+        new_file = add_file_revision(db, user_id, folder_id, filename, stored)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        if not defers_file_changes(db):
+            discard_staged(stored)
+        raise
     db.refresh(new_file)
 
     return {
         "message": "File uploaded successfully",
-        "file": new_filename,
-        "revision": new_version,
+        "file": new_file.filename,
+        "revision": new_file.revision,
     }
 
 
-# Get files
-def get_files_from_folder(folder_path: str, db: Session, request: Request):
-    current_user = auth_handler.get_current_user(request)
+# Upload files
+async def upload_user_file(
+    folder_name: str, file: UploadFile, db: AsyncSession, current_user: CurrentUser
+):
+    folder_id = await db.run_sync(_get_upload_folder_id, folder_name, current_user)
+
+    # Streaming the upload to disk in chunks before touching the revision counter
+    started = time.perf_counter()
+    stored = await save_upload(file, staging_path())
+    record_transfer("upload", stored.size, time.perf_counter() - started)
+    try:
+        if await db.run_sync(hashes_to_encode, [stored]):
+            stored = await run_in_threadpool(encode_staged, stored)
+        await check_blob_files(db, [stored])
+        return await run_sync_service(
+            db, _store_upload, current_user.id, folder_id, file.filename, stored
+        )
+    except BaseException:
+        await run_in_threadpool(discard_staged, stored)
+        raise
 
-    # Verifying if the user is authenticated before any other action
-    db_user = (
-        db.query(usersModels.User)
-        .filter(usersModels.User.email == current_user)
-        .first()
-    )
-    if not db_user:
-        raise HTTPException(status_code=401, detail="User not found.")
 
+# Get files
+def get_files_from_folder(
+    folder_path: str, db: Session, current_user: CurrentUser, page: PageRequest
+) -> Page:
     # Getting the folder
     folder = (
         db.query(foldersModels.Folder)
         .filter(
             foldersModels.Folder.path == folder_path,
-            foldersModels.Folder.user_id == db_user.id,
+            foldersModels.Folder.user_id == current_user.id,
+            foldersModels.Folder.trash_id.is_(None),
         )
         .first()
     )
@@ -126,46 +136,51 @@ def get_files_from_folder(folder_path: str, db: Session, request: Request):
             status_code=403, detail="You don't have permission to access this folder."
         )
 
-    # Searching for files in the folder
-    files = (
-        db.query(foldersModels.File)
-        .filter(foldersModels.File.folder_id == folder.id)
-        .all()
+    return list_folder_files(db, folder, page)
+
+
+# One page of the live files of a folder
+def list_folder_files(
+    db: Session, folder: foldersModels.Folder, page: PageRequest
+) -> Page:
+    File = foldersModels.File
+    result = paginate(
+        db.query(File).filter(File.folder_id == folder.id, File.trash_id.is_(None)),
+        page,
+        sort_columns={
+            "name": File.filename,
+            "uploaded_at": File.uploaded_at,
+            "revision": File.revision,
+        },
+        id_column=File.id,
+        prefix_column=File.filename,
     )
 
-    return [
-        {
-            "id": file.id,
-            "filename": file.filename,
-            "file_path": file.file_path,
-            "uploaded_at": file.uploaded_at,
-            "revision": file.revision,
-        }
-        for file in files
-    ]
+    return result._replace(
+        items=[
+            {
+                "id": file.id,
+                "filename": file.filename,
+                "file_path": file.file_path,
+                "uploaded_at": file.uploaded_at,
+                "revision": file.revision,
+            }
+            for file in result.items
+        ]
+    )
 
 
 # Delete file
 def delete_file_from_path(
-    folder_path: str, filename: str, db: Session, request: Request
+    folder_path: str, filename: str, db: Session, current_user: CurrentUser
 ):
-    # Verify if the user is authenticated before any other action
-    current_user = auth_handler.get_current_user(request)
-
-    db_user = (
-        db.query(usersModels.User)
-        .filter(usersModels.User.email == current_user)
-        .first()
-    )
-    if not db_user:
-        raise HTTPException(status_code=401, detail="User not found.")
-
     # Verify if the folder exists
     folder = (
         db.query(foldersModels.Folder)
         .filter(
             foldersModels.Folder.path == folder_path,
-            foldersModels.Folder.user_id == db_user.id,
+            foldersModels.Folder.user_id == current_user.id,
+            foldersModels.Folder.trash_id.is_(None),
         )
         .first()
     )
@@ -177,6 +192,7 @@ def delete_file_from_path(
         db.query(foldersModels.File)
         .filter(
             foldersModels.File.folder_id == folder.id,
+            foldersModels.File.trash_id.is_(None),
             foldersModels.File.filename == filename,
         )
         .first()
@@ -184,73 +200,123 @@ def delete_file_from_path(
     if not file_to_delete:
         raise HTTPException(status_code=404, detail="File not found.")
 
-    # Delete the file from the disk
-    file_path = os.path.join("uploads", db_user.email, folder_path, filename)
-    os.remove(file_path)
-
-    # Delete the file from the database
-    db.delete(file_to_delete)
+    # Tombstone the file, the purger releases its content later
+    entry = trash_file(db, folder, file_to_delete)
     db.commit()
 
-    return {"message": f"File '{filename}' successfully deleted!"}
+    return {"message": f"File '{filename}' successfully deleted!", "trash_id": entry.id}
 
 
-# Download file
-def download_file_from_path(folder_path: str, filename: str, db: Session, request):
-    # Verify if the user is authenticated before any other action
-    current_user = auth_handler.get_current_user(request)
-
-    db_user = (
-        db.query(usersModels.User)
-        .filter(usersModels.User.email == current_user)
-        .first()
-    )
-    if not db_user:
-        raise HTTPException(status_code=401, detail="User not found.")
-
+# File record and path of a download, without touching the file
+def _download_record(
+    folder_path: str, filename: str, db: Session, current_user: CurrentUser
+):
     # Verify if the folder exists
     folder = (
         db.query(foldersModels.Folder)
         .filter(
             foldersModels.Folder.path == folder_path,
-            foldersModels.Folder.user_id == db_user.id,
+            foldersModels.Folder.user_id == current_user.id,
+            foldersModels.Folder.trash_id.is_(None),
         )
         .first()
     )
     if not folder:
         raise HTTPException(status_code=404, detail="Folder not found.")
 
-    # Get the file
-    folder_full_path = os.path.join("uploads", db_user.email, folder_path)
-    file_path = os.path.join(folder_full_path, filename)
+    # Get the file, falling back to the per-folder layout of older uploads
+    file_record = (
+        db.query(foldersModels.File, foldersModels.Blob)
+        .outerjoin(foldersModels.Blob)
+        .filter(
+            foldersModels.File.folder_id == folder.id,
+            foldersModels.File.trash_id.is_(None),
+            foldersModels.File.filename == filename,
+        )
+        .first()
+    )
+    if file_record:
+        file, blob = file_record
+        file_path = file.file_path
+    else:
+        file, blob = None, None
+        file_path = os.path.join(
+            UPLOAD_FOLDER, current_user.email, folder_path, filename
+        )
+    return file, blob, file_path
+
 
+def _require_file(file_path: str):
     if not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="File not found.")
 
-    return FileResponse(file_path, filename=filename)
-
 
-# Preview file
-def preview_file_from_path(
-    folder_path: str, filename: str, review: int, db: Session, request
+def _download_response(
+    request: Request,
+    file_path: str,
+    filename: str,
+    file: foldersModels.File | None,
+    blob: foldersModels.Blob | None,
 ):
-    # Verify if the user is authenticated before any other action
-    current_user = auth_handler.get_current_user(request)
+    _require_file(file_path)
+    return _file_response(request, file_path, filename, file, blob)
 
-    db_user = (
-        db.query(usersModels.User)
-        .filter(usersModels.User.email == current_user)
-        .first()
+
+# Download file
+def download_file_from_path(
+    folder_path: str,
+    filename: str,
+    db: Session,
+    current_user: CurrentUser,
+    request: Request,
+):
+    file, blob, file_path = _download_record(folder_path, filename, db, current_user)
+    return _download_response(request, file_path, filename, file, blob)
+
+
+# Build a cacheable, range-aware response for a stored file
+def _file_response(
+    request: Request,
+    file_path: str,
+    filename: str,
+    file: foldersModels.File | None,
+    blob: foldersModels.Blob | None,
+    disposition: str = "attachment",
+    immutable: bool = False,
+):
+    if file is not None and file.uploaded_at is not None:
+        last_modified = file.uploaded_at
+    else:
+        last_modified = datetime.utcfromtimestamp(os.path.getmtime(file_path))
+
+    return conditional_file_response(
+        request,
+        file_path,
+        filename=filename,
+        etag=content_etag(blob.sha256) if blob else stat_etag(file_path),
+        last_modified=last_modified,
+        disposition=disposition,
+        immutable=immutable,
+        encoding=blob.encoding if blob else None,
+        size=blob.size if blob else None,
     )
-    if not db_user:
-        raise HTTPException(status_code=401, detail="User not found.")
 
+
+# File shown by the preview route: the latest or an explicit revision
+def _preview_record(
+    folder_path: str,
+    filename: str,
+    review: int,
+    db: Session,
+    current_user: CurrentUser,
+):
     # Verify if the folder exists
     folder = (
         db.query(foldersModels.Folder)
         .filter(
             foldersModels.Folder.path == folder_path,
-            foldersModels.Folder.user_id == db_user.id,
+            foldersModels.Folder.user_id == current_user.id,
+            foldersModels.Folder.trash_id.is_(None),
         )
         .first()
     )
@@ -259,20 +325,147 @@ def preview_file_from_path(
         raise HTTPException(status_code=404, detail="Folder not found.")
 
     # Get the file
-    file_query = db.query(foldersModels.File).filter(
-        foldersModels.File.folder_id == folder.id,
-        foldersModels.File.filename.like(f"%{filename}%"),
+    file_query = (
+        db.query(foldersModels.File, foldersModels.Blob)
+        .outerjoin(foldersModels.Blob)
+        .filter(
+            foldersModels.File.folder_id == folder.id,
+            foldersModels.File.trash_id.is_(None),
+            foldersModels.File.filename == filename,
+        )
     )
 
     if review is not None:
         file_query = file_query.filter(foldersModels.File.revision == review)
 
     file_record = file_query.first()
-    folder_full_path = os.path.join("uploads", db_user.email, folder_path)
-    file_path = os.path.join(folder_full_path, file_record.filename)
+    if not file_record:
+        raise HTTPException(status_code=404, detail="File not found.")
+    return file_record
 
-    mime_type, _ = mimetypes.guess_type(file_path)
-    if not mime_type:
-        mime_type = "application/octet-stream"
 
-    return FileResponse(file_path, media_type=mime_type)
+# Response for a derived preview, validated by the content it was made from
+def _preview_response(
+    request: Request,
+    file: foldersModels.File,
+    blob: foldersModels.Blob | None,
+    variant: str,
+    preview: Preview,
+    immutable: bool,
+):
+    etag = content_etag(blob.sha256) if blob else stat_etag(file.file_path)
+    if file.uploaded_at is not None:
+        last_modified = file.uploaded_at
+    else:
+        last_modified = datetime.utcfromtimestamp(os.path.getmtime(file.file_path))
+    stem = os.path.splitext(file.filename)[0]
+
+    return conditional_file_response(
+        request,
+        preview.path,
+        filename=f"{stem}.{variant}{preview.extension}",
+        etag=derived_etag(etag, variant),
+        last_modified=last_modified,
+        media_type=preview.media_type,
+        disposition="inline",
+        immutable=immutable,
+    )
+
+
+# The file itself or a derived variant, rendered first if needed (blocking)
+def _preview_file_response(
+    request: Request,
+    file: foldersModels.File,
+    blob: foldersModels.Blob | None,
+    review: int,
+    variant: str | None,
+):
+    _require_file(file.file_path)
+
+    # An explicit revision never changes, so it can be cached for good
+    if variant is None or variant == ORIGINAL:
+        return _file_response(
+            request,
+            file.file_path,
+            file.filename,
+            file,
+            blob,
+            disposition="inline",
+            immutable=review is not None,
+        )
+
+    preview = render_preview(file.file_path, blob, variant, file.filename)
+    return _preview_response(
+        request, file, blob, variant, preview, immutable=review is not None
+    )
+
+
+# Preview file, or a derived variant of it (thumbnail, web, text, page)
+def preview_file_from_path(
+    folder_path: str,
+    filename: str,
+    review: int,
+    db: Session,
+    current_user: CurrentUser,
+    request: Request,
+    variant: str | None = None,
+):
+    file, blob = _preview_record(folder_path, filename, review, db, current_user)
+    return _preview_file_response(request, file, blob, review, variant)
+
+
+# Async services: the same queries, run on an AsyncSession so they await the
+# database driver instead of holding a threadpool worker
+async def get_files_from_folder_async(
+    folder_path: str, db: AsyncSession, current_user: CurrentUser, page: PageRequest
+) -> Page:
+    return await db.run_sync(
+        lambda session: get_files_from_folder(folder_path, session, current_user, page)
+    )
+
+
+async def delete_file_from_path_async(
+    folder_path: str, filename: str, db: AsyncSession, current_user: CurrentUser
+):
+    return await db.run_sync(
+        lambda session: delete_file_from_path(
+            folder_path, filename, session, current_user
+        )
+    )
+
+
+async def download_file_from_path_async(
+    folder_path: str,
+    filename: str,
+    db: AsyncSession,
+    current_user: CurrentUser,
+    request: Request,
+):
+    file, blob, file_path = await db.run_sync(
+        lambda session: _download_record(folder_path, filename, session, current_user)
+    )
+    # Stat calls run in the threadpool, not in the session's greenlet
+    return await run_in_threadpool(
+        _download_response, request, file_path, filename, file, blob
+    )
+
+
+async def preview_file_from_path_async(
+    folder_path: str,
+    filename: str,
+    review: int,
+    db: AsyncSession,
+    current_user: CurrentUser,
+    request: Request,
+    variant: str | None = None,
+):
+    file, blob = await db.run_sync(
+        lambda session: _preview_record(
+            folder_path, filename, review, session, current_user
+        )
+    )
+    # Stat calls and rendering run in the threadpool, not in the session's
+    # greenlet
+    return await run_in_threadpool(
+        _preview_file_response, request, file, blob, review, variant
+    )
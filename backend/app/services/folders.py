@@ -1,201 +1,577 @@
-from fastapi import APIRouter, HTTPException, UploadFile, Request
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from fastapi import APIRouter, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import exists, func
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import os
-import shutil
+import time
 
-from app.models import users as usersModels
 from app.models import folders as foldersModels
-from app.auth.jwt import AuthHandler
+from app.auth.dependencies import CurrentUser
+from app.services.revisions import allocate_revisions
+from app.services.storage import (
+    StoredUpload,
+    blob_path,
+    check_blob_files,
+    defers_file_changes,
+    discard_staged,
+    encode_staged,
+    hashes_to_encode,
+    run_sync_service,
+    staging_path,
+    store_blob,
+    write_stream,
+)
+from app.services.trash import trash_folder
+from app.services.tree import (
+    descendants_filter,
+    ensure_folder,
+    normalize_path,
+    subtree_filter,
+)
+from app.utils.http import content_disposition
+from app.utils.metrics import count_download, record_transfer
+from app.utils.pagination import Page, PageRequest, paginate
+from app.utils.zipstream import ZIP_EPOCH, ZipEntry, stream_zip
 
 router = APIRouter()
 
-# AuthHandler instance
-auth_handler = AuthHandler()
-
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 logger = logging.getLogger(__name__)
 
+# Bounded pool writing file bodies concurrently during batched uploads
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 4))
+_ingest_pool = ThreadPoolExecutor(
+    max_workers=INGEST_WORKERS, thread_name_prefix="ingest"
+)
+
+
+# A staged upload, or the error that kept it from being written
+StagedFile = Tuple[Optional[StoredUpload], Optional[str]]
+
 
 # Create a folder
 def create_folder_service(
-    folder_path: str, current_user: str, db: Session, files: List[UploadFile]
+    folder_path: str,
+    current_user: CurrentUser,
+    db: Session,
+    files: List[UploadFile],
+    staged: Optional[List[StagedFile]] = None,
 ):
-    # Checking the authenticated user in the database
-    db_user = (
-        db.query(usersModels.User)
-        .filter(usersModels.User.email == current_user)
-        .first()
+    folder_path, created, result = _create_folder(
+        folder_path, current_user, db, files, staged
     )
-    if not db_user:
-        raise HTTPException(status_code=401, detail="User not found.")
+    if created:
+        _make_folder_dir(current_user, folder_path)
+    return result
 
-    folder_path = folder_path.strip("/").lower()
+
+# Directory of a new folder under the user's upload directory
+def _make_folder_dir(current_user: CurrentUser, folder_path: str):
+    path = os.path.join(UPLOAD_FOLDER, current_user.email, folder_path)
+    os.makedirs(path, exist_ok=True)
+
+
+# Database part of create_folder_service: the normalized path, whether the
+# folder is new, and the response
+def _create_folder(
+    folder_path: str,
+    current_user: CurrentUser,
+    db: Session,
+    files: List[UploadFile],
+    staged: Optional[List[StagedFile]],
+) -> Tuple[str, bool, dict]:
+    folder_path = normalize_path(folder_path).lower()
+    if not folder_path:
+        raise HTTPException(status_code=400, detail="Invalid folder path.")
 
     # Check if the folder already exists
     existing_folder = (
         db.query(foldersModels.Folder)
         .filter(
             func.lower(foldersModels.Folder.path) == folder_path,
-            foldersModels.Folder.user_id == db_user.id,
+            foldersModels.Folder.user_id == current_user.id,
+            foldersModels.Folder.trash_id.is_(None),
         )
         .first()
     )
 
-    if existing_folder:
-        full_folder_path = os.path.join(
-            UPLOAD_FOLDER, db_user.email, existing_folder.path
-        )
-    else:
-        folder = foldersModels.Folder(path=folder_path, user_id=db_user.id)
-        db.add(folder)
+    folder = existing_folder
+    if not folder:
+        # Missing parent folders are created along with it
+        folder = ensure_folder(db, current_user.id, folder_path)
         db.commit()
         db.refresh(folder)
-        full_folder_path = os.path.join(UPLOAD_FOLDER, db_user.email, folder_path)
-        os.makedirs(full_folder_path, exist_ok=True)
+    created = existing_folder is None
 
-    # Handling file uploads
-    for file in files:
-        base_name, ext = os.path.splitext(file.filename)
-        new_filename = file.filename
+    if not files:
+        return folder_path, created, {"message": "Folder created successfully!"}
 
-        # Check if there is already a file with the same base name
-        existing_files = (
-            db.query(foldersModels.File)
-            .filter(
-                foldersModels.File.folder_id
-                == (existing_folder.id if existing_folder else folder.id),
-                foldersModels.File.filename.like(f"{base_name}%"),
-            )
-            .all()
-        )
+    # Handling file uploads as one batch
+    if staged is None:
+        staged = stage_files(files)
+        staged = encode_files(staged, hashes_to_encode(db, staged_uploads(staged)))
+    results = store_staged_files(db, current_user.id, folder.id, files, staged)
 
-        # If no file with the same base name exists, use the original name
-        if not existing_files:
-            new_filename = f"{base_name}{ext}"
-            new_version = 0  # First file, no version suffix
-        else:
-            # If a file with the same base name exists, check if it's the first or if there are already versions
-            if any(f.filename.startswith(f"{base_name}_v") for f in existing_files):
-                version_numbers = [
-                    int(f.filename.split("_v")[-1].split(".")[0])
-                    for f in existing_files
-                    if f.filename.startswith(f"{base_name}_v")
-                ]
-                new_version = max(version_numbers) + 1
-            else:
-                # If there are no versions with _v suffix, start with _v1
-                new_version = 1
-
-            new_filename = f"{base_name}_v{new_version}{ext}"
-
-        # Check if the file already exists physically
-        file_path = os.path.join(full_folder_path, new_filename)
-        while os.path.exists(file_path):
-            new_version += 1
-            new_filename = f"{base_name}_v{new_version}{ext}"
-            file_path = os.path.join(full_folder_path, new_filename)
-
-        # Saving the file physically
-        with open(file_path, "wb") as f:
-            f.write(file.file.read())
-
-        # Save file details in the database
-        new_file = foldersModels.File(
-            filename=new_filename,
-            file_path=file_path,
-            folder_id=existing_folder.id if existing_folder else folder.id,
-            user_id=db_user.id,
-            revision=new_version,  # Storing the revision number
-        )
-        db.add(new_file)
-        db.commit()
+    return (
+        folder_path,
+        created,
+        {"message": "Files uploaded successfully!", "files": results},
+    )
 
-    return {
-        "message": "Folder created successfully!"
-        if not files
-        else "Files uploaded successfully!"
-    }
 
+# Stage one upload on disk, reporting write errors instead of raising
+def _stage_file(file: UploadFile) -> StagedFile:
+    started = time.perf_counter()
+    try:
+        stored = write_stream(file.file, staging_path())
+        record_transfer("upload", stored.size, time.perf_counter() - started)
+    except OSError as exc:
+        logger.error("Failed to store %s: %s", file.filename, exc)
+        return None, "Failed to store file."
+    return stored, None
 
-# List folders
-def get_user_folders(db: Session, request: Request):
-    # Get the authenticated user
-    current_user = auth_handler.get_current_user(request)
-    db_user = (
-        db.query(usersModels.User)
-        .filter(usersModels.User.email == current_user)
-        .first()
-    )
 
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found.")
+# Compress one staged upload; it is stored as is if that fails
+def _encode_file(stored: StoredUpload) -> StoredUpload:
+    try:
+        return encode_staged(stored)
+    except OSError as exc:
+        logger.error("Failed to compress %s: %s", stored.path, exc)
+        return stored
 
-    # Fetch user folders from the database
-    folders = (
-        db.query(foldersModels.Folder)
-        .filter(foldersModels.Folder.user_id == db_user.id)
-        .all()
-    )
 
-    # Return the formatted list
-    return [
-        {"id": folder.id, "path": folder.path, "name": folder.path.split("/")[-1]}
-        for folder in folders
+# Save a batch of uploads physically, streamed in chunks through the worker pool
+def stage_files(files: List[UploadFile]) -> List[StagedFile]:
+    return list(_ingest_pool.map(_stage_file, files))
+
+
+def staged_uploads(staged: List[StagedFile]) -> List[StoredUpload]:
+    return [stored for stored, _ in staged if stored]
+
+
+# Remove the staged uploads of a batch that failed (blocking)
+def discard_accepted(staged: List[StagedFile]):
+    for stored in staged_uploads(staged):
+        discard_staged(stored)
+
+
+# Compress the staged uploads with new content through the worker pool, each
+# distinct content once (see hashes_to_encode)
+def encode_files(staged: List[StagedFile], hashes: Set[str]) -> List[StagedFile]:
+    pending = set(hashes)
+    indexes = []
+    for index, (stored, _) in enumerate(staged):
+        if stored and stored.sha256 in pending:
+            pending.discard(stored.sha256)
+            indexes.append(index)
+
+    encoded = list(staged)
+    uploads = [staged[index][0] for index in indexes]
+    for index, stored in zip(indexes, _ingest_pool.map(_encode_file, uploads)):
+        encoded[index] = (stored, None)
+    return encoded
+
+
+# Store a batch of uploads in a folder with a single transaction
+def ingest_files(db: Session, user_id: int, folder_id: int, files: List[UploadFile]):
+    staged = stage_files(files)
+    staged = encode_files(staged, hashes_to_encode(db, staged_uploads(staged)))
+    return store_staged_files(db, user_id, folder_id, files, staged)
+
+
+# Link staged uploads to the folder as new revisions with a single transaction
+def store_staged_files(
+    db: Session,
+    user_id: int,
+    folder_id: int,
+    files: List[UploadFile],
+    staged: List[StagedFile],
+):
+    accepted = [
+        (file, stored) for file, (stored, error) in zip(files, staged) if stored
     ]
 
+    try:
+        # Allocate every revision of the batch at once
+        allocated = allocate_revisions(
+            db, folder_id, [file.filename for file, _ in accepted]
+        )
 
-# Delete folder
-def delete_folder_from_path(folder_path: str, db: Session, request: Request):
-    # Check if the user is authenticated
-    current_user = auth_handler.get_current_user(request)
+        new_files = []
+        for (file, stored), revision in zip(accepted, allocated):
+            blob = store_blob(db, stored)
+            new_files.append(
+                foldersModels.File(
+                    filename=revision.filename,
+                    base_name=revision.base_name,
+                    file_path=blob_path(blob.sha256),
+                    folder_id=folder_id,
+                    user_id=user_id,
+                    revision=revision.revision,  # Storing the revision number
+                    blob_id=blob.id,
+                )
+            )
 
-    db_user = (
-        db.query(usersModels.User)
-        .filter(usersModels.User.email == current_user)
-        .first()
+        # Save file details in the database with one bulk insert
+        db.add_all(new_files)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        if not defers_file_changes(db):
+            discard_accepted(staged)
+        raise
+
+    stored_as = iter(zip(accepted, new_files))
+    results = []
+    for file, (stored, error) in zip(files, staged):
+        if error:
+            results.append(
+                {"filename": file.filename, "status": "error", "detail": error}
+            )
+            continue
+        (_, stored), new_file = next(stored_as)
+        results.append(
+            {
+                "filename": file.filename,
+                "status": "stored",
+                "stored_as": new_file.filename,
+                "revision": new_file.revision,
+                "size": stored.size,
+            }
+        )
+    return results
+
+
+# List folders
+def get_user_folders(db: Session, current_user: CurrentUser, page: PageRequest) -> Page:
+    # Fetch one page of user folders from the database
+    Folder = foldersModels.Folder
+    result = paginate(
+        db.query(Folder).filter(
+            Folder.user_id == current_user.id, Folder.trash_id.is_(None)
+        ),
+        page,
+        sort_columns={"name": Folder.path},
+        id_column=Folder.id,
+        prefix_column=Folder.path,
     )
-    if not db_user:
-        raise HTTPException(status_code=401, detail="User not found.")
 
-    # Check if the folder exists
+    # Return the formatted list
+    return result._replace(
+        items=[
+            {
+                "id": folder.id,
+                "path": folder.path,
+                "name": folder.path.split("/")[-1],
+                "parent_id": folder.parent_id,
+            }
+            for folder in result.items
+        ]
+    )
+
+
+def _get_folder(db: Session, current_user: CurrentUser, folder_path: str):
     folder = (
         db.query(foldersModels.Folder)
         .filter(
             foldersModels.Folder.path == folder_path,
-            foldersModels.Folder.user_id == db_user.id,
+            foldersModels.Folder.user_id == current_user.id,
+            foldersModels.Folder.trash_id.is_(None),
         )
         .first()
     )
-
     if not folder:
         raise HTTPException(status_code=404, detail="Folder not found.")
+    return folder
+
+
+# List the immediate children of a folder (or of the root) with their counts
+def get_folder_children(
+    folder_path: str, db: Session, current_user: CurrentUser, page: PageRequest
+) -> Page:
+    Folder = foldersModels.Folder
+    File = foldersModels.File
+
+    folder_path = normalize_path(folder_path)
+    query = db.query(Folder).filter(
+        Folder.user_id == current_user.id, Folder.trash_id.is_(None)
+    )
+    if folder_path:
+        parent = _get_folder(db, current_user, folder_path)
+        query = query.filter(Folder.parent_id == parent.id)
+        if page.prefix:
+            page = page._replace(prefix=f"{folder_path}/{page.prefix}")
+    else:
+        query = query.filter(Folder.parent_id.is_(None))
 
-    # Delete the files inside the folder
-    files = (
-        db.query(foldersModels.File)
-        .filter(foldersModels.File.folder_id == folder.id)
-        .all()
+    result = paginate(
+        query,
+        page,
+        sort_columns={"name": Folder.path},
+        id_column=Folder.id,
+        prefix_column=Folder.path,
     )
-    for file in files:
-        if os.path.exists(file.file_path):  # Prevents error if the file does not exist
-            os.remove(file.file_path)
-        db.delete(file)
 
-    # Remove the folder from the database
-    db.delete(folder)
-    db.commit()
+    # Counts for the page only, each an indexed lookup per child
+    child_ids = [child.id for child in result.items]
+    folder_counts = dict(
+        db.query(Folder.parent_id, func.count(Folder.id))
+        .filter(
+            Folder.user_id == current_user.id,
+            Folder.trash_id.is_(None),
+            Folder.parent_id.in_(child_ids),
+        )
+        .group_by(Folder.parent_id)
+    )
+    file_counts = dict(
+        db.query(File.folder_id, func.count(File.id))
+        .filter(File.folder_id.in_(child_ids), File.trash_id.is_(None))
+        .group_by(File.folder_id)
+    )
+
+    return result._replace(
+        items=[
+            {
+                "id": child.id,
+                "path": child.path,
+                "name": child.path.split("/")[-1],
+                "folder_count": folder_counts.get(child.id, 0),
+                "file_count": file_counts.get(child.id, 0),
+            }
+            for child in result.items
+        ]
+    )
+
+
+# Number of folders, files and bytes stored in a folder and its descendants
+def get_folder_size(folder_path: str, db: Session, current_user: CurrentUser):
+    Folder = foldersModels.Folder
+    File = foldersModels.File
 
-    # Remove the folder from the file system
-    folder_full_path = os.path.join(
-        "uploads", db_user.email, os.path.normpath(folder_path)
+    folder_path = normalize_path(folder_path)
+    folder = _get_folder(db, current_user, folder_path)
+
+    folder_count = (
+        db.query(func.count(Folder.id))
+        .filter(
+            Folder.user_id == current_user.id,
+            Folder.trash_id.is_(None),
+            *descendants_filter(folder_path),
+        )
+        .scalar()
+    )
+    subtree = db.query(Folder.id).filter(
+        Folder.user_id == current_user.id,
+        Folder.trash_id.is_(None),
+        subtree_filter(folder_path),
+    )
+    file_count, total_bytes = (
+        db.query(
+            func.count(File.id), func.coalesce(func.sum(foldersModels.Blob.size), 0)
+        )
+        .outerjoin(foldersModels.Blob)
+        .filter(
+            File.folder_id.in_(subtree.scalar_subquery()), File.trash_id.is_(None)
+        )
+        .one()
     )
-    if os.path.exists(folder_full_path):
-        shutil.rmtree(folder_full_path)  # Removes the folder and all its contents
 
     return {
-        "message": f"Folder '{folder_path}' and its files were successfully deleted!"
+        "path": folder.path,
+        "folders": folder_count,
+        "files": file_count,
+        "bytes": total_bytes,
     }
+
+
+# Delete folder
+def delete_folder_from_path(
+    folder_path: str, db: Session, current_user: CurrentUser
+):
+    # Check if the folder exists
+    folder = _get_folder(db, current_user, folder_path)
+
+    # Tombstone the folder and its subtree, the purger removes the content later
+    entry = trash_folder(db, folder)
+    db.commit()
+
+    return {
+        "message": f"Folder '{folder_path}' and its files were successfully deleted!",
+        "trash_id": entry.id,
+    }
+
+
+# Archive entries of a folder listing; files gone from disk are left out
+def _archive_entries(
+    subfolders: List[str], files: Dict[str, list], root: str
+) -> Iterator[ZipEntry]:
+    def relative(path: str) -> str:
+        return path[len(root) + 1 :] if root else path
+
+    for path in [root] + subfolders:
+        if path != root:
+            yield ZipEntry(relative(path), None, 0, ZIP_EPOCH)
+        for filename, file_path, uploaded_at, size, encoding in files.get(path, []):
+            if not os.path.isfile(file_path):
+                logger.warning("Skipping %s in archive: file is missing", file_path)
+                continue
+            yield ZipEntry(
+                "/".join(filter(None, [relative(path), filename])),
+                file_path,
+                size if size is not None else os.path.getsize(file_path),
+                uploaded_at or ZIP_EPOCH,
+                encoding,
+            )
+
+
+# Download a folder as a ZIP archive, built while it is sent. Only the listing
+# is read here; file contents are read chunk by chunk as the response streams.
+def download_folder_archive(
+    folder_path: str,
+    db: Session,
+    current_user: CurrentUser,
+    recursive: bool = False,
+    latest_only: bool = False,
+):
+    Folder = foldersModels.Folder
+    File = foldersModels.File
+    Blob = foldersModels.Blob
+
+    folder_path = normalize_path(folder_path)
+    folder = _get_folder(db, current_user, folder_path)
+
+    subfolders = []
+    in_scope = Folder.id == folder.id
+    if recursive:
+        in_scope = subtree_filter(folder_path)
+        subfolders = [
+            path
+            for (path,) in db.query(Folder.path)
+            .filter(
+                Folder.user_id == current_user.id,
+                Folder.trash_id.is_(None),
+                *descendants_filter(folder_path),
+            )
+            .order_by(Folder.path)
+        ]
+
+    query = (
+        db.query(
+            Folder.path,
+            File.filename,
+            File.file_path,
+            File.uploaded_at,
+            Blob.size,
+            Blob.encoding,
+        )
+        .join(Folder, File.folder_id == Folder.id)
+        .outerjoin(Blob)
+        .filter(
+            Folder.user_id == current_user.id,
+            Folder.trash_id.is_(None),
+            in_scope,
+            File.trash_id.is_(None),
+        )
+        .order_by(Folder.path, File.filename)
+    )
+    if latest_only:
+        # No newer live revision of the same document in the same folder
+        newer = aliased(File)
+        query = query.filter(
+            ~exists().where(
+                newer.folder_id == File.folder_id,
+                newer.base_name == File.base_name,
+                newer.revision > File.revision,
+                newer.trash_id.is_(None),
+            )
+        )
+
+    files: Dict[str, list] = {}
+    for path, *row in query:
+        files.setdefault(path, []).append(row)
+
+    name = folder_path.rpartition("/")[2] + ".zip"
+    return StreamingResponse(
+        count_download(stream_zip(_archive_entries(subfolders, files, folder_path))),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition("attachment", name)},
+    )
+
+
+# Async services: the same queries, run on an AsyncSession so they await the
+# database driver instead of holding a threadpool worker
+async def create_folder_service_async(
+    folder_path: str,
+    current_user: CurrentUser,
+    db: AsyncSession,
+    files: List[UploadFile],
+):
+    # Files are written to disk first, outside of the database session
+    staged = await run_in_threadpool(stage_files, files) if files else []
+    try:
+        hashes = await db.run_sync(hashes_to_encode, staged_uploads(staged))
+        staged = await run_in_threadpool(encode_files, staged, hashes)
+        await check_blob_files(db, staged_uploads(staged))
+        folder_path, created, result = await run_sync_service(
+            db,
+            lambda session: _create_folder(
+                folder_path, current_user, session, files, staged
+            ),
+        )
+    except BaseException:
+        await run_in_threadpool(discard_accepted, staged)
+        raise
+
+    if created:
+        await run_in_threadpool(_make_folder_dir, current_user, folder_path)
+    return result
+
+
+async def get_user_folders_async(
+    db: AsyncSession, current_user: CurrentUser, page: PageRequest
+) -> Page:
+    return await db.run_sync(get_user_folders, current_user, page)
+
+
+async def get_folder_children_async(
+    folder_path: str, db: AsyncSession, current_user: CurrentUser, page: PageRequest
+) -> Page:
+    return await db.run_sync(
+        lambda session: get_folder_children(folder_path, session, current_user, page)
+    )
+
+
+async def get_folder_size_async(
+    folder_path: str, db: AsyncSession, current_user: CurrentUser
+):
+    return await db.run_sync(
+        lambda session: get_folder_size(folder_path, session, current_user)
+    )
+
+
+async def delete_folder_from_path_async(
+    folder_path: str, db: AsyncSession, current_user: CurrentUser
+):
+    return await db.run_sync(
+        lambda session: delete_folder_from_path(folder_path, session, current_user)
+    )
+
+
+async def download_folder_archive_async(
+    folder_path: str,
+    db: AsyncSession,
+    current_user: CurrentUser,
+    recursive: bool = False,
+    latest_only: bool = False,
+):
+    return await db.run_sync(
+        lambda session: download_folder_archive(
+            folder_path, session, current_user, recursive, latest_only
+        )
+    )
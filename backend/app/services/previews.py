@@ -0,0 +1,323 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+from typing import Dict, NamedTuple, Optional
+
+from fastapi import HTTPException
+
+from app.models import folders as foldersModels
+from app.services.storage import UPLOAD_FOLDER
+from app.utils.codec import open_decoded
+
+# Pillow and PyMuPDF are optional: without them, image and PDF previews are
+# answered with 501 and the original file stays available.
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - depends on the installation
+    Image = ImageOps = None
+
+try:
+    import pymupdf
+except ImportError:  # pragma: no cover - depends on the installation
+    pymupdf = None
+
+# Derived previews are cached under PREVIEW_FOLDER, keyed by content hash,
+# variant and media type. Least recently served previews are evicted beyond
+# the budget.
+PREVIEW_FOLDER = os.path.join(UPLOAD_FOLDER, ".previews")
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv("PREVIEW_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Eviction stops once the cache is back under this share of the budget, so
+# the directory is not rescanned on every new preview
+PREVIEW_CACHE_LOW_WATER = 0.9
+
+# Bytes of a text file shown by the "text" variant
+PREVIEW_TEXT_BYTES = int(os.getenv("PREVIEW_TEXT_BYTES", 64 * 1024))
+
+# Longest side, in pixels, of the "thumbnail" and "web" renditions
+PREVIEW_THUMBNAIL_SIZE = int(os.getenv("PREVIEW_THUMBNAIL_SIZE", 256))
+PREVIEW_WEB_SIZE = int(os.getenv("PREVIEW_WEB_SIZE", 1600))
+
+ORIGINAL = "original"
+THUMBNAIL = "thumbnail"
+WEB = "web"
+TEXT = "text"
+PAGE = "page"
+VARIANTS = (ORIGINAL, THUMBNAIL, WEB, TEXT, PAGE)
+
+JPEG_QUALITY = 85
+
+# Types shown as text besides text/*
+TEXT_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/x-sh",
+    "application/x-yaml",
+    "application/sql",
+}
+TEXT_EXTENSIONS = {".log", ".md", ".yaml", ".yml", ".toml", ".ini", ".cfg", ".conf"}
+
+PREVIEW_MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".png": "image/png",
+    ".txt": "text/plain; charset=utf-8",
+}
+
+
+class Preview(NamedTuple):
+    path: str
+    media_type: str
+    extension: str
+
+
+# Previews being generated, so concurrent requests wait for the same render
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+# Bytes in the cache as seen by this process; None until the first scan
+_cache_bytes: Optional[int] = None
+_cache_lock = threading.Lock()
+
+
+# Cache key of a file: its content hash, or its path and stat for legacy files
+def preview_key(source_path: str, blob: Optional[foldersModels.Blob]) -> str:
+    if blob is not None:
+        return blob.sha256
+    stat = os.stat(source_path)
+    legacy = f"{source_path}:{stat.st_mtime_ns}:{stat.st_size}"
+    return hashlib.sha256(legacy.encode()).hexdigest()
+
+
+# The same content renders differently, or not at all, under another type
+def _cache_base(key: str, variant: str, media_type: str) -> str:
+    kind = media_type.replace("/", "-")
+    return os.path.join(PREVIEW_FOLDER, key[:2], f"{key}.{variant}.{kind}")
+
+
+# Unregistered text extensions (.log, .conf, ...) count as text/plain
+def _media_type(filename: str) -> str:
+    media_type = mimetypes.guess_type(filename)[0]
+    if media_type is None and os.path.splitext(filename)[1].lower() in TEXT_EXTENSIONS:
+        return "text/plain"
+    return media_type or "application/octet-stream"
+
+
+def _is_text(filename: str) -> bool:
+    media_type = _media_type(filename)
+    return (
+        media_type.startswith("text/")
+        or media_type in TEXT_TYPES
+        or os.path.splitext(filename)[1].lower() in TEXT_EXTENSIONS
+    )
+
+
+# A cached preview, marked as recently used
+def _cached(cache_base: str) -> Optional[Preview]:
+    for extension, media_type in PREVIEW_MEDIA_TYPES.items():
+        path = cache_base + extension
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            continue
+        return Preview(path, media_type, extension)
+    return None
+
+
+def _unsupported(variant: str):
+    return HTTPException(
+        status_code=415, detail=f"No {variant} preview for this file type."
+    )
+
+
+def _unavailable(kind: str):
+    return HTTPException(
+        status_code=501, detail=f"{kind} previews are not available on this server."
+    )
+
+
+# First PREVIEW_TEXT_BYTES of a text file, cut at a line end
+def _render_text(source, out_path: str):
+    with source as f:
+        head = f.read(PREVIEW_TEXT_BYTES)
+        truncated = bool(f.read(1))
+    if truncated and b"\n" in head:
+        head = head[: head.rindex(b"\n") + 1]
+    # A multi-byte character cut at the end is replaced, not an error
+    with open(out_path, "wb") as out:
+        out.write(head.decode("utf-8", errors="replace").encode("utf-8"))
+
+
+# Downscale an image; JPEG sources are decoded at reduced size to begin with
+def _render_image(source, out_path: str, size: int) -> str:
+    try:
+        with source, Image.open(source) as image:
+            image.draft("RGB", (size, size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size))
+            if "A" in image.getbands() or "transparency" in image.info:
+                image.convert("RGBA").save(out_path, "PNG", optimize=True)
+                return ".png"
+            image.convert("RGB").save(
+                out_path, "JPEG", quality=JPEG_QUALITY, optimize=True
+            )
+            return ".jpg"
+    except (OSError, Image.DecompressionBombError):
+        raise HTTPException(
+            status_code=415, detail="Could not render a preview of this file."
+        )
+
+
+# Render the first page of a PDF at web size
+def _render_pdf_page(source, out_path: str) -> str:
+    try:
+        with source, pymupdf.open(stream=source.read(), filetype="pdf") as document:
+            page = document.load_page(0)
+            zoom = PREVIEW_WEB_SIZE / max(page.rect.width, page.rect.height)
+            pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom))
+            pixmap.save(out_path, output="png")
+            return ".png"
+    except (RuntimeError, ValueError):
+        raise HTTPException(
+            status_code=415, detail="Could not render a preview of this file."
+        )
+
+
+# Render a variant to a temporary file and return its extension. Sources are
+# opened through their storage encoding, so compressed blobs are decoded.
+def _render(
+    source_path: str,
+    encoding: Optional[str],
+    out_path: str,
+    variant: str,
+    filename: str,
+) -> str:
+    media_type = _media_type(filename)
+
+    if variant == TEXT:
+        if not _is_text(filename):
+            raise _unsupported(variant)
+        _render_text(open_decoded(source_path, encoding), out_path)
+        return ".txt"
+
+    if media_type == "application/pdf" and variant == PAGE:
+        if pymupdf is None:
+            raise _unavailable("PDF")
+        return _render_pdf_page(open_decoded(source_path, encoding), out_path)
+
+    if media_type.startswith("image/"):
+        if Image is None:
+            raise _unavailable("Image")
+        size = PREVIEW_THUMBNAIL_SIZE if variant == THUMBNAIL else PREVIEW_WEB_SIZE
+        return _render_image(open_decoded(source_path, encoding), out_path, size)
+
+    raise _unsupported(variant)
+
+
+def _generate(
+    source_path: str,
+    encoding: Optional[str],
+    cache_base: str,
+    variant: str,
+    filename: str,
+):
+    cache_dir = os.path.dirname(cache_base)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".preview-", suffix=".part")
+    os.close(fd)
+    try:
+        extension = _render(source_path, encoding, tmp_path, variant, filename)
+        path = cache_base + extension
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    _account(os.path.getsize(path))
+    return Preview(path, PREVIEW_MEDIA_TYPES[extension], extension)
+
+
+def _scan_cache() -> list:
+    entries = []
+    for root, _, names in os.walk(PREVIEW_FOLDER):
+        for name in names:
+            if name.startswith("."):
+                continue
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+    return entries
+
+
+# Add a new preview to the cache size, evicting the least recently used ones
+# once over budget. Other workers share the directory, so eviction rescans it.
+def _account(size: int):
+    global _cache_bytes
+    with _cache_lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(entry[1] for entry in _scan_cache())
+        else:
+            _cache_bytes += size
+        if _cache_bytes <= PREVIEW_CACHE_MAX_BYTES:
+            return
+
+        entries = sorted(_scan_cache())
+        total = sum(entry[1] for entry in entries)
+        target = PREVIEW_CACHE_MAX_BYTES * PREVIEW_CACHE_LOW_WATER
+        for _, entry_size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= entry_size
+        _cache_bytes = total
+
+
+# Return a cached preview, rendering it first if needed (blocking). Requests
+# for a preview that is being rendered wait for that render instead of
+# starting their own.
+def render_preview(
+    source_path: str,
+    blob: Optional[foldersModels.Blob],
+    variant: str,
+    filename: str,
+) -> Preview:
+    if variant not in VARIANTS or variant == ORIGINAL:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown preview variant '{variant}'."
+        )
+
+    key = preview_key(source_path, blob)
+    cache_base = _cache_base(key, variant, _media_type(filename))
+    preview = _cached(cache_base)
+    if preview is not None:
+        return preview
+
+    with _inflight_lock:
+        future = _inflight.get(cache_base)
+        owner = future is None
+        if owner:
+            future = _inflight[cache_base] = Future()
+    if not owner:
+        return future.result()
+
+    try:
+        encoding = blob.encoding if blob is not None else None
+        preview = _cached(cache_base) or _generate(
+            source_path, encoding, cache_base, variant, filename
+        )
+        future.set_result(preview)
+        return preview
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[cache_base]
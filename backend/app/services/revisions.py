@@ -0,0 +1,187 @@
+import os
+from collections import Counter as Tally
+from typing import Dict, List, NamedTuple
+
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import folders as foldersModels
+
+
+class AllocatedRevision(NamedTuple):
+    filename: str
+    base_name: str
+    revision: int
+
+
+# File name of a revision: the original name first, then "<base>_v<n><ext>"
+def revision_filename(base_name: str, ext: str, revision: int) -> str:
+    if revision == 0:
+        return f"{base_name}{ext}"
+    return f"{base_name}_v{revision}{ext}"
+
+
+# Seed a new counter from revisions stored before counters existed
+def _seed_revision(db: Session, folder_id: int, base_name: str) -> int:
+    latest = (
+        db.query(func.max(foldersModels.File.revision))
+        .filter(
+            foldersModels.File.folder_id == folder_id,
+            foldersModels.File.base_name == base_name,
+        )
+        .scalar()
+    )
+    return 0 if latest is None else latest + 1
+
+
+# Atomically take the next revision number of a document in a folder
+def next_revision(db: Session, folder_id: int, base_name: str) -> int:
+    Counter = foldersModels.RevisionCounter
+
+    while True:
+        # A single indexed row update; the row lock serializes concurrent uploads
+        statement = (
+            update(Counter)
+            .where(Counter.folder_id == folder_id, Counter.base_name == base_name)
+            .values(last_revision=Counter.last_revision + 1)
+        )
+        if db.get_bind().dialect.update_returning:
+            revision = db.execute(statement.returning(Counter.last_revision)).scalar()
+        else:
+            revision = None
+            if db.execute(statement).rowcount:
+                revision = (
+                    db.query(Counter.last_revision)
+                    .filter(
+                        Counter.folder_id == folder_id, Counter.base_name == base_name
+                    )
+                    .scalar()
+                )
+        if revision is not None:
+            return revision
+
+        # First revision of this document: a concurrent upload may create it first
+        revision = _seed_revision(db, folder_id, base_name)
+        try:
+            with db.begin_nested():
+                db.add(
+                    Counter(
+                        folder_id=folder_id,
+                        base_name=base_name,
+                        last_revision=revision,
+                    )
+                )
+        except IntegrityError:
+            continue
+        return revision
+
+
+# Allocate the revision and stored file name for an uploaded file name
+def allocate_revision(db: Session, folder_id: int, filename: str) -> AllocatedRevision:
+    base_name, ext = os.path.splitext(filename)
+
+    while True:
+        revision = next_revision(db, folder_id, base_name)
+        new_filename = revision_filename(base_name, ext, revision)
+
+        # Another document may already use this name (e.g. an upload named "a_v1")
+        taken = (
+            db.query(foldersModels.File.id)
+            .filter(
+                foldersModels.File.folder_id == folder_id,
+                foldersModels.File.filename == new_filename,
+            )
+            .first()
+        )
+        if not taken:
+            return AllocatedRevision(new_filename, base_name, revision)
+
+
+# Allocate revisions for a batch of uploaded file names with a fixed number of
+# queries, whatever the batch size
+def allocate_revisions(
+    db: Session, folder_id: int, filenames: List[str]
+) -> List[AllocatedRevision]:
+    Counter = foldersModels.RevisionCounter
+    File = foldersModels.File
+
+    split_names = [os.path.splitext(filename) for filename in filenames]
+    counts = Tally(base_name for base_name, _ in split_names)
+    if not counts:
+        return []
+
+    # Reserve a contiguous block of revisions for every document in the batch
+    counters = Counter.__table__
+    db.execute(
+        update(counters)
+        .where(
+            counters.c.folder_id == folder_id,
+            counters.c.base_name == bindparam("b_base_name"),
+        )
+        .values(last_revision=counters.c.last_revision + bindparam("b_count")),
+        [{"b_base_name": base, "b_count": count} for base, count in counts.items()],
+    )
+    last_revisions: Dict[str, int] = dict(
+        db.query(Counter.base_name, Counter.last_revision).filter(
+            Counter.folder_id == folder_id, Counter.base_name.in_(list(counts))
+        )
+    )
+
+    # Documents seen for the first time get a counter seeded from stored files
+    missing = [base for base in counts if base not in last_revisions]
+    if missing:
+        latest = dict(
+            db.query(File.base_name, func.max(File.revision))
+            .filter(File.folder_id == folder_id, File.base_name.in_(missing))
+            .group_by(File.base_name)
+        )
+        new_counters = {
+            base: (latest[base] + 1 if base in latest else 0) + counts[base] - 1
+            for base in missing
+        }
+        try:
+            with db.begin_nested():
+                db.add_all(
+                    Counter(folder_id=folder_id, base_name=base, last_revision=last)
+                    for base, last in new_counters.items()
+                )
+        except IntegrityError:
+            # A concurrent upload created one of the counters: fall back to
+            # allocating these documents one revision at a time
+            for base in missing:
+                revisions = [
+                    next_revision(db, folder_id, base) for _ in range(counts[base])
+                ]
+                new_counters[base] = revisions[-1]
+        last_revisions.update(new_counters)
+
+    # Hand out each document's block in upload order
+    next_in_block = {
+        base: last_revisions[base] - count + 1 for base, count in counts.items()
+    }
+    allocated = []
+    for base_name, ext in split_names:
+        revision = next_in_block[base_name]
+        next_in_block[base_name] += 1
+        allocated.append(
+            AllocatedRevision(
+                revision_filename(base_name, ext, revision), base_name, revision
+            )
+        )
+
+    # Names already used by another document are reallocated one by one
+    taken = {
+        filename
+        for (filename,) in db.query(File.filename).filter(
+            File.folder_id == folder_id,
+            File.filename.in_([item.filename for item in allocated]),
+        )
+    }
+    batch = []
+    for index, item in enumerate(allocated):
+        while item.filename in taken:
+            item = allocate_revision(db, folder_id, filenames[index])
+        taken.add(item.filename)
+        batch.append(item)
+    return batch
@@ -0,0 +1,154 @@
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import DateTime, Integer, String, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.auth.dependencies import CurrentUser
+from app.models import folders as foldersModels
+from app.utils.pagination import Page, decode_cursor, encode_cursor
+
+# The trigram index only matches terms of at least this many characters
+MIN_INDEXED_QUERY = 3
+
+SEARCH_SQL = text(
+    """
+    SELECT files.id, files.filename, files.revision, files.uploaded_at,
+           folders.path AS folder_path
+    FROM files_fts
+    JOIN files ON files.id = files_fts.rowid
+    LEFT JOIN folders ON folders.id = files.folder_id
+    WHERE files_fts MATCH :match AND files.user_id = :user_id
+      AND files.trash_id IS NULL AND folders.trash_id IS NULL
+    ORDER BY files_fts.rank, files.id
+    LIMIT :limit OFFSET :offset
+    """
+).columns(
+    id=Integer,
+    filename=String,
+    revision=Integer,
+    uploaded_at=DateTime,
+    folder_path=String,
+)
+
+COUNT_SQL = text(
+    """
+    SELECT count(*) FROM files_fts
+    JOIN files ON files.id = files_fts.rowid
+    LEFT JOIN folders ON folders.id = files.folder_id
+    WHERE files_fts MATCH :match AND files.user_id = :user_id
+      AND files.trash_id IS NULL AND folders.trash_id IS NULL
+    """
+)
+
+
+def _phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+# FTS5 query matching the term inside file names of one user
+def _match_expression(query: str, user_id: int) -> str:
+    return f"filename : {_phrase(query)} AND owner : {_phrase(f'<{user_id}>')}"
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# Search file names across all of the user's folders, best matches first
+def search_files(
+    query: str,
+    limit: int,
+    cursor: Optional[str],
+    include_total: bool,
+    db: Session,
+    current_user: CurrentUser,
+) -> Page:
+    query = query.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="Search query is empty.")
+
+    # Hits are ranked, so the cursor holds the offset of the next page and is
+    # only valid for the query that produced it
+    offset = 0
+    if cursor:
+        offset, _ = decode_cursor(cursor, query)
+        if not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    dialect = db.get_bind().dialect
+    if len(query) >= MIN_INDEXED_QUERY and foldersModels.file_search_supported(dialect):
+        search = _search_index
+    else:
+        search = _search_scan
+    rows, total = search(query, limit, offset, include_total, db, current_user)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(query, offset + limit, 0)
+
+    items = [
+        {
+            "id": row.id,
+            "filename": row.filename,
+            "folder_path": row.folder_path,
+            "revision": row.revision,
+            "uploaded_at": row.uploaded_at,
+        }
+        for row in rows
+    ]
+    return Page(items, next_cursor, total)
+
+
+def _search_index(query, limit, offset, include_total, db, current_user):
+    params = {
+        "match": _match_expression(query, current_user.id),
+        "user_id": current_user.id,
+    }
+    rows = db.execute(
+        SEARCH_SQL, {**params, "limit": limit + 1, "offset": offset}
+    ).all()
+    total = db.execute(COUNT_SQL, params).scalar() if include_total else None
+    return rows, total
+
+
+# Terms too short for the trigram index fall back to a scan of the user's files
+def _search_scan(query, limit, offset, include_total, db, current_user):
+    File = foldersModels.File
+    Folder = foldersModels.Folder
+    base = (
+        db.query(
+            File.id,
+            File.filename,
+            File.revision,
+            File.uploaded_at,
+            Folder.path.label("folder_path"),
+        )
+        .outerjoin(Folder, Folder.id == File.folder_id)
+        .filter(
+            File.user_id == current_user.id,
+            File.trash_id.is_(None),
+            Folder.trash_id.is_(None),
+            File.filename.like(f"%{_escape_like(query)}%", escape="\\"),
+        )
+    )
+    rows = base.order_by(File.filename, File.id).offset(offset).limit(limit + 1).all()
+    total = base.order_by(None).count() if include_total else None
+    return rows, total
+
+
+async def search_files_async(
+    query: str,
+    limit: int,
+    cursor: Optional[str],
+    include_total: bool,
+    db: AsyncSession,
+    current_user: CurrentUser,
+) -> Page:
+    return await db.run_sync(
+        lambda session: search_files(
+            query, limit, cursor, include_total, session, current_user
+        )
+    )
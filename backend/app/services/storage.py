@@ -0,0 +1,506 @@
+import hashlib
+import os
+import tempfile
+import uuid
+from typing import BinaryIO, Dict, Iterable, List, NamedTuple, Optional, Set
+
+from fastapi import UploadFile
+from sqlalchemy import event, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.models import folders as foldersModels
+from app.utils.codec import GZIP, compresses_well, gzip_stream
+
+UPLOAD_FOLDER = "uploads"  # Path to store uploaded files
+
+# Content-addressed storage: every distinct content is stored once under
+# BLOB_FOLDER, and uploads are staged under STAGING_FOLDER until hashed.
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, ".blobs")
+STAGING_FOLDER = os.path.join(UPLOAD_FOLDER, ".staging")
+
+# Partial files of resumable upload sessions, named after the session id
+SESSION_FOLDER = os.path.join(UPLOAD_FOLDER, ".sessions")
+
+# Session.info keys of the file changes applied once the transaction commits:
+# staged uploads to move into the blob store, staged copies of content stored
+# already, hashes of the blobs deleted, and legacy file paths to unlink. A
+# rollback discards the staged uploads.
+PENDING_PLACEMENTS = "pending_blob_placements"
+PENDING_DISCARDS = "pending_staged_discards"
+PENDING_BLOB_UNLINKS = "pending_blob_unlinks"
+PENDING_UNLINKS = "pending_file_unlinks"
+
+# Services run on an AsyncSession commit on the event loop. While this key is
+# set, their file changes are kept under DEFERRED_FILE_CHANGES and applied in
+# the threadpool by run_sync_service, instead of in the commit itself.
+DEFER_FILE_CHANGES = "defer_file_changes"
+DEFERRED_FILE_CHANGES = "deferred_file_changes"
+
+# Blob files known to exist or not, looked up ahead by check_blob_files
+KNOWN_BLOB_FILES = "known_blob_files"
+
+# Size of each read/write when streaming uploads to disk. Peak memory per
+# upload is bounded by this value, regardless of the file size.
+CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+
+# Optional storage codec: with STORAGE_COMPRESSION=gzip, content whose first
+# COMPRESSION_SAMPLE_BYTES shrink by COMPRESSION_MIN_SAVING is stored gzipped.
+# Already-compressed formats are recognised by their signature and skipped.
+STORAGE_COMPRESSION = os.getenv("STORAGE_COMPRESSION", "none").lower()
+STORAGE_GZIP_LEVEL = int(os.getenv("STORAGE_GZIP_LEVEL", 6))
+COMPRESSION_SAMPLE_BYTES = int(os.getenv("COMPRESSION_SAMPLE_BYTES", 64 * 1024))
+COMPRESSION_MIN_SAVING = float(os.getenv("COMPRESSION_MIN_SAVING", 0.2))
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+
+
+class StoredUpload(NamedTuple):
+    path: str
+    sha256: str
+    size: int  # Size of the original content, whatever the encoding
+    encoding: Optional[str] = None
+
+
+# Return the on-disk path backing an upload, if it has one
+def _backing_path(source: BinaryIO) -> Optional[str]:
+    # SpooledTemporaryFile keeps small uploads in memory and rolls over to an
+    # anonymous file, so only named backing files can be moved with a rename.
+    raw = getattr(source, "_file", source)
+    name = getattr(raw, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    return None
+
+
+def _same_filesystem(src_path: str, dest_dir: str) -> bool:
+    return os.stat(src_path).st_dev == os.stat(dest_dir).st_dev
+
+
+def _open_temp(dest_path: str):
+    # Write next to the destination so the final rename is atomic
+    dest_dir = os.path.dirname(dest_path) or "."
+    os.makedirs(dest_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, prefix=".upload-", suffix=".part")
+    return os.fdopen(fd, "wb"), tmp_path
+
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_chunk(out: BinaryIO, hasher, chunk: bytes):
+    # hashlib releases the GIL on large buffers, so both run off the event loop
+    hasher.update(chunk)
+    out.write(chunk)
+
+
+# Hash a file on disk without loading it in memory
+def hash_file(path: str) -> StoredUpload:
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            hasher.update(chunk)
+            size += len(chunk)
+    return StoredUpload(path=path, sha256=hasher.hexdigest(), size=size)
+
+
+# Move a file already on disk to its destination, hashing it on the way
+def adopt_file(src_path: str, dest_path: str) -> StoredUpload:
+    dest_dir = os.path.dirname(dest_path) or "."
+    os.makedirs(dest_dir, exist_ok=True)
+
+    if _same_filesystem(src_path, dest_dir):
+        stored = hash_file(src_path)
+        os.replace(src_path, dest_path)
+        return stored._replace(path=dest_path)
+
+    with open(src_path, "rb") as source:
+        stored = write_stream(source, dest_path)
+    _discard(src_path)
+    return stored
+
+
+# Stream a file-like object to disk in fixed-size chunks (blocking)
+def write_stream(source: BinaryIO, dest_path: str) -> StoredUpload:
+    dest_dir = os.path.dirname(dest_path) or "."
+    os.makedirs(dest_dir, exist_ok=True)
+
+    backing_path = _backing_path(source)
+    if backing_path and _same_filesystem(backing_path, dest_dir):
+        return adopt_file(backing_path, dest_path)
+
+    hasher = hashlib.sha256()
+    size = 0
+    out, tmp_path = _open_temp(dest_path)
+    try:
+        with out:
+            while chunk := source.read(CHUNK_SIZE):
+                _write_chunk(out, hasher, chunk)
+                size += len(chunk)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+
+    return StoredUpload(path=dest_path, sha256=hasher.hexdigest(), size=size)
+
+
+# Stream an UploadFile to disk without blocking the event loop
+async def save_upload(file: UploadFile, dest_path: str) -> StoredUpload:
+    if _backing_path(file.file):
+        return await run_in_threadpool(write_stream, file.file, dest_path)
+
+    hasher = hashlib.sha256()
+    size = 0
+    out, tmp_path = await run_in_threadpool(_open_temp, dest_path)
+    try:
+        while chunk := await file.read(CHUNK_SIZE):
+            await run_in_threadpool(_write_chunk, out, hasher, chunk)
+            size += len(chunk)
+        await run_in_threadpool(out.close)
+        await run_in_threadpool(os.replace, tmp_path, dest_path)
+    except BaseException:
+        out.close()
+        _discard(tmp_path)
+        raise
+
+    return StoredUpload(path=dest_path, sha256=hasher.hexdigest(), size=size)
+
+
+def _encodable(stored: StoredUpload) -> bool:
+    return (
+        STORAGE_COMPRESSION == GZIP
+        and stored.encoding is None
+        and stored.size >= COMPRESSION_MIN_SIZE
+    )
+
+
+# Hashes of the staged uploads to pass to encode_staged: those the codec may
+# compress and whose content is not in the blob store yet. Content stored
+# already is linked as it is, without being compressed again.
+def hashes_to_encode(db: Session, staged: Iterable[StoredUpload]) -> Set[str]:
+    candidates = {stored.sha256 for stored in staged if _encodable(stored)}
+    if not candidates:
+        return set()
+
+    Blob = foldersModels.Blob
+    known = db.query(Blob.sha256).filter(Blob.sha256.in_(candidates))
+    return candidates - {sha256 for (sha256,) in known}
+
+
+# Compress staged content when the codec is enabled and its first bytes
+# compress well (blocking). The staged file is read once: the sample is the
+# start of the stream being compressed. The hash and size stay those of the
+# original content, so identical uploads still share one blob.
+def encode_staged(stored: StoredUpload) -> StoredUpload:
+    if not _encodable(stored):
+        return stored
+
+    with open(stored.path, "rb") as source:
+        sample = source.read(COMPRESSION_SAMPLE_BYTES)
+        if not compresses_well(sample, COMPRESSION_MIN_SAVING):
+            return stored
+
+        # The sample can mislead, e.g. a text header before binary data:
+        # compression stops once it would not save anything
+        out, encoded_path = _open_temp(staging_path())
+        try:
+            with out:
+                smaller = gzip_stream(
+                    sample,
+                    source,
+                    out,
+                    STORAGE_GZIP_LEVEL,
+                    CHUNK_SIZE,
+                    max_size=stored.size,
+                )
+        except BaseException:
+            _discard(encoded_path)
+            raise
+
+    if not smaller:
+        _discard(encoded_path)
+        return stored
+
+    _discard(stored.path)
+    return stored._replace(path=encoded_path, encoding=GZIP)
+
+
+# Path of a blob in the store, sharded by the first bytes of its hash
+def blob_path(sha256: str) -> str:
+    return os.path.join(BLOB_FOLDER, sha256[:2], sha256[2:4], sha256)
+
+
+# Unique path where an upload is written before it is linked to a blob
+def staging_path() -> str:
+    return os.path.join(STAGING_FOLDER, uuid.uuid4().hex)
+
+
+def session_path(upload_id: str) -> str:
+    return os.path.join(SESSION_FOLDER, upload_id)
+
+
+def remove_partial(upload_id: str):
+    _discard(session_path(upload_id))
+
+
+# Remove a staged upload that was never linked to a blob
+def discard_staged(stored: StoredUpload):
+    _discard(stored.path)
+
+
+def _place(staged_path: str, dest_path: str):
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    os.replace(staged_path, dest_path)
+
+
+# Move a staged upload into the blob store once the transaction commits
+def _schedule_placement(db: Session, stored: StoredUpload):
+    db.info.setdefault(PENDING_PLACEMENTS, {})[stored.sha256] = stored
+
+
+# Whether this transaction already stores the content, e.g. twice in a batch
+def _placement_pending(db: Session, sha256: str) -> bool:
+    return sha256 in db.info.get(PENDING_PLACEMENTS, {})
+
+
+# Drop a staged copy once the transaction ends, as its content is stored
+def _schedule_discard(db: Session, stored: StoredUpload):
+    db.info.setdefault(PENDING_DISCARDS, []).append(stored.path)
+
+
+def _blob_files_present(hashes: Iterable[str]) -> Dict[str, bool]:
+    return {sha256: os.path.exists(blob_path(sha256)) for sha256 in hashes}
+
+
+# Look up in the threadpool whether the content of staged uploads is on disk,
+# so store_blob does not stat it from a service run on the event loop
+async def check_blob_files(db: AsyncSession, staged: Iterable[StoredUpload]):
+    hashes = {stored.sha256 for stored in staged}
+    present = await run_in_threadpool(_blob_files_present, hashes)
+    db.sync_session.info.setdefault(KNOWN_BLOB_FILES, {}).update(present)
+
+
+def _blob_file_exists(db: Session, sha256: str) -> bool:
+    known = db.info.get(KNOWN_BLOB_FILES, {})
+    if sha256 in known:
+        return known[sha256]
+    return os.path.exists(blob_path(sha256))
+
+
+# Link a staged upload to the blob store, storing identical content only once.
+# The staged file is moved into place when the transaction commits, so a
+# rollback never leaves content behind without a blob row.
+def store_blob(db: Session, stored: StoredUpload) -> foldersModels.Blob:
+    Blob = foldersModels.Blob
+
+    while True:
+        # Existing content: take a reference atomically and drop the staged copy
+        updated = (
+            db.query(Blob)
+            .filter(Blob.sha256 == stored.sha256)
+            .update({Blob.refcount: Blob.refcount + 1}, synchronize_session=False)
+        )
+        if updated:
+            blob = db.query(Blob).filter(Blob.sha256 == stored.sha256).one()
+            if _placement_pending(db, stored.sha256) or _blob_file_exists(
+                db, stored.sha256
+            ):
+                _schedule_discard(db, stored)
+            else:
+                # Missing content is restored from this upload, as encoded now
+                _schedule_placement(db, stored)
+                blob.encoding = stored.encoding
+            return blob
+
+        # New content: a concurrent upload may insert the same hash first
+        try:
+            with db.begin_nested():
+                blob = Blob(
+                    sha256=stored.sha256,
+                    size=stored.size,
+                    refcount=1,
+                    encoding=stored.encoding,
+                )
+                db.add(blob)
+        except IntegrityError:
+            continue
+
+        _schedule_placement(db, stored)
+        return blob
+
+
+# Drop one reference to a blob, unlinking its content when none remain
+def release_blob(db: Session, blob_id: int):
+    Blob = foldersModels.Blob
+    db.query(Blob).filter(Blob.id == blob_id).update(
+        {Blob.refcount: Blob.refcount - 1}, synchronize_session=False
+    )
+
+    sha256 = (
+        db.query(Blob.sha256).filter(Blob.id == blob_id, Blob.refcount <= 0).scalar()
+    )
+    if sha256 is None:
+        return
+
+    # The deleted row leaves the session too, as the same content may be
+    # stored again, under the same id, before the commit
+    db.query(Blob).filter(Blob.id == blob_id).delete(synchronize_session="evaluate")
+    db.info.setdefault(PENDING_BLOB_UNLINKS, []).append(sha256)
+
+
+# Remove the stored content of a file record (blob reference or legacy path)
+def release_file(db: Session, file: foldersModels.File):
+    if file.blob_id is not None:
+        release_blob(db, file.blob_id)
+    elif file.file_path:
+        schedule_unlink(db, file.file_path)
+
+
+# Unlink a path only after the current transaction commits
+def schedule_unlink(db: Session, path: str):
+    db.info.setdefault(PENDING_UNLINKS, []).append(path)
+
+
+# File changes of a committed transaction, applied outside of it
+class FileChanges(NamedTuple):
+    placements: List[StoredUpload]
+    discards: List[str]
+    released: List[str]
+    unlinks: List[str]
+
+
+def _take_file_changes(session: Session) -> FileChanges:
+    return FileChanges(
+        list(session.info.pop(PENDING_PLACEMENTS, {}).values()),
+        session.info.pop(PENDING_DISCARDS, []),
+        session.info.pop(PENDING_BLOB_UNLINKS, []),
+        session.info.pop(PENDING_UNLINKS, []),
+    )
+
+
+# Move new content into the blob store and set released content aside
+# (blocking). Released files are only renamed here: the same content may have
+# been stored again since, which _settle_released checks against the database.
+def _move_files(changes: FileChanges) -> Dict[str, str]:
+    for stored in changes.placements:
+        _place(stored.path, blob_path(stored.sha256))
+    for path in changes.discards + changes.unlinks:
+        _discard(path)
+
+    placed = {stored.sha256 for stored in changes.placements}
+    released = {}
+    for sha256 in set(changes.released) - placed:
+        set_aside = staging_path()
+        os.makedirs(STAGING_FOLDER, exist_ok=True)
+        try:
+            os.replace(blob_path(sha256), set_aside)
+        except FileNotFoundError:
+            continue
+        released[sha256] = set_aside
+    return released
+
+
+# Remove released content, putting back the content whose blob row exists
+# again (blocking). An upload storing it anew places its own copy, so a file
+# already back in place is kept.
+def _settle_released(released: Dict[str, str], stored: Set[str]):
+    for sha256, set_aside in released.items():
+        if sha256 in stored:
+            try:
+                os.link(set_aside, blob_path(sha256))
+            except FileExistsError:
+                pass
+        _discard(set_aside)
+
+
+# Hashes among the given ones that have a blob row
+def _stored_hashes(db: Session, hashes: Iterable[str]) -> Set[str]:
+    Blob = foldersModels.Blob
+    return {
+        sha256
+        for (sha256,) in db.query(Blob.sha256).filter(Blob.sha256.in_(list(hashes)))
+    }
+
+
+# Hashes that have a committed blob row. The session cannot run queries after
+# its transaction ended, so this uses its own connection.
+def _committed_hashes(session: Session, hashes: Iterable[str]) -> Set[str]:
+    Blob = foldersModels.Blob
+    statement = select(Blob.sha256).where(Blob.sha256.in_(list(hashes)))
+    bind = session.get_bind()
+    if isinstance(bind, Connection):
+        return set(bind.execute(statement).scalars())
+    with bind.connect() as connection:
+        return set(connection.execute(statement).scalars())
+
+
+# Whether the session's file changes wait for run_sync_service, which then
+# also removes the staged files of a failed service
+def defers_file_changes(session: Session) -> bool:
+    return bool(session.info.get(DEFER_FILE_CHANGES))
+
+
+def _defer(session: Session, changes: FileChanges):
+    session.info.setdefault(DEFERRED_FILE_CHANGES, []).append(changes)
+
+
+# Also called when a savepoint is released: changes wait for the outermost
+# transaction to commit
+@event.listens_for(Session, "after_commit")
+def _apply_file_changes_after_commit(session: Session):
+    if session.in_nested_transaction():
+        return
+    changes = _take_file_changes(session)
+    if defers_file_changes(session):
+        _defer(session, changes)
+        return
+
+    released = _move_files(changes)
+    if released:
+        _settle_released(released, _committed_hashes(session, released))
+
+
+# Savepoint rollbacks (e.g. a duplicate blob insert) keep the changes of the
+# enclosing transaction; only the outermost rollback discards them
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_file_changes_on_rollback(session: Session, previous_transaction):
+    if previous_transaction.parent is not None:
+        return
+    changes = _take_file_changes(session)
+    staged = [stored.path for stored in changes.placements] + changes.discards
+    if defers_file_changes(session):
+        _defer(session, FileChanges([], staged, [], []))
+        return
+    for path in staged:
+        _discard(path)
+
+
+# Apply the file changes deferred by the commits of an async session
+async def apply_file_changes(db: AsyncSession):
+    for changes in db.sync_session.info.pop(DEFERRED_FILE_CHANGES, []):
+        released = await run_in_threadpool(_move_files, changes)
+        if released:
+            stored = await db.run_sync(_stored_hashes, released)
+            await run_in_threadpool(_settle_released, released, stored)
+
+
+# Run a sync service on an async session. Its queries await the driver; the
+# file changes of its commits are applied in the threadpool afterwards, so
+# the event loop never waits on the disk.
+async def run_sync_service(db: AsyncSession, fn, *args, **kwargs):
+    info = db.sync_session.info
+    info[DEFER_FILE_CHANGES] = True
+    try:
+        return await db.run_sync(fn, *args, **kwargs)
+    finally:
+        info.pop(DEFER_FILE_CHANGES, None)
+        info.pop(KNOWN_BLOB_FILES, None)
+        await apply_file_changes(db)
@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.auth.dependencies import CurrentUser
+from app.db import SessionLocal
+from app.models import folders as foldersModels
+from app.models import users as usersModels
+from app.services.storage import UPLOAD_FOLDER, release_file, remove_partial
+from app.services.tree import subtree_filter
+
+logger = logging.getLogger(__name__)
+
+# Deleted folders and files stay restorable for this long before being purged
+TRASH_RETENTION = timedelta(
+    seconds=int(os.getenv("TRASH_RETENTION_SECONDS", 24 * 60 * 60))
+)
+
+# The purger removes files in batches, each in its own transaction, and pauses
+# between batches so a large purge does not starve requests of the database.
+TRASH_PURGE_BATCH_SIZE = int(os.getenv("TRASH_PURGE_BATCH_SIZE", 500))
+TRASH_PURGE_BATCH_DELAY = float(os.getenv("TRASH_PURGE_BATCH_DELAY", 0.05))
+TRASH_PURGE_INTERVAL = int(os.getenv("TRASH_PURGE_INTERVAL_SECONDS", 60))
+
+
+def _new_entry(db: Session, user_id: int, kind: str, path: str):
+    now = datetime.utcnow()
+    entry = foldersModels.Trash(
+        user_id=user_id,
+        kind=kind,
+        path=path,
+        deleted_at=now,
+        purge_after=now + TRASH_RETENTION,
+    )
+    db.add(entry)
+    db.flush()
+    return entry
+
+
+# Tombstone a folder and its subtree with a single UPDATE (not committed).
+# Files are hidden through their folder and are not touched until the purge.
+def trash_folder(db: Session, folder: foldersModels.Folder) -> foldersModels.Trash:
+    Folder = foldersModels.Folder
+    entry = _new_entry(db, folder.user_id, "folder", folder.path)
+    db.query(Folder).filter(
+        Folder.user_id == folder.user_id,
+        Folder.trash_id.is_(None),
+        subtree_filter(folder.path),
+    ).update({Folder.trash_id: entry.id}, synchronize_session=False)
+    return entry
+
+
+# Tombstone a single file revision (not committed)
+def trash_file(
+    db: Session, folder: foldersModels.Folder, file: foldersModels.File
+) -> foldersModels.Trash:
+    entry = _new_entry(db, folder.user_id, "file", f"{folder.path}/{file.filename}")
+    file.trash_id = entry.id
+    return entry
+
+
+# List the user's trash
+def list_trash(db: Session, current_user: CurrentUser):
+    Trash = foldersModels.Trash
+    entries = (
+        db.query(Trash)
+        .filter(Trash.user_id == current_user.id)
+        .order_by(Trash.deleted_at.desc(), Trash.id.desc())
+        .all()
+    )
+    return [
+        {
+            "id": entry.id,
+            "kind": entry.kind,
+            "path": entry.path,
+            "deleted_at": entry.deleted_at,
+            "purge_after": entry.purge_after,
+        }
+        for entry in entries
+    ]
+
+
+# Restore a trash entry by clearing its tombstones
+def restore_trash(trash_id: int, db: Session, current_user: CurrentUser):
+    Trash = foldersModels.Trash
+    entry = (
+        db.query(Trash)
+        .filter(Trash.id == trash_id, Trash.user_id == current_user.id)
+        .first()
+    )
+    if not entry:
+        raise HTTPException(status_code=404, detail="Trash entry not found.")
+    path = entry.path
+
+    # Restoring fails as a whole if a live folder took the path meanwhile
+    try:
+        with db.begin_nested():
+            # Claiming the entry; once its purge is due the purger owns it
+            claimed = (
+                db.query(Trash)
+                .filter(Trash.id == trash_id, Trash.purge_after > datetime.utcnow())
+                .delete(synchronize_session=False)
+            )
+            if not claimed:
+                raise HTTPException(
+                    status_code=410, detail="Trash entry is being purged."
+                )
+
+            restored = db.query(foldersModels.Folder).filter(
+                foldersModels.Folder.trash_id == trash_id
+            ).update({foldersModels.Folder.trash_id: None}, synchronize_session=False)
+            restored += db.query(foldersModels.File).filter(
+                foldersModels.File.trash_id == trash_id
+            ).update({foldersModels.File.trash_id: None}, synchronize_session=False)
+            # A file goes with its folder when the folder's own entry is purged
+            if not restored:
+                raise HTTPException(
+                    status_code=410, detail="Trash entry content was purged."
+                )
+    except IntegrityError:
+        raise HTTPException(
+            status_code=409, detail="A folder with this path already exists."
+        )
+    db.commit()
+
+    return {"message": f"'{path}' successfully restored!"}
+
+
+async def list_trash_async(db: AsyncSession, current_user: CurrentUser):
+    return await db.run_sync(list_trash, current_user)
+
+
+async def restore_trash_async(
+    trash_id: int, db: AsyncSession, current_user: CurrentUser
+):
+    return await db.run_sync(
+        lambda session: restore_trash(trash_id, session, current_user)
+    )
+
+
+# Remove the empty directories left behind by files stored per folder, never
+# outside the user's upload directory
+def _remove_empty_dirs(user_root: str, root: str):
+    user_root = os.path.realpath(user_root)
+    root = os.path.realpath(root)
+    if root == user_root or os.path.commonpath([user_root, root]) != user_root:
+        logger.warning("Not removing directories outside %s: %s", user_root, root)
+        return
+    if not os.path.isdir(root):
+        return
+    for dirpath, _, _ in os.walk(root, topdown=False):
+        try:
+            os.rmdir(dirpath)
+        except OSError:
+            pass
+
+
+# Purge one trash entry. Every batch commits on its own, so an interrupted
+# purge resumes from the files that are left.
+def purge_trash_entry(
+    db: Session,
+    trash_id: int,
+    batch_size: int = TRASH_PURGE_BATCH_SIZE,
+    delay: float = 0,
+) -> int:
+    Folder = foldersModels.Folder
+    File = foldersModels.File
+
+    trashed_folders = db.query(Folder.id).filter(Folder.trash_id == trash_id)
+    purged = 0
+    while True:
+        files = (
+            db.query(File)
+            .filter(
+                or_(
+                    File.trash_id == trash_id,
+                    File.folder_id.in_(trashed_folders.scalar_subquery()),
+                )
+            )
+            .limit(batch_size)
+            .all()
+        )
+        if not files:
+            break
+        for file in files:
+            # Content shared with other revisions is kept until its last reference goes
+            release_file(db, file)
+            db.delete(file)
+        db.commit()
+        purged += len(files)
+        if delay:
+            time.sleep(delay)
+
+    entry = (
+        db.query(
+            foldersModels.Trash.kind,
+            foldersModels.Trash.path,
+            foldersModels.Trash.user_id,
+        )
+        .filter_by(id=trash_id)
+        .first()
+    )
+    folder_ids = [folder_id for (folder_id,) in trashed_folders]
+    db.query(foldersModels.RevisionCounter).filter(
+        foldersModels.RevisionCounter.folder_id.in_(folder_ids)
+    ).delete(synchronize_session=False)
+    # Unfinished uploads into the folders are abandoned with them
+    UploadSession = foldersModels.UploadSession
+    upload_ids = [
+        upload_id
+        for (upload_id,) in db.query(UploadSession.id).filter(
+            UploadSession.folder_id.in_(folder_ids)
+        )
+    ]
+    db.query(UploadSession).filter(UploadSession.id.in_(upload_ids)).delete(
+        synchronize_session=False
+    )
+    db.query(Folder).filter(Folder.trash_id == trash_id).delete(
+        synchronize_session=False
+    )
+    db.query(foldersModels.Trash).filter_by(id=trash_id).delete(
+        synchronize_session=False
+    )
+    db.commit()
+
+    for upload_id in upload_ids:
+        remove_partial(upload_id)
+    if entry is not None and entry.kind == "folder":
+        email = (
+            db.query(usersModels.User.email)
+            .filter(usersModels.User.id == entry.user_id)
+            .scalar()
+        )
+        if email:
+            user_root = os.path.join(UPLOAD_FOLDER, email)
+            _remove_empty_dirs(user_root, os.path.join(user_root, entry.path))
+    return purged
+
+
+# Purge every trash entry whose retention has passed
+def purge_expired_trash(db: Session, delay: float = TRASH_PURGE_BATCH_DELAY) -> int:
+    Trash = foldersModels.Trash
+    expired = [
+        trash_id
+        for (trash_id,) in db.query(Trash.id)
+        .filter(Trash.purge_after <= datetime.utcnow())
+        .order_by(Trash.purge_after)
+    ]
+    for trash_id in expired:
+        purged = purge_trash_entry(db, trash_id, delay=delay)
+        logger.info("Purged trash entry %d (%d files)", trash_id, purged)
+    return len(expired)
+
+
+def _purge_once():
+    db = SessionLocal()
+    try:
+        purge_expired_trash(db)
+    finally:
+        db.close()
+
+
+# Background task emptying the trash for as long as the app runs
+async def run_trash_purger():
+    while True:
+        try:
+            await run_in_threadpool(_purge_once)
+        except Exception:
+            logger.exception("Trash purge failed")
+        await asyncio.sleep(TRASH_PURGE_INTERVAL)
@@ -0,0 +1,101 @@
+import re
+from typing import List
+
+from fastapi import HTTPException
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import folders as foldersModels
+
+# Folders form a tree through parent_id, and Folder.path is the materialized
+# path of each node. "/" sorts right before "0", so the descendants of "a/b"
+# are exactly the paths in ["a/b/", "a/b0"), an index range on (user_id, path).
+SEPARATOR = "/"
+AFTER_SEPARATOR = chr(ord(SEPARATOR) + 1)
+
+# Segments that would lead a folder's directory out of the user's upload root
+UNSAFE_SEGMENTS = {".", ".."}
+DRIVE_PATTERN = re.compile(r"^[A-Za-z]:")
+
+
+# Drop empty segments and surrounding slashes from a folder path, refusing
+# relative and absolute segments: folder paths are also directory paths
+def normalize_path(path: str) -> str:
+    parts = [part for part in path.split(SEPARATOR) if part]
+    for part in parts:
+        if (
+            part in UNSAFE_SEGMENTS
+            or "\\" in part
+            or "\x00" in part
+            or DRIVE_PATTERN.match(part)
+        ):
+            raise HTTPException(status_code=400, detail="Invalid folder path.")
+    return SEPARATOR.join(parts)
+
+
+def parent_path(path: str) -> str:
+    return path.rpartition(SEPARATOR)[0]
+
+
+def ancestor_paths(path: str) -> List[str]:
+    parts = path.split(SEPARATOR)
+    return [SEPARATOR.join(parts[:depth]) for depth in range(1, len(parts))]
+
+
+# Filter matching the strict descendants of a folder path
+def descendants_filter(path: str):
+    Folder = foldersModels.Folder
+    return Folder.path >= path + SEPARATOR, Folder.path < path + AFTER_SEPARATOR
+
+
+# Filter matching a folder path and all of its descendants
+def subtree_filter(path: str):
+    Folder = foldersModels.Folder
+    lower, upper = descendants_filter(path)
+    return or_(Folder.path == path, (lower & upper))
+
+
+# Get a folder by path, creating it and any missing ancestors (not committed)
+def ensure_folder(db: Session, user_id: int, path: str) -> foldersModels.Folder:
+    Folder = foldersModels.Folder
+    paths = ancestor_paths(path) + [path]
+    existing = {
+        folder.path: folder
+        for folder in db.query(Folder).filter(
+            Folder.user_id == user_id,
+            Folder.trash_id.is_(None),
+            Folder.path.in_(paths),
+        )
+    }
+
+    parent_id = None
+    for node_path in paths:
+        folder = existing.get(node_path)
+        if folder is None:
+            folder = _insert_folder(db, user_id, node_path, parent_id)
+        elif folder.parent_id is None and parent_id is not None:
+            # Folders created before the tree existed are linked on the way
+            folder.parent_id = parent_id
+        parent_id = folder.id
+    return folder
+
+
+def _insert_folder(db: Session, user_id: int, path: str, parent_id):
+    Folder = foldersModels.Folder
+    try:
+        with db.begin_nested():
+            folder = Folder(path=path, user_id=user_id, parent_id=parent_id)
+            db.add(folder)
+    except IntegrityError:
+        # Created concurrently by another request
+        folder = (
+            db.query(Folder)
+            .filter(
+                Folder.user_id == user_id,
+                Folder.trash_id.is_(None),
+                Folder.path == path,
+            )
+            .one()
+        )
+    return folder
@@ -0,0 +1,365 @@
+import asyncio
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+from typing import BinaryIO
+
+from fastapi import HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.auth.dependencies import CurrentUser
+from app.db import SessionLocal
+from app.models import folders as foldersModels
+from app.schemas import folders as schemas
+from app.services.files import add_file_revision
+from app.services.storage import (
+    SESSION_FOLDER,
+    StoredUpload,
+    check_blob_files,
+    discard_staged,
+    encode_staged,
+    hash_file,
+    hashes_to_encode,
+    remove_partial,
+    run_sync_service,
+    session_path,
+    staging_path,
+)
+from app.utils.metrics import record_transfer
+
+logger = logging.getLogger(__name__)
+
+# Idle time after which an unfinished upload session is swept
+UPLOAD_SESSION_TTL = timedelta(
+    seconds=int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", 24 * 60 * 60))
+)
+UPLOAD_SESSION_SWEEP_INTERVAL = int(os.getenv("UPLOAD_SESSION_SWEEP_SECONDS", 600))
+
+
+def _session_response(upload: foldersModels.UploadSession) -> dict:
+    return schemas.UploadSessionResponse(
+        upload_id=upload.id,
+        filename=upload.filename,
+        offset=upload.offset,
+        size=upload.size,
+        expires_at=upload.expires_at,
+    ).dict()
+
+
+def _get_session(
+    db: Session, upload_id: str, current_user: CurrentUser
+) -> foldersModels.UploadSession:
+    upload = (
+        db.query(foldersModels.UploadSession)
+        .filter(
+            foldersModels.UploadSession.id == upload_id,
+            foldersModels.UploadSession.user_id == current_user.id,
+        )
+        .first()
+    )
+    if not upload or upload.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=404, detail="Upload session not found.")
+    return upload
+
+
+def _folder_not_found():
+    return HTTPException(status_code=404, detail="Folder not found.")
+
+
+def _session_folder_id(
+    db: Session, data: schemas.UploadSessionCreate, current_user: CurrentUser
+) -> int:
+    folder = (
+        db.query(foldersModels.Folder)
+        .filter(
+            foldersModels.Folder.path == data.folder_path,
+            foldersModels.Folder.user_id == current_user.id,
+            foldersModels.Folder.trash_id.is_(None),
+        )
+        .first()
+    )
+    if not folder:
+        raise _folder_not_found()
+    if data.size is not None and data.size < 0:
+        raise HTTPException(status_code=400, detail="Invalid upload size.")
+    return folder.id
+
+
+def _create_partial(upload_id: str):
+    os.makedirs(SESSION_FOLDER, exist_ok=True)
+    open(session_path(upload_id), "wb").close()
+
+
+def _add_session(db: Session, upload: foldersModels.UploadSession) -> dict:
+    db.add(upload)
+    db.commit()
+    db.refresh(upload)
+    return _session_response(upload)
+
+
+# Create an upload session
+async def create_upload_session(
+    data: schemas.UploadSessionCreate, db: AsyncSession, current_user: CurrentUser
+):
+    folder_id = await db.run_sync(_session_folder_id, data, current_user)
+    upload = foldersModels.UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=current_user.id,
+        folder_id=folder_id,
+        filename=data.filename,
+        size=data.size,
+        offset=0,
+        expires_at=datetime.utcnow() + UPLOAD_SESSION_TTL,
+    )
+
+    # Create the empty partial file before the session becomes visible
+    await run_in_threadpool(_create_partial, upload.id)
+    return await db.run_sync(_add_session, upload)
+
+
+def _session_info(db: Session, upload_id: str, current_user: CurrentUser) -> dict:
+    return _session_response(_get_session(db, upload_id, current_user))
+
+
+# Get the current offset of an upload session
+async def get_upload_session(
+    upload_id: str, db: AsyncSession, current_user: CurrentUser
+):
+    return await db.run_sync(_session_info, upload_id, current_user)
+
+
+# The partial file, opened at the offset; gone once the session was swept
+def _open_partial(upload_id: str, offset: int) -> BinaryIO:
+    try:
+        f = open(session_path(upload_id), "r+b")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload session not found.")
+    f.seek(offset)
+    return f
+
+
+# Advance a session to a new offset, only from the offset the chunk started at
+def _advance_offset(db: Session, upload_id: str, current: int, position: int):
+    # Another worker may have won the race for this offset
+    if position > current:
+        db.query(foldersModels.UploadSession).filter(
+            foldersModels.UploadSession.id == upload_id,
+            foldersModels.UploadSession.offset == current,
+        ).update(
+            {
+                foldersModels.UploadSession.offset: position,
+                foldersModels.UploadSession.expires_at: datetime.utcnow()
+                + UPLOAD_SESSION_TTL,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+
+    upload = (
+        db.query(foldersModels.UploadSession)
+        .filter(foldersModels.UploadSession.id == upload_id)
+        .populate_existing()
+        .first()
+    )
+    # Swept or completed while the chunk was being received
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload session not found.")
+    return _session_response(upload)
+
+
+# Append a chunk to an upload session; re-sending a chunk is a no-op
+async def put_upload_chunk(
+    upload_id: str,
+    offset: int,
+    db: AsyncSession,
+    current_user: CurrentUser,
+    request: Request,
+):
+    upload = await db.run_sync(_get_session, upload_id, current_user)
+
+    current = upload.offset
+    if offset > current:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Offset mismatch, the upload is at offset {current}.",
+        )
+
+    # Bytes before the stored offset were already received and are skipped
+    out = await run_in_threadpool(_open_partial, upload.id, current)
+    size = upload.size
+    skip = current - offset
+    position = current
+    try:
+        async for chunk in request.stream():
+            if skip:
+                if len(chunk) <= skip:
+                    skip -= len(chunk)
+                    continue
+                chunk = chunk[skip:]
+                skip = 0
+            if size is not None and position + len(chunk) > size:
+                raise HTTPException(
+                    status_code=400, detail="Chunk exceeds the declared upload size."
+                )
+            await run_in_threadpool(out.write, chunk)
+            position += len(chunk)
+            record_transfer("upload", len(chunk))
+    finally:
+        await run_in_threadpool(out.close)
+
+    return await db.run_sync(_advance_offset, upload_id, current, position)
+
+
+# Files are not added to a trashed folder; the session stays for a restore
+def _check_folder(db: Session, folder_id: int):
+    folder = (
+        db.query(foldersModels.Folder.trash_id)
+        .filter(foldersModels.Folder.id == folder_id)
+        .first()
+    )
+    if folder is None or folder.trash_id is not None:
+        raise _folder_not_found()
+
+
+def _finished_session(
+    db: Session, upload_id: str, current_user: CurrentUser
+) -> foldersModels.UploadSession:
+    upload = _get_session(db, upload_id, current_user)
+    _check_folder(db, upload.folder_id)
+    if upload.size is not None and upload.offset != upload.size:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Upload incomplete, received {upload.offset} of {upload.size} bytes.",
+        )
+    return upload
+
+
+# Copy the partial file to the staging area and hash the copy. The partial
+# stays until the new revision is committed, so a failed completion can be
+# retried. Bytes past the offset belong to an interrupted chunk and are dropped.
+def _stage_partial(upload_id: str, offset: int) -> StoredUpload:
+    path = session_path(upload_id)
+    os.truncate(path, offset)
+    staged = staging_path()
+    os.makedirs(os.path.dirname(staged), exist_ok=True)
+    shutil.copyfile(path, staged)
+    try:
+        return hash_file(staged)
+    except BaseException:
+        os.remove(staged)
+        raise
+
+
+def _store_session_file(
+    db: Session,
+    upload: foldersModels.UploadSession,
+    current_user: CurrentUser,
+    stored: StoredUpload,
+):
+    # Claim the session so concurrent completions cannot store it twice. On
+    # failure the claim is rolled back and the session can be completed again.
+    try:
+        claimed = (
+            db.query(foldersModels.UploadSession)
+            .filter(foldersModels.UploadSession.id == upload.id)
+            .delete(synchronize_session=False)
+        )
+        if not claimed:
+            raise HTTPException(status_code=404, detail="Upload session not found.")
+        # The folder may have been trashed since the session was checked
+        _check_folder(db, upload.folder_id)
+
+        new_file = add_file_revision(
+            db, current_user.id, upload.folder_id, upload.filename, stored
+        )
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    db.refresh(new_file)
+
+    return {
+        "message": "File uploaded successfully",
+        "file": new_file.filename,
+        "revision": new_file.revision,
+    }
+
+
+# Turn a finished upload session into a new file revision
+async def complete_upload_session(
+    upload_id: str, db: AsyncSession, current_user: CurrentUser
+):
+    upload = await db.run_sync(_finished_session, upload_id, current_user)
+    stored = await run_in_threadpool(_stage_partial, upload.id, upload.offset)
+    try:
+        if await db.run_sync(hashes_to_encode, [stored]):
+            stored = await run_in_threadpool(encode_staged, stored)
+        await check_blob_files(db, [stored])
+        result = await run_sync_service(
+            db, _store_session_file, upload, current_user, stored
+        )
+    except BaseException:
+        await run_in_threadpool(discard_staged, stored)
+        raise
+
+    await run_in_threadpool(remove_partial, upload_id)
+    return result
+
+
+def _delete_session(db: Session, upload_id: str, current_user: CurrentUser):
+    db.delete(_get_session(db, upload_id, current_user))
+    db.commit()
+
+
+# Abort an upload session
+async def delete_upload_session(
+    upload_id: str, db: AsyncSession, current_user: CurrentUser
+):
+    await db.run_sync(_delete_session, upload_id, current_user)
+    await run_in_threadpool(remove_partial, upload_id)
+
+    return {"message": "Upload session cancelled."}
+
+
+# Remove expired upload sessions and their partial files
+def sweep_expired_upload_sessions(db: Session) -> int:
+    expired = [
+        upload_id
+        for (upload_id,) in db.query(foldersModels.UploadSession.id).filter(
+            foldersModels.UploadSession.expires_at < datetime.utcnow()
+        )
+    ]
+    if not expired:
+        return 0
+
+    db.query(foldersModels.UploadSession).filter(
+        foldersModels.UploadSession.id.in_(expired)
+    ).delete(synchronize_session=False)
+    db.commit()
+
+    for upload_id in expired:
+        remove_partial(upload_id)
+    logger.info("Swept %d expired upload sessions", len(expired))
+    return len(expired)
+
+
+def _sweep_once():
+    db = SessionLocal()
+    try:
+        sweep_expired_upload_sessions(db)
+    finally:
+        db.close()
+
+
+# Background task sweeping abandoned sessions for as long as the app runs
+async def run_upload_session_sweeper():
+    while True:
+        try:
+            await run_in_threadpool(_sweep_once)
+        except Exception:
+            logger.exception("Upload session sweep failed")
+        await asyncio.sleep(UPLOAD_SESSION_SWEEP_INTERVAL)
@@ -1,10 +1,12 @@
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.models import users as models
 from app.schemas import users as schemas
 from app.auth.jwt import AuthHandler
+from app.utils.hashing import check_password, hash_password
 from app.utils.utils import (
     validate_email_format,
-    get_password_hash,
+    get_password_hash,  # noqa: F401 - re-exported for existing callers
     verify_password as utils_verify_password,
 )
 from fastapi import HTTPException
@@ -27,27 +29,54 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return utils_verify_password(plain_password, hashed_password)
 
 
-# Function to register a new user
-def register_user(user: schemas.UserCreate, db: Session):
+def _add_user(db: Session, user: schemas.UserCreate, hashed_password: str):
+    user_obj = models.User(
+        username=user.username, email=user.email, hashed_password=hashed_password
+    )
+
+    db.add(user_obj)
+    db.commit()
+    db.refresh(user_obj)
+
+    return user_obj
+
+
+def _update_password_hash(db: Session, user_obj: models.User, hashed_password: str):
+    user_obj.hashed_password = hashed_password
+    db.commit()
+
+
+# Function to register a new user. Queries await the database driver and
+# bcrypt runs in the password pool, so the event loop is never blocked.
+async def register_user(user: schemas.UserCreate, db: AsyncSession):
     if not validate_email_format(user.email):
         raise HTTPException(status_code=400, detail="Invalid email")
 
     # Check if the email is already registered
-    existing_user_by_email = (
-        db.query(models.User).filter(models.User.email == user.email).first()
-    )
+    existing_user_by_email = await db.run_sync(get_user_by_email, user.email)
     if existing_user_by_email:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    # Encrypt the password
-    hashed_password = get_password_hash(user.password)
+    # Encrypt the password in the password pool, off the event loop
+    hashed_password = await hash_password(user.password)
 
-    user_obj = models.User(
-        username=user.username, email=user.email, hashed_password=hashed_password
+    return await db.run_sync(_add_user, user, hashed_password)
+
+
+# Function to check the credentials of a user, returning the user
+async def authenticate_user(credentials: schemas.UserLogin, db: AsyncSession):
+    db_user = await db.run_sync(get_user_by_email, credentials.email)
+    if not db_user:
+        raise HTTPException(status_code=401, detail="Invalid email or password.")
+
+    verified, new_hash = await check_password(
+        credentials.password, db_user.hashed_password
     )
+    if not verified:
+        raise HTTPException(status_code=401, detail="Invalid email or password.")
 
-    db.add(user_obj)
-    db.commit()
-    db.refresh(user_obj)
+    # Replacing hashes made with another bcrypt cost than BCRYPT_ROUNDS
+    if new_hash:
+        await db.run_sync(_update_password_hash, db_user, new_hash)
 
-    return user_obj
+    return db_user
@@ -1,12 +1,22 @@
+import os
+from contextlib import contextmanager
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from io import BytesIO
 
-from app.db import Base, get_db
+from app.db import Base, get_async_db, get_async_read_db, get_db, get_read_db
 from app.main import app
 from app.auth.jwt import AuthHandler
+from app.auth.dependencies import clear_user_cache
+from app.utils.sql_metrics import count_queries
+
+# Tests run on their own database: the app must not migrate or check the
+# configured one if a test starts it
+os.environ["MIGRATE_ON_STARTUP"] = "false"
+os.environ["CHECK_SCHEMA_ON_STARTUP"] = "false"
 
 # In-memory database setup for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -14,6 +24,20 @@ SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+
+
+# pysqlite only starts a transaction before writes, so the outer transaction
+# of a test and the savepoints inside it would not hold: begin explicitly
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+@event.listens_for(engine, "begin")
+def _on_begin(connection):
+    connection.exec_driver_sql("BEGIN")
+
+
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Create the tables in the test database
@@ -25,23 +49,50 @@ Base.metadata.create_all(bind=engine)
 def db():
     connection = engine.connect()
     transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
+    # Commits and rollbacks of the session stay within the outer transaction
+    session = TestingSessionLocal(
+        bind=connection, join_transaction_mode="create_savepoint"
+    )
     yield session
     session.close()
     transaction.rollback()
     connection.close()
 
 
+# Users and tokens cached by a previous test must not leak into the next one
+@pytest.fixture(autouse=True)
+def user_cache():
+    clear_user_cache()
+    AuthHandler.clear_token_cache()
+    yield
+    clear_user_cache()
+    AuthHandler.clear_token_cache()
+
+
+# Runs the work of async services on the test session, which lives inside
+# the per-test transaction of the in-memory database
+class SyncSessionRunner:
+    def __init__(self, session):
+        self.sync_session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self.sync_session, *args, **kwargs)
+
+
 # Fixture for the test client
 @pytest.fixture(scope="function")
 def client(db):
+    # The db fixture owns the session and closes it after the test
     def override_get_db():
-        try:
-            yield db
-        finally:
-            db.close()
+        yield db
+
+    async def override_get_async_db():
+        yield SyncSessionRunner(db)
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_async_read_db] = override_get_async_db
     yield TestClient(app)
 
 
@@ -54,3 +105,22 @@ def auth_handler():
 @pytest.fixture
 def test_file():
     return ("test_file.txt", BytesIO(b"test content"), "text/plain")
+
+
+# Fails the test when a block runs more queries than allowed, e.g.
+#     with assert_max_queries(3):
+#         client.get("/folders/")
+@pytest.fixture
+def assert_max_queries():
+    @contextmanager
+    def check(limit: int):
+        with count_queries() as stats:
+            yield stats
+        statements = "\n".join(
+            f"{count} x {statement}" for statement, count in stats.statements.items()
+        )
+        assert (
+            stats.count <= limit
+        ), f"{stats.count} queries, expected at most {limit}:\n{statements}"
+
+    return check
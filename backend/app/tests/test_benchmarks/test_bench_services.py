@@ -0,0 +1,40 @@
+import json
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+
+# The benchmark drives the services directly, so service changes can break it
+def test_bench_services_runs(tmp_path):
+    output = tmp_path / "run.json"
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.bench_services",
+            "--sizes",
+            "small",
+            "--iterations",
+            "1",
+            "--output",
+            str(output),
+        ],
+        cwd=BACKEND,
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    assert result.returncode == 0, result.stderr
+
+    operations = json.loads(output.read_text())["results"]["small"]["operations"]
+    assert set(operations) == {
+        "upload_user_file",
+        "create_folder_service",
+        "get_files_from_folder",
+        "get_user_folders",
+        "preview_file_from_path",
+        "delete_folder_from_path",
+    }
+    assert all(stats["iterations"] == 1 for stats in operations.values())
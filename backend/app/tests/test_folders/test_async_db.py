@@ -0,0 +1,195 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.auth.dependencies import CurrentUser
+from app.auth.jwt import AuthHandler
+from app.db import (
+    Base,
+    async_database_url,
+    get_async_db,
+    get_async_read_db,
+    get_db,
+    get_read_db,
+)
+from app.main import app
+from app.models import users as usersModels
+from app.services import storage
+from app.services.folders import (
+    create_folder_service_async,
+    get_folder_children_async,
+)
+from app.utils.pagination import PageRequest
+
+
+def test_async_database_url():
+    assert async_database_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+    assert (
+        async_database_url("postgresql://user:pw@db/app")
+        == "postgresql+asyncpg://user:pw@db/app"
+    )
+    assert (
+        async_database_url("postgresql+psycopg2://db/app")
+        == "postgresql+asyncpg://db/app"
+    )
+
+
+def test_folder_services_on_async_session(tmp_path):
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        sessions = async_sessionmaker(
+            engine, class_=AsyncSession, expire_on_commit=False
+        )
+        async with sessions() as db:
+            user = usersModels.User(
+                username="testuser", email="test@example.com", hashed_password="x"
+            )
+            db.add(user)
+            await db.commit()
+            current_user = CurrentUser(user.id, user.username, user.email)
+
+            result = await create_folder_service_async(
+                "docs/reviews", current_user, db, []
+            )
+            assert result == {"message": "Folder created successfully!"}
+
+            page = PageRequest(10, None, "name", None, True)
+            children = await get_folder_children_async("docs", db, current_user, page)
+        await engine.dispose()
+        return children
+
+    children = asyncio.run(scenario())
+    assert children.total == 1
+    assert [child["path"] for child in children.items] == ["docs/reviews"]
+
+
+# The routes on a real AsyncSession over aiosqlite, rather than the test
+# session the client fixture hands to async services
+def test_routes_on_async_engine(tmp_path):
+    url = f"sqlite:///{tmp_path / 'routes.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    sessions = sessionmaker(engine, autoflush=False)
+    # Each request of the test client runs in a new event loop, so aiosqlite
+    # connections are not pooled across requests
+    async_engine = create_async_engine(async_database_url(url), poolclass=NullPool)
+    async_sessions = async_sessionmaker(
+        async_engine, class_=AsyncSession, autoflush=False
+    )
+
+    def override_get_db():
+        with sessions() as db:
+            yield db
+
+    async def override_get_async_db():
+        async with async_sessions() as db:
+            yield db
+
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides.update(
+        {
+            get_db: override_get_db,
+            get_read_db: override_get_db,
+            get_async_db: override_get_async_db,
+            get_async_read_db: override_get_async_db,
+        }
+    )
+    try:
+        client = TestClient(app)
+        credentials = {"email": "async@example.com", "password": "secret123"}
+        response = client.post("/register/", json={"username": "a", **credentials})
+        assert response.status_code == 200
+        response = client.post("/login/", json=credentials)
+        assert response.status_code == 200
+        client.cookies.set("access_token", response.cookies["access_token"])
+
+        response = client.post("/create_folder/", data={"folder_path": "docs"})
+        assert response.status_code == 200
+        for content in (b"first", b"second"):
+            response = client.post(
+                "/upload/docs", files={"file": ("notes.txt", content, "text/plain")}
+            )
+            assert response.status_code == 200
+
+        response = client.get("/folder/docs/files/")
+        assert [file["filename"] for file in response.json()] == [
+            "notes.txt",
+            "notes_v1.txt",
+        ]
+        assert client.get("/download/docs/notes_v1.txt").content == b"second"
+        assert client.get("/folder/docs/notes.txt").content == b"first"
+        assert client.get("/download/docs/missing.txt").status_code == 404
+
+        # Routes that used to run on a sync session in the threadpool
+        response = client.post(
+            "/upload_sessions/",
+            json={"folder_path": "docs", "filename": "big.bin", "size": 3},
+        )
+        upload_id = response.json()["upload_id"]
+        client.put(f"/upload_sessions/{upload_id}?offset=0", content=b"abc")
+        assert client.get(f"/upload_sessions/{upload_id}").json()["offset"] == 3
+        response = client.post(f"/upload_sessions/{upload_id}/complete")
+        assert response.json()["file"] == "big.bin"
+        assert client.get("/download/docs/big.bin").content == b"abc"
+
+        response = client.get("/search/", params={"q": "notes"})
+        assert len(response.json()) == 2
+        operations = [
+            {"op": "delete_file", "folder_path": "docs", "filename": "big.bin"}
+        ]
+        response = client.post("/batch/", json={"operations": operations})
+        trash_id = response.json()["results"][0]["result"]["trash_id"]
+        assert [entry["id"] for entry in client.get("/trash/").json()] == [trash_id]
+        assert client.post(f"/trash/{trash_id}/restore").status_code == 200
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(overrides)
+        asyncio.run(async_engine.dispose())
+        engine.dispose()
+
+
+# Blob files are moved and removed in the threadpool, never in a commit made
+# on the event loop
+def test_file_changes_run_off_the_event_loop(client, db, monkeypatch):
+    calls = []
+
+    def recorded(fn):
+        def wrapper(*args):
+            try:
+                asyncio.get_running_loop()
+                calls.append((fn.__name__, "event loop"))
+            except RuntimeError:
+                calls.append((fn.__name__, "thread"))
+            return fn(*args)
+
+        return wrapper
+
+    monkeypatch.setattr(storage, "_place", recorded(storage._place))
+    monkeypatch.setattr(storage, "_discard", recorded(storage._discard))
+
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    db.add(user)
+    db.commit()
+    token = AuthHandler().create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+
+    client.post("/create_folder/", data={"folder_path": "docs"})
+    for name in ("a.txt", "b.txt"):
+        response = client.post(
+            "/upload/docs", files={"file": (name, b"same content", "text/plain")}
+        )
+        assert response.status_code == 200
+
+    # The first upload is placed, the staged copy of the second is dropped
+    assert ("_place", "thread") in calls
+    assert ("_discard", "thread") in calls
+    assert all(where == "thread" for _, where in calls)
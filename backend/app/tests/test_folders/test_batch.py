@@ -0,0 +1,152 @@
+from io import BytesIO
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.models import users as usersModels, folders as foldersModels
+from app.services import batch
+
+
+def test_batch_operations(client, db, auth_handler):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    db.add(user)
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+    client.post(
+        "/create_folder/",
+        data={"folder_path": "inbox"},
+        files=[
+            ("files", ("a.txt", BytesIO(b"aaa"), "text/plain")),
+            ("files", ("b.txt", BytesIO(b"bbbb"), "text/plain")),
+            ("files", ("c.txt", BytesIO(b"cc"), "text/plain")),
+        ],
+    )
+    client.post("/create_folder/", data={"folder_path": "archive/old"})
+
+    response = client.post(
+        "/batch/",
+        json={
+            "operations": [
+                {"op": "stat_file", "folder_path": "inbox", "filename": "b.txt"},
+                {"op": "delete_file", "folder_path": "inbox", "filename": "a.txt"},
+                {"op": "delete_file", "folder_path": "inbox", "filename": "zzz.txt"},
+                {
+                    "op": "move_file",
+                    "folder_path": "inbox",
+                    "filename": "c.txt",
+                    "target_folder_path": "archive",
+                },
+                {"op": "list_folder", "folder_path": "inbox"},
+                {"op": "delete_folder", "folder_path": "archive"},
+                {"op": "list_folder", "folder_path": "archive/old"},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+
+    assert [result["status"] for result in results] == [200, 202, 404, 200, 200, 202, 404]
+    assert results[0]["result"]["size"] == 4
+    assert results[2]["detail"] == "File not found."
+    assert results[3]["result"] == {"filename": "c.txt", "revision": 0}
+    assert [file["filename"] for file in results[4]["result"]["files"]] == ["b.txt"]
+
+    # The successful operations were committed together
+    assert [entry["path"] for entry in client.get("/trash/").json()] == [
+        "archive",
+        "inbox/a.txt",
+    ]
+    moved = db.query(foldersModels.File).filter_by(filename="c.txt").one()
+    archive = db.query(foldersModels.Folder).filter_by(path="archive").one()
+    assert moved.folder_id == archive.id
+
+
+def test_move_revision_to_folder_with_same_document(client, db, auth_handler):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    db.add(user)
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+    client.post("/create_folder/", data={"folder_path": "drafts"})
+    client.post("/create_folder/", data={"folder_path": "final"})
+    for folder, content in (("drafts", b"one"), ("drafts", b"two"), ("final", b"x")):
+        client.post(f"/upload/{folder}", files={"file": ("a.txt", BytesIO(content))})
+
+    response = client.post(
+        "/batch/",
+        json={
+            "operations": [
+                {
+                    "op": "move_file",
+                    "folder_path": "drafts",
+                    "filename": "a_v1.txt",
+                    "target_folder_path": "final",
+                }
+            ]
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["results"][0]["result"] == {
+        "filename": "a_v1.txt",
+        "revision": 1,
+    }
+
+    final = db.query(foldersModels.Folder).filter_by(path="final").one()
+    moved = db.query(foldersModels.File).filter_by(folder_id=final.id, revision=1).one()
+    assert moved.base_name == "a"
+    assert client.get("/download/final/a_v1.txt").content == b"two"
+
+
+def test_database_errors_are_reported_per_operation(
+    client, db, auth_handler, monkeypatch
+):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    db.add(user)
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+    client.post(
+        "/create_folder/",
+        data={"folder_path": "inbox"},
+        files=[
+            ("files", ("a.txt", BytesIO(b"aaa"), "text/plain")),
+            ("files", ("b.txt", BytesIO(b"bbbb"), "text/plain")),
+        ],
+    )
+
+    # The first two deletes fail after changing the file
+    errors = [
+        IntegrityError("UPDATE files", {}, Exception("constraint failed")),
+        OperationalError("UPDATE files", {}, Exception("disk I/O error")),
+    ]
+    trash_file = batch.trash_file
+
+    def failing_trash_file(db, folder, file):
+        if not errors:
+            return trash_file(db, folder, file)
+        file.filename = "renamed.txt"
+        db.flush()
+        raise errors.pop(0)
+
+    monkeypatch.setattr(batch, "trash_file", failing_trash_file)
+    operations = [
+        {"op": "delete_file", "folder_path": "inbox", "filename": name}
+        for name in ("a.txt", "a.txt", "b.txt")
+    ]
+    response = client.post("/batch/", json={"operations": operations})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == [409, 500, 202]
+
+    # Only the failing operations were rolled back
+    files = client.get("/folder/inbox/files/").json()
+    assert [file["filename"] for file in files] == ["a.txt"]
@@ -0,0 +1,108 @@
+import os
+from io import BytesIO
+from app.models import users as usersModels, folders as foldersModels
+from app.services import storage
+from app.services.storage import (
+    FileChanges,
+    blob_path,
+    release_blob,
+    staging_path,
+    store_blob,
+    write_stream,
+)
+from app.services.trash import purge_trash_entry
+
+
+def test_identical_uploads_share_one_blob(client, db, auth_handler):
+    # Create a test user with two folders
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="hashed"
+    )
+    db.add(user)
+    db.commit()
+    db.add(foldersModels.Folder(path="folder1", user_id=user.id))
+    db.add(foldersModels.Folder(path="folder2", user_id=user.id))
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+
+    # Upload the same content three times, across revisions and folders
+    for folder_name in ["folder1", "folder1", "folder2"]:
+        response = client.post(
+            f"/upload/{folder_name}",
+            files={"file": ("report.txt", BytesIO(b"same content"), "text/plain")},
+        )
+        assert response.status_code == 200
+
+    blobs = db.query(foldersModels.Blob).all()
+    assert len(blobs) == 1
+    assert blobs[0].refcount == 3
+    blob_file = db.query(foldersModels.File).first().file_path
+    assert os.path.exists(blob_file)
+
+    # Deleting a revision keeps the content while other revisions use it
+    response = client.delete("/delete_file/folder1/report_v1.txt")
+    assert response.status_code == 202
+    purge_trash_entry(db, response.json()["trash_id"])
+    db.expire_all()
+    assert db.query(foldersModels.Blob).one().refcount == 2
+    assert os.path.exists(blob_file)
+
+    # Deleting the remaining references unlinks the content
+    for url in ("/delete_file/folder1/report.txt", "/delete_folder/folder2"):
+        response = client.delete(url)
+        assert response.status_code == 202
+        purge_trash_entry(db, response.json()["trash_id"])
+    db.expire_all()
+    assert db.query(foldersModels.Blob).count() == 0
+    assert not os.path.exists(blob_file)
+
+
+def _staged(content: bytes):
+    return write_stream(BytesIO(content), staging_path())
+
+
+def test_rolled_back_upload_leaves_no_content(db):
+    stored = _staged(b"never committed")
+    store_blob(db, stored)
+    db.rollback()
+
+    assert not os.path.exists(stored.path)
+    assert not os.path.exists(blob_path(stored.sha256))
+    assert db.query(foldersModels.Blob).count() == 0
+
+
+def test_released_content_stored_again_is_kept(db):
+    blob = store_blob(db, _staged(b"stored twice"))
+    db.commit()
+    path = blob_path(blob.sha256)
+    assert os.path.exists(path)
+
+    # The last reference goes while the same content is uploaded again
+    release_blob(db, blob.id)
+    store_blob(db, _staged(b"stored twice"))
+    db.commit()
+    assert os.path.exists(path)
+
+    release_blob(db, db.query(foldersModels.Blob).one().id)
+    db.commit()
+    assert not os.path.exists(path)
+
+
+# Released content is set aside before the database is checked, and put back
+# if a concurrent upload stored the same content again in the meantime
+def test_released_content_is_set_aside_then_settled(db):
+    blob = store_blob(db, _staged(b"set aside"))
+    db.commit()
+    path = blob_path(blob.sha256)
+
+    released = storage._move_files(FileChanges([], [], [blob.sha256], []))
+    assert not os.path.exists(path)
+    storage._settle_released(released, {blob.sha256})
+    assert os.path.exists(path)
+
+    released = storage._move_files(FileChanges([], [], [blob.sha256], []))
+    storage._settle_released(released, set())
+    assert not os.path.exists(path)
+    assert not any(os.path.exists(set_aside) for set_aside in released.values())
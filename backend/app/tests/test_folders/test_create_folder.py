@@ -49,3 +49,57 @@ def test_create_folder(client, db):
     assert os.path.exists(user_folder_path)
 
     os.rmdir(user_folder_path)
+
+
+def test_create_folder_with_files_batch(client, db):
+    # Create a test user in the database
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="hashed"
+    )
+    db.add(user)
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+
+    # Several files, including revisions of the same document in one batch
+    files = [
+        ("files", ("notes.txt", b"first", "text/plain")),
+        ("files", ("notes.txt", b"second", "text/plain")),
+        ("files", ("data.csv", b"a,b", "text/csv")),
+        ("files", ("notes.txt", b"third", "text/plain")),
+    ]
+    response = client.post(
+        "/create_folder/", data={"folder_path": "batch_folder"}, files=files
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["message"] == "Files uploaded successfully!"
+    assert [(f["filename"], f["stored_as"], f["revision"]) for f in body["files"]] == [
+        ("notes.txt", "notes.txt", 0),
+        ("notes.txt", "notes_v1.txt", 1),
+        ("data.csv", "data.csv", 0),
+        ("notes.txt", "notes_v2.txt", 2),
+    ]
+
+    # Uploading again continues each document's revisions
+    response = client.post(
+        "/create_folder/",
+        data={"folder_path": "batch_folder"},
+        files=[("files", ("notes.txt", b"fourth", "text/plain"))],
+    )
+    assert response.json()["files"][0]["stored_as"] == "notes_v3.txt"
+
+    folder_id = (
+        db.query(foldersModels.Folder.id)
+        .filter(foldersModels.Folder.path == "batch_folder")
+        .scalar()
+    )
+    assert (
+        db.query(foldersModels.File)
+        .filter(foldersModels.File.folder_id == folder_id)
+        .count()
+        == 5
+    )
+    os.rmdir(os.path.join("uploads", "test@example.com", "batch_folder"))
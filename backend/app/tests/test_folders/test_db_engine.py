@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.db import create_db_engine
+
+
+def test_sqlite_engine_applies_pragmas(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() > 0
+    assert engine.pool.size() > 0
+    engine.dispose()
+
+
+def test_read_engine_rejects_writes(tmp_path):
+    url = f"sqlite:///{tmp_path / 'app.db'}"
+    engine = create_db_engine(url)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY)"))
+
+    read_engine = create_db_engine(url, read_only=True)
+    with read_engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM items")).scalar() == 0
+        with pytest.raises(OperationalError):
+            connection.execute(text("INSERT INTO items (id) VALUES (1)"))
+    read_engine.dispose()
+    engine.dispose()
+
+
+def test_memory_sqlite_skips_pool_settings():
+    engine = create_db_engine("sqlite:///:memory:")
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "memory"
+    engine.dispose()
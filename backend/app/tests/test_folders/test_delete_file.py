@@ -1,6 +1,7 @@
 import os
 from app.models import users as usersModels, folders as foldersModels
 from app.auth.jwt import AuthHandler
+from app.services.trash import purge_trash_entry
 
 auth_handler = AuthHandler()
 
@@ -50,8 +51,16 @@ def test_delete_file_success(client, db, auth_handler):
     )
 
     # Verify the response
-    assert response.status_code == 200
+    assert response.status_code == 202
     assert response.json()["message"] == "File 'test_file.txt' successfully deleted!"
+    trash_id = response.json()["trash_id"]
+
+    # The file is hidden right away and removed by the purger
+    response = client.get(
+        "/folder/test_folder/files/", cookies={"access_token": token}
+    )
+    assert response.json() == []
+    purge_trash_entry(db, trash_id)
 
     # Check if the file was removed from the database
     deleted_file = (
@@ -1,6 +1,14 @@
 import os
+from datetime import datetime, timedelta
+from io import BytesIO
 from app.models import users as usersModels, folders as foldersModels
 from app.auth.jwt import AuthHandler
+from app.services.storage import session_path
+from app.services.trash import (
+    _remove_empty_dirs,
+    purge_expired_trash,
+    purge_trash_entry,
+)
 
 auth_handler = AuthHandler()
 
@@ -30,6 +38,7 @@ def test_delete_folder_success(client, db, auth_handler):
     )
     db.add(test_file)
     db.commit()
+    folder_id, file_id = test_folder.id, test_file.id
 
     # Create the folder and file in the file system
     folder_full_path = os.path.join("uploads", user.email, "test_folder")
@@ -44,18 +53,24 @@ def test_delete_folder_success(client, db, auth_handler):
     response = client.delete(
         "/delete_folder/test_folder", cookies={"access_token": token}
     )
+    trash_id = response.json()["trash_id"]
 
     # Verify the response
-    assert response.status_code == 200
+    assert response.status_code == 202
     assert (
         response.json()["message"]
         == "Folder 'test_folder' and its files were successfully deleted!"
     )
 
+    # The folder is hidden right away and removed by the purger
+    response = client.get("/folders/", cookies={"access_token": token})
+    assert response.json() == []
+    purge_trash_entry(db, trash_id)
+
     # Check if the folder was removed from the database
     deleted_folder = (
         db.query(foldersModels.Folder)
-        .filter(foldersModels.Folder.id == test_folder.id)
+        .filter(foldersModels.Folder.id == folder_id)
         .first()
     )
     assert deleted_folder is None
@@ -63,7 +78,7 @@ def test_delete_folder_success(client, db, auth_handler):
     # Check if the file was removed from the database
     deleted_file = (
         db.query(foldersModels.File)
-        .filter(foldersModels.File.id == test_file.id)
+        .filter(foldersModels.File.id == file_id)
         .first()
     )
     assert deleted_file is None
@@ -94,3 +109,112 @@ def test_delete_folder_not_found(client, db, auth_handler):
     # Verify the response
     assert response.status_code == 404
     assert response.json()["detail"] == "Folder not found."
+
+
+def test_delete_folder_removes_subtree(client, db, auth_handler):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    db.add(user)
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+    for path in ("docs/reviews/2024", "docs_old"):
+        response = client.post("/create_folder/", data={"folder_path": path})
+        assert response.status_code == 200
+
+    response = client.delete("/delete_folder/docs")
+    assert response.status_code == 202
+
+    response = client.get("/folders/")
+    assert [folder["path"] for folder in response.json()] == ["docs_old"]
+
+
+def test_restore_folder_from_trash(client, db, auth_handler):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    db.add(user)
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+    client.post(
+        "/create_folder/",
+        data={"folder_path": "docs/reviews"},
+        files=[("files", ("a.txt", BytesIO(b"content"), "text/plain"))],
+    )
+
+    trash_id = client.delete("/delete_folder/docs").json()["trash_id"]
+    assert client.get("/folder/docs/reviews/files/").status_code == 403
+    assert [entry["path"] for entry in client.get("/trash/").json()] == ["docs"]
+
+    # The path is free again while the folder sits in the trash
+    assert client.post("/create_folder/", data={"folder_path": "docs"}).status_code == 200
+    assert client.post(f"/trash/{trash_id}/restore").status_code == 409
+    client.delete("/delete_folder/docs")
+
+    response = client.post(f"/trash/{trash_id}/restore")
+    assert response.status_code == 200
+    files = client.get("/folder/docs/reviews/files/").json()
+    assert [file["filename"] for file in files] == ["a.txt"]
+
+    # Entries due for purge can no longer be restored
+    trash_id = client.delete("/delete_folder/docs").json()["trash_id"]
+    db.query(foldersModels.Trash).update(
+        {"purge_after": datetime.utcnow() - timedelta(seconds=1)}
+    )
+    db.commit()
+    assert client.post(f"/trash/{trash_id}/restore").status_code == 410
+
+    assert purge_expired_trash(db, delay=0) == 2
+    assert db.query(foldersModels.Folder).count() == 0
+    assert db.query(foldersModels.File).count() == 0
+    assert db.query(foldersModels.Blob).count() == 0
+
+
+def test_purge_takes_upload_sessions_and_trashed_files(client, db, auth_handler):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    db.add(user)
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+    client.post(
+        "/create_folder/",
+        data={"folder_path": "docs"},
+        files=[("files", ("a.txt", BytesIO(b"content"), "text/plain"))],
+    )
+    upload_id = client.post(
+        "/upload_sessions/", json={"folder_path": "docs", "filename": "big.txt"}
+    ).json()["upload_id"]
+    file_trash_id = client.delete("/delete_file/docs/a.txt").json()["trash_id"]
+    folder_trash_id = client.delete("/delete_folder/docs").json()["trash_id"]
+
+    purge_trash_entry(db, folder_trash_id)
+    assert db.query(foldersModels.Folder).count() == 0
+    assert db.query(foldersModels.UploadSession).count() == 0
+    assert not os.path.exists(session_path(upload_id))
+
+    # The file went with its folder, so its own entry has nothing to restore
+    response = client.post(f"/trash/{file_trash_id}/restore")
+    assert response.status_code == 410
+    assert response.json()["detail"] == "Trash entry content was purged."
+
+
+def test_purge_keeps_directories_outside_the_user_root(tmp_path):
+    user_root = tmp_path / "user"
+    (user_root / "docs" / "empty").mkdir(parents=True)
+    (tmp_path / "other" / "empty").mkdir(parents=True)
+
+    _remove_empty_dirs(str(user_root), str(user_root / ".." / "other"))
+    _remove_empty_dirs(str(user_root), str(user_root))
+    assert (tmp_path / "other" / "empty").is_dir()
+    assert (user_root / "docs" / "empty").is_dir()
+
+    _remove_empty_dirs(str(user_root), str(user_root / "docs"))
+    assert not (user_root / "docs").exists()
+    assert user_root.is_dir()
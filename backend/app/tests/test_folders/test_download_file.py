@@ -1,6 +1,7 @@
 import os
 from app.models import users as usersModels, folders as foldersModels
 from app.auth.jwt import AuthHandler
+from app.utils.http import parse_range
 
 auth_handler = AuthHandler()
 UPLOAD_FOLDER = "uploads"
@@ -86,3 +87,75 @@ def test_download_file_not_found(client, db):
 
     assert response.status_code == 404
     assert response.json() == {"detail": "File not found."}
+
+
+def test_download_file_ranges_and_validators(client, db):
+    # Create a user and folder, then upload a file
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="hashed"
+    )
+    db.add(user)
+    db.commit()
+    db.add(foldersModels.Folder(path="test_folder", user_id=user.id))
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+    content = b"0123456789abcdefghij"
+    client.post(
+        "/upload/test_folder", files={"file": ("data.txt", content, "text/plain")}
+    )
+
+    # Full download carries a strong ETag derived from the content hash
+    response = client.get("/download/test_folder/data.txt")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert etag.startswith('"') and len(etag) == 66
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+    # Conditional GET
+    response = client.get(
+        "/download/test_folder/data.txt", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    response = client.get(
+        "/download/test_folder/data.txt",
+        headers={"If-Modified-Since": response.headers["Last-Modified"]},
+    )
+    assert response.status_code == 304
+
+    # Single range
+    response = client.get(
+        "/download/test_folder/data.txt", headers={"Range": "bytes=2-5"}
+    )
+    assert response.status_code == 206
+    assert response.content == content[2:6]
+    assert response.headers["Content-Range"] == "bytes 2-5/20"
+
+    # Suffix and multiple ranges
+    response = client.get(
+        "/download/test_folder/data.txt", headers={"Range": "bytes=-3"}
+    )
+    assert response.content == content[-3:]
+    response = client.get(
+        "/download/test_folder/data.txt", headers={"Range": "bytes=0-1,10-11"}
+    )
+    assert response.status_code == 206
+    assert response.headers["Content-Type"].startswith("multipart/byteranges")
+    assert b"Content-Range: bytes 0-1/20\r\n\r\n01\r\n" in response.content
+    assert b"Content-Range: bytes 10-11/20\r\n\r\nab\r\n" in response.content
+
+    # Unsatisfiable range
+    response = client.get(
+        "/download/test_folder/data.txt", headers={"Range": "bytes=50-"}
+    )
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == "bytes */20"
+    assert parse_range("bytes=-5", 0) == []
+    assert parse_range("bytes=0-", 0) == []
+
+    # Explicit revisions are immutable in the preview route
+    response = client.get("/folder/test_folder/data.txt?review=0")
+    assert response.status_code == 200
+    assert "immutable" in response.headers["Cache-Control"]
+    assert response.content == content
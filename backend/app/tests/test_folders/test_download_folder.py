@@ -0,0 +1,95 @@
+import io
+import zipfile
+from datetime import datetime
+
+from app.auth.jwt import AuthHandler
+from app.models import users as usersModels
+from app.utils.zipstream import ZipEntry, stream_zip
+
+auth_handler = AuthHandler()
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8
+
+
+def _login(client, db):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="hashed"
+    )
+    db.add(user)
+    db.commit()
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+
+
+def _upload(client, folder, filename, content):
+    client.post(f"/upload/{folder}", files={"file": (filename, content, "x/y")})
+
+
+def _archive(response) -> zipfile.ZipFile:
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/zip"
+    return zipfile.ZipFile(io.BytesIO(response.content))
+
+
+def test_download_folder_as_zip(client, db):
+    _login(client, db)
+    client.post("/create_folder/", data={"folder_path": "project/src/empty"})
+    _upload(client, "project", "notes.txt", b"first draft\n")
+    _upload(client, "project", "notes.txt", b"second draft\n")
+    _upload(client, "project", "logo.png", PNG)
+    _upload(client, "project/src", "main.py", b"print('hello')\n" * 100)
+
+    # The folder itself, every revision
+    archive = _archive(client.get("/download_folder/project"))
+    assert archive.namelist() == ["logo.png", "notes.txt", "notes_v1.txt"]
+    assert archive.read("notes.txt") == b"first draft\n"
+    assert "project.zip" in client.get("/download_folder/project").headers[
+        "Content-Disposition"
+    ]
+
+    # Compressed formats are stored, the rest deflated
+    assert archive.getinfo("logo.png").compress_type == zipfile.ZIP_STORED
+    assert archive.getinfo("notes.txt").compress_type == zipfile.ZIP_DEFLATED
+    assert archive.read("logo.png") == PNG
+
+    # Subfolders and latest revisions only
+    response = client.get("/download_folder/project?recursive=true&latest_only=true")
+    archive = _archive(response)
+    assert archive.namelist() == [
+        "logo.png",
+        "notes_v1.txt",
+        "src/",
+        "src/main.py",
+        "src/empty/",
+    ]
+    assert archive.read("src/main.py") == b"print('hello')\n" * 100
+    assert archive.testzip() is None
+
+
+def test_download_missing_folder(client, db):
+    _login(client, db)
+    response = client.get("/download_folder/nowhere")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Folder not found."}
+
+
+def test_stream_zip_uses_zip64_past_the_limits(tmp_path, monkeypatch):
+    # Lower the limits so a small archive needs ZIP64 records
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 1000)
+    monkeypatch.setattr(zipfile, "ZIP_FILECOUNT_LIMIT", 3)
+    content = b"0123456789" * 200
+    source = tmp_path / "data.txt"
+    source.write_bytes(content)
+
+    modified = datetime(2024, 1, 1)
+    entries = [
+        ZipEntry(f"data{n}.txt", str(source), len(content), modified)
+        for n in range(5)
+    ]
+    data = b"".join(stream_zip(entries))
+    monkeypatch.undo()
+
+    assert b"PK\x06\x06" in data  # ZIP64 end of central directory
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert len(archive.namelist()) == 5
+    assert all(archive.read(name) == content for name in archive.namelist())
@@ -0,0 +1,97 @@
+from io import BytesIO
+
+from app.models import users as usersModels, folders as foldersModels
+
+
+def test_folder_tree_children_and_size(client, db, auth_handler):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    db.add(user)
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+
+    # Creating a nested folder creates its ancestors
+    response = client.post(
+        "/create_folder/",
+        data={"folder_path": "docs/reviews/2024"},
+        files=[("files", ("a.txt", BytesIO(b"12345"), "text/plain"))],
+    )
+    assert response.status_code == 200
+    client.post(
+        "/create_folder/",
+        data={"folder_path": "docs/specs"},
+        files=[
+            ("files", ("b.txt", BytesIO(b"123"), "text/plain")),
+            ("files", ("c.txt", BytesIO(b"1234567"), "text/plain")),
+        ],
+    )
+    client.post("/create_folder/", data={"folder_path": "music"})
+
+    folders = {
+        folder.path: folder for folder in db.query(foldersModels.Folder).all()
+    }
+    assert set(folders) == {
+        "docs",
+        "docs/reviews",
+        "docs/reviews/2024",
+        "docs/specs",
+        "music",
+    }
+    assert folders["docs/reviews/2024"].parent_id == folders["docs/reviews"].id
+    assert folders["docs"].parent_id is None
+
+    # Root children
+    response = client.get("/folder_children/")
+    assert [child["path"] for child in response.json()] == ["docs", "music"]
+
+    # Immediate children with their own counts
+    response = client.get("/folder_children/docs")
+    assert response.status_code == 200
+    assert response.json() == [
+        {
+            "id": folders["docs/reviews"].id,
+            "path": "docs/reviews",
+            "name": "reviews",
+            "folder_count": 1,
+            "file_count": 0,
+        },
+        {
+            "id": folders["docs/specs"].id,
+            "path": "docs/specs",
+            "name": "specs",
+            "folder_count": 0,
+            "file_count": 2,
+        },
+    ]
+    response = client.get("/folder_children/docs", params={"prefix": "sp"})
+    assert [child["name"] for child in response.json()] == ["specs"]
+
+    # Subtree totals
+    response = client.get("/folder_size/docs")
+    assert response.json() == {"path": "docs", "folders": 3, "files": 3, "bytes": 15}
+
+    assert client.get("/folder_children/missing").status_code == 404
+
+
+def test_unsafe_folder_paths_are_rejected(client, db, auth_handler):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    db.add(user)
+    db.commit()
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+
+    for path in ("../escape", "docs/../../escape", "docs/./x", "C:/x", "a\\..\\b"):
+        response = client.post("/create_folder/", data={"folder_path": path})
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Invalid folder path."}
+    assert db.query(foldersModels.Folder).count() == 0
+
+    # Surrounding and repeated slashes are still accepted
+    response = client.post("/create_folder/", data={"folder_path": "/docs//specs/"})
+    assert response.status_code == 200
+    assert client.get("/folder_size/docs/specs").json()["path"] == "docs/specs"
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 from app.models import users as usersModels, folders as foldersModels
@@ -93,3 +95,124 @@ def test_get_files_in_folder_unauthenticated(client: TestClient):
 
     assert response.status_code == 401
     assert response.json()["detail"] == "Token not found"
+
+
+def test_get_files_in_folder_paginated(
+    client: TestClient, db: Session, auth_handler: AuthHandler
+):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    db.add(user)
+    db.commit()
+    test_folder = foldersModels.Folder(path="test_folder", user_id=user.id)
+    db.add(test_folder)
+    db.commit()
+
+    for index in range(5):
+        db.add(
+            foldersModels.File(
+                filename=f"report_v{index}.txt",
+                file_path=f"/test_folder/report_v{index}.txt",
+                folder_id=test_folder.id,
+                user_id=user.id,
+                revision=index,
+            )
+        )
+    db.add(
+        foldersModels.File(
+            filename="notes.txt",
+            file_path="/test_folder/notes.txt",
+            folder_id=test_folder.id,
+            user_id=user.id,
+        )
+    )
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": "test@example.com"})
+    client.cookies.set("access_token", token)
+
+    # Walk the pages following the cursor
+    names = []
+    params = {"limit": 2, "prefix": "report", "sort": "-revision", "include_total": True}
+    while True:
+        response = client.get("/folder/test_folder/files/", params=params)
+        assert response.status_code == 200
+        assert response.headers["x-total-count"] == "5"
+        names += [file["filename"] for file in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+        params["cursor"] = cursor
+
+    assert names == [f"report_v{index}.txt" for index in reversed(range(5))]
+
+    # A cursor is bound to the sort order that produced it
+    response = client.get(
+        "/folder/test_folder/files/", params={"cursor": params["cursor"]}
+    )
+    assert response.status_code == 400
+
+    response = client.get("/folder/test_folder/files/", params={"sort": "size"})
+    assert response.status_code == 400
+
+
+def test_pagination_keeps_null_sort_values(
+    client: TestClient, db: Session, auth_handler: AuthHandler
+):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    db.add(user)
+    db.commit()
+    test_folder = foldersModels.Folder(path="test_folder", user_id=user.id)
+    db.add(test_folder)
+    db.commit()
+
+    # Files stored before upload dates were recorded have none
+    dates = [None, datetime(2024, 1, 2), None, datetime(2024, 1, 1), None]
+    for index, uploaded_at in enumerate(dates):
+        db.add(
+            foldersModels.File(
+                filename=f"file{index}.txt",
+                file_path=f"/test_folder/file{index}.txt",
+                folder_id=test_folder.id,
+                user_id=user.id,
+                uploaded_at=uploaded_at,
+            )
+        )
+    db.commit()
+    db.query(foldersModels.File).filter(
+        foldersModels.File.filename.in_(["file0.txt", "file2.txt", "file4.txt"])
+    ).update({"uploaded_at": None}, synchronize_session=False)
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": "test@example.com"})
+    client.cookies.set("access_token", token)
+
+    def walk(sort):
+        names = []
+        params = {"limit": 2, "sort": sort}
+        while True:
+            response = client.get("/folder/test_folder/files/", params=params)
+            assert response.status_code == 200
+            names += [file["filename"] for file in response.json()]
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                return names
+            params["cursor"] = cursor
+
+    ascending = ["file0.txt", "file2.txt", "file4.txt", "file3.txt", "file1.txt"]
+    assert walk("uploaded_at") == ascending
+    assert walk("-uploaded_at") == [
+        "file1.txt",
+        "file3.txt",
+        "file4.txt",
+        "file2.txt",
+        "file0.txt",
+    ]
+
+    # Without a limit or a cursor, the whole listing comes in one response
+    response = client.get("/folder/test_folder/files/", params={"sort": "uploaded_at"})
+    assert [file["filename"] for file in response.json()] == ascending
+    assert "x-next-cursor" not in response.headers
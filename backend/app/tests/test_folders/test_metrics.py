@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+from prometheus_client.parser import text_string_to_metric_families
+from sqlalchemy.orm import Session
+
+from app.auth.jwt import AuthHandler
+from app.models import folders as foldersModels, users as usersModels
+
+
+def _samples(text: str) -> dict:
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(text)
+        for sample in family.samples
+    }
+
+
+def _sample(samples: dict, name: str, **labels) -> float:
+    return samples.get((name, tuple(sorted(labels.items()))), 0)
+
+
+def test_metrics_endpoint(
+    client: TestClient, db: Session, auth_handler: AuthHandler, test_file
+):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    db.add(user)
+    db.commit()
+    db.add(foldersModels.Folder(path="docs", user_id=user.id))
+    db.commit()
+    cookies = {"access_token": auth_handler.create_access_token({"sub": user.email})}
+
+    before = _samples(client.get("/metrics").text)
+    client.post("/upload/docs", files={"file": test_file}, cookies=cookies)
+    response = client.get("/download/docs/test_file.txt", cookies=cookies)
+    assert response.content == b"test content"
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    after = _samples(response.text)
+
+    # Latency is labelled by route template, not by the requested path
+    route = "/download/{folder_path:path}/{filename}"
+    count = "http_request_duration_seconds_count"
+    labels = {"method": "GET", "route": route, "status": "200"}
+    assert _sample(after, count, **labels) == _sample(before, count, **labels) + 1
+
+    for direction in ("upload", "download"):
+        name = "file_transfer_bytes_total"
+        assert (
+            _sample(after, name, direction=direction)
+            - _sample(before, name, direction=direction)
+            == len(b"test content")
+        )
+    assert ("db_pool_connections_checked_out", (("pool", "primary"),)) in after
+
+
+def test_metrics_are_merged_across_processes(tmp_path):
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    record = (
+        "from app.utils.metrics import record_transfer; "
+        "record_transfer('upload', 100)"
+    )
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", record], env=env, check=True)
+
+    scrape = (
+        "from app.utils.metrics import metrics_response; "
+        "print(metrics_response().body.decode())"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", scrape],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    samples = _samples(output)
+    assert _sample(samples, "file_transfer_bytes_total", direction="upload") == 200
@@ -0,0 +1,113 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import main
+from app.db import Base
+from app.migrations import (
+    SchemaDriftError,
+    check_schema,
+    pending_migrations,
+    run_migrations,
+    schema_drift,
+)
+from app.migrations.versions import v0001_baseline
+
+
+def test_migrations_build_the_model_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+
+    assert len(run_migrations(engine)) > 0
+    assert schema_drift(engine) == []
+    # Already applied migrations are skipped
+    assert run_migrations(engine) == []
+    engine.dispose()
+
+
+def test_migrations_upgrade_a_legacy_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    v0001_baseline.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            text("INSERT INTO users (id, username, email) VALUES (1, 'u', 'u@x')")
+        )
+        connection.execute(
+            text("INSERT INTO folders (id, path, user_id) VALUES (7, 'docs/q1', 1)")
+        )
+        connection.execute(
+            text(
+                "INSERT INTO files (filename, file_path, user_id, folder_id, revision)"
+                " VALUES ('report.pdf', 'uploads/report.pdf', 1, 7, 0),"
+                " ('report_v1.pdf', 'uploads/report_v1.pdf', 1, 7, 1),"
+                " ('notes_v1', 'uploads/notes_v1', 1, 7, 0)"
+            )
+        )
+
+    run_migrations(engine)
+    check_schema(engine)
+
+    with engine.begin() as connection:
+        folders = dict(
+            connection.execute(text("SELECT path, parent_id FROM folders")).all()
+        )
+        docs_id = connection.execute(
+            text("SELECT id FROM folders WHERE path = 'docs'")
+        ).scalar()
+        assert folders == {"docs": None, "docs/q1": docs_id}
+
+        # Existing files belong to their document
+        base_names = dict(
+            connection.execute(text("SELECT filename, base_name FROM files")).all()
+        )
+        assert base_names == {
+            "report.pdf": "report",
+            "report_v1.pdf": "report",
+            "notes_v1": "notes_v1",
+        }
+
+        # Existing files are searchable
+        assert connection.execute(
+            text("SELECT rowid FROM files_fts WHERE files_fts MATCH 'report'")
+        ).all()
+
+        # A trashed folder no longer blocks its path
+        connection.execute(
+            text(
+                "INSERT INTO trash (id, user_id, kind, path, deleted_at, purge_after)"
+                " VALUES (1, 1, 'folder', 'docs/q1', '2024-01-01', '2024-01-02')"
+            )
+        )
+        connection.execute(text("UPDATE folders SET trash_id = 1 WHERE id = 7"))
+        connection.execute(
+            text("INSERT INTO folders (path, user_id) VALUES ('docs/q1', 1)")
+        )
+    engine.dispose()
+
+
+def test_schema_drift_refuses_to_start(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'drift.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_files_folder_filename")
+
+    with pytest.raises(SchemaDriftError) as error:
+        check_schema(engine)
+    assert "index ix_files_folder_filename is missing" in error.value.problems
+    assert len(pending_migrations(engine)) == len(error.value.problems) - 1
+
+    # Migrations repair the schema they did not create
+    run_migrations(engine)
+    check_schema(engine)
+    engine.dispose()
+
+
+def test_migrations_run_at_startup_not_import(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'startup.db'}")
+    monkeypatch.setattr(main, "engine", engine)
+    assert len(pending_migrations(engine)) > 0
+
+    monkeypatch.setenv("MIGRATE_ON_STARTUP", "true")
+    monkeypatch.setenv("CHECK_SCHEMA_ON_STARTUP", "true")
+    assert main.prepare_database in main.app.router.on_startup
+    main.prepare_database()
+    assert schema_drift(engine) == []
+    engine.dispose()
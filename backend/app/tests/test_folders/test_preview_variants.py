@@ -0,0 +1,193 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from app.auth.jwt import AuthHandler
+from app.models import users as usersModels, folders as foldersModels
+from app.services import previews
+
+auth_handler = AuthHandler()
+
+
+def _login(client, db):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="hashed"
+    )
+    db.add(user)
+    db.commit()
+    db.add(foldersModels.Folder(path="docs", user_id=user.id))
+    db.commit()
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+
+
+def test_text_variant_is_cut_and_cached(client, db, monkeypatch):
+    monkeypatch.setattr(previews, "PREVIEW_TEXT_BYTES", 16)
+    _login(client, db)
+    content = b"line one\nline two\nline three\n"
+    client.post("/upload/docs", files={"file": ("app.log", content, "text/plain")})
+
+    response = client.get("/folder/docs/app.log?variant=text")
+    assert response.status_code == 200
+    assert response.content == b"line one\n"
+    assert response.headers["Content-Type"] == "text/plain; charset=utf-8"
+    assert response.headers["ETag"].endswith('-text"')
+
+    # The second request is served from the cache without rendering
+    renders = []
+    monkeypatch.setattr(
+        previews, "_render", lambda *args: renders.append(args) or ".txt"
+    )
+    again = client.get("/folder/docs/app.log?variant=text")
+    assert again.content == b"line one\n"
+    assert renders == []
+
+    response = client.get(
+        "/folder/docs/app.log?variant=text",
+        headers={"If-None-Match": again.headers["ETag"]},
+    )
+    assert response.status_code == 304
+
+    # The original is still the default
+    assert client.get("/folder/docs/app.log").content == content
+
+
+def test_unknown_and_unsupported_variants(client, db, monkeypatch):
+    _login(client, db)
+    client.post(
+        "/upload/docs", files={"file": ("blob.bin", b"\x00\x01", "application/x")}
+    )
+    client.post("/upload/docs", files={"file": ("photo.jpg", b"jpeg", "image/jpeg")})
+
+    response = client.get("/folder/docs/blob.bin?variant=huge")
+    assert response.status_code == 400
+
+    response = client.get("/folder/docs/blob.bin?variant=text")
+    assert response.status_code == 415
+
+    monkeypatch.setattr(previews, "Image", None)
+    response = client.get("/folder/docs/photo.jpg?variant=thumbnail")
+    assert response.status_code == 501
+
+
+def test_cached_preview_is_not_served_for_another_type(client, db):
+    _login(client, db)
+    content = b"same bytes\n"
+    client.post("/upload/docs", files={"file": ("server.log", content, "text/plain")})
+    client.post("/upload/docs", files={"file": ("dump.bin", content, "application/x")})
+
+    assert client.get("/folder/docs/server.log?variant=text").status_code == 200
+    assert client.get("/folder/docs/dump.bin?variant=text").status_code == 415
+
+
+def test_image_variants_are_downscaled(client, db):
+    Image = pytest.importorskip("PIL.Image")
+    _login(client, db)
+
+    photo = io.BytesIO()
+    Image.new("RGB", (800, 400), "red").save(photo, "JPEG")
+    client.post(
+        "/upload/docs", files={"file": ("photo.jpg", photo.getvalue(), "image/jpeg")}
+    )
+    response = client.get("/folder/docs/photo.jpg?variant=thumbnail")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(response.content)).size == (256, 128)
+
+    # Transparency is kept as PNG
+    logo = io.BytesIO()
+    Image.new("RGBA", (100, 300), (0, 0, 255, 128)).save(logo, "PNG")
+    client.post(
+        "/upload/docs", files={"file": ("logo.png", logo.getvalue(), "image/png")}
+    )
+    response = client.get("/folder/docs/logo.png?variant=web")
+    assert response.headers["Content-Type"] == "image/png"
+    with Image.open(io.BytesIO(response.content)) as image:
+        assert image.mode == "RGBA"
+        assert image.size == (100, 300)
+
+    client.post(
+        "/upload/docs", files={"file": ("broken.png", b"not a png", "image/png")}
+    )
+    assert client.get("/folder/docs/broken.png?variant=web").status_code == 415
+
+
+def test_pdf_page_variant(client, db):
+    pymupdf = pytest.importorskip("pymupdf")
+    _login(client, db)
+
+    document = pymupdf.open()
+    page = document.new_page(width=200, height=100)
+    page.insert_text((20, 50), "Hello")
+    client.post(
+        "/upload/docs",
+        files={"file": ("report.pdf", document.tobytes(), "application/pdf")},
+    )
+    response = client.get("/folder/docs/report.pdf?variant=page")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "image/png"
+    pixmap = pymupdf.Pixmap(response.content)
+    assert (pixmap.width, pixmap.height) == (previews.PREVIEW_WEB_SIZE, 800)
+
+    client.post(
+        "/upload/docs", files={"file": ("broken.pdf", b"%PDF-", "application/pdf")}
+    )
+    assert client.get("/folder/docs/broken.pdf?variant=page").status_code == 415
+
+
+def test_concurrent_requests_render_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(previews, "PREVIEW_FOLDER", str(tmp_path / "previews"))
+    source = tmp_path / "notes.txt"
+    source.write_bytes(b"hello\n")
+
+    blob = foldersModels.Blob(sha256="ab" * 32, size=6)
+    renders = []
+    render_text = previews._render_text
+
+    def slow_render(source, out_path):
+        renders.append(source)
+        time.sleep(0.2)
+        render_text(source, out_path)
+
+    monkeypatch.setattr(previews, "_render_text", slow_render)
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                previews.render_preview(str(source), blob, "text", "notes.txt")
+            )
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(renders) == 1
+    assert len({result.path for result in results}) == 1
+
+
+def test_least_recently_used_previews_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(previews, "PREVIEW_FOLDER", str(tmp_path / "previews"))
+    monkeypatch.setattr(previews, "PREVIEW_CACHE_MAX_BYTES", 250)
+    monkeypatch.setattr(previews, "_cache_bytes", None)
+    source = tmp_path / "notes.txt"
+    source.write_bytes(b"x" * 99 + b"\n")
+
+    def render(n):
+        blob = foldersModels.Blob(sha256=f"{n:02d}" * 32, size=100)
+        return previews.render_preview(str(source), blob, "text", "a.txt").path
+
+    first, second = render(0), render(1)
+    # The first preview was served more recently than the second
+    os.utime(second, (1000, 1000))
+    os.utime(first, (2000, 2000))
+    third = render(2)
+
+    assert os.path.exists(first)
+    assert not os.path.exists(second)
+    assert os.path.exists(third)
@@ -0,0 +1,39 @@
+from io import BytesIO
+from app.models import users as usersModels, folders as foldersModels
+
+
+def test_revisions_are_counted_per_document(client, db, auth_handler):
+    # Create a test user and folder
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="hashed"
+    )
+    db.add(user)
+    db.commit()
+    db.add(foldersModels.Folder(path="test_folder", user_id=user.id))
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+
+    def upload(filename, content):
+        response = client.post(
+            "/upload/test_folder",
+            files={"file": (filename, BytesIO(content), "text/plain")},
+        )
+        assert response.status_code == 200
+        return response.json()
+
+    assert upload("report.txt", b"a") == {
+        "message": "File uploaded successfully",
+        "file": "report.txt",
+        "revision": 0,
+    }
+    assert upload("report.txt", b"b")["file"] == "report_v1.txt"
+
+    # A document sharing the prefix keeps its own revisions
+    assert upload("report_final.txt", b"c")["file"] == "report_final.txt"
+    assert upload("report.txt", b"d")["file"] == "report_v2.txt"
+
+    # A document whose name collides with an existing revision skips that name
+    assert upload("report_v3.txt", b"e")["file"] == "report_v3.txt"
+    assert upload("report.txt", b"f")["file"] == "report_v4.txt"
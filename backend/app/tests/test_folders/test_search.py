@@ -0,0 +1,77 @@
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+from app.models import users as usersModels, folders as foldersModels
+from app.auth.jwt import AuthHandler
+
+
+def _add_files(db: Session, user, folder_path: str, filenames):
+    folder = foldersModels.Folder(path=folder_path, user_id=user.id)
+    db.add(folder)
+    db.commit()
+    for filename in filenames:
+        db.add(
+            foldersModels.File(
+                filename=filename,
+                file_path=f"/{folder_path}/{filename}",
+                folder_id=folder.id,
+                user_id=user.id,
+            )
+        )
+    db.commit()
+    return folder
+
+
+def test_search_files_across_folders(
+    client: TestClient, db: Session, auth_handler: AuthHandler
+):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    other = usersModels.User(
+        username="other", email="other@example.com", hashed_password="x"
+    )
+    db.add_all([user, other])
+    db.commit()
+
+    _add_files(db, user, "finance", ["invoice_march.pdf", "budget.xlsx"])
+    _add_files(db, user, "finance/2024", ["Invoice_april.pdf", "invoice_may.pdf"])
+    _add_files(db, other, "finance", ["invoice_june.pdf"])
+
+    token = auth_handler.create_access_token(data={"sub": "test@example.com"})
+    client.cookies.set("access_token", token)
+
+    # Substring matches from every folder of the user, and only theirs
+    response = client.get("/search/", params={"q": "invoice", "include_total": True})
+    assert response.status_code == 200
+    assert response.headers["x-total-count"] == "3"
+    hits = {(hit["folder_path"], hit["filename"]) for hit in response.json()}
+    assert hits == {
+        ("finance", "invoice_march.pdf"),
+        ("finance/2024", "Invoice_april.pdf"),
+        ("finance/2024", "invoice_may.pdf"),
+    }
+
+    # Paginated through an opaque cursor
+    response = client.get("/search/", params={"q": "invoice", "limit": 2})
+    assert len(response.json()) == 2
+    cursor = response.headers["x-next-cursor"]
+    response = client.get("/search/", params={"q": "invoice", "cursor": cursor})
+    assert len(response.json()) == 1
+    assert "x-next-cursor" not in response.headers
+
+    # Renamed and deleted files are reindexed
+    budget = db.query(foldersModels.File).filter_by(filename="budget.xlsx").one()
+    budget.filename = "invoice_budget.xlsx"
+    db.commit()
+    db.query(foldersModels.File).filter_by(filename="invoice_may.pdf").delete()
+    db.commit()
+    response = client.get("/search/", params={"q": "invoice"})
+    assert {hit["filename"] for hit in response.json()} == {
+        "invoice_march.pdf",
+        "Invoice_april.pdf",
+        "invoice_budget.xlsx",
+    }
+
+    # Terms shorter than a trigram are still found
+    response = client.get("/search/", params={"q": "xl"})
+    assert [hit["filename"] for hit in response.json()] == ["invoice_budget.xlsx"]
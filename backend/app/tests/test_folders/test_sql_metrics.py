@@ -0,0 +1,90 @@
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.auth.jwt import AuthHandler
+from app.models import folders as foldersModels, users as usersModels
+from app.utils import sql_metrics
+from app.utils.sql_metrics import QueryStats
+
+
+def _folder_with_files(db: Session, auth_handler: AuthHandler, count: int):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="x"
+    )
+    db.add(user)
+    db.commit()
+    folder = foldersModels.Folder(path="docs", user_id=user.id)
+    db.add(folder)
+    db.commit()
+    for i in range(count):
+        db.add(
+            foldersModels.File(
+                filename=f"file{i:02d}.txt",
+                file_path=f"/docs/file{i:02d}.txt",
+                folder_id=folder.id,
+                user_id=user.id,
+            )
+        )
+    db.commit()
+    return auth_handler.create_access_token(data={"sub": "test@example.com"})
+
+
+def test_file_listing_query_budget(
+    client: TestClient, db: Session, auth_handler: AuthHandler, assert_max_queries
+):
+    token = _folder_with_files(db, auth_handler, 20)
+
+    # User lookup, folder lookup and one page of files, whatever the page size
+    with assert_max_queries(3) as stats:
+        response = client.get("/folder/docs/files/", cookies={"access_token": token})
+    assert response.status_code == 200
+    assert len(response.json()) == 20
+    assert stats.repeated() == []
+
+
+def test_server_timing_header(
+    client: TestClient, db: Session, auth_handler: AuthHandler
+):
+    token = _folder_with_files(db, auth_handler, 2)
+
+    response = client.get("/folder/docs/files/", cookies={"access_token": token})
+
+    timing = response.headers["server-timing"]
+    assert timing.startswith("db;dur=")
+    assert "3 queries" in timing
+
+
+def test_repeated_statements_are_flagged():
+    stats = QueryStats()
+    for _ in range(sql_metrics.SQL_N_PLUS_ONE_THRESHOLD):
+        stats.record("SELECT * FROM files WHERE folder_id = ?", 0.001, 1)
+    stats.record("SELECT * FROM folders WHERE id = ?", 0.002, 1)
+
+    summary = stats.summary()
+    assert summary["queries"] == sql_metrics.SQL_N_PLUS_ONE_THRESHOLD + 1
+    assert summary["repeated"] == [
+        {
+            "count": sql_metrics.SQL_N_PLUS_ONE_THRESHOLD,
+            "statement": "SELECT * FROM files WHERE folder_id = ?",
+        }
+    ]
+    assert summary["slowest"][0]["statement"] == "SELECT * FROM folders WHERE id = ?"
+
+
+def test_debug_endpoint(
+    client: TestClient, db: Session, auth_handler: AuthHandler, monkeypatch
+):
+    token = _folder_with_files(db, auth_handler, 1)
+    cookies = {"access_token": token}
+
+    assert client.get("/debug/sql", cookies=cookies).status_code == 404
+
+    monkeypatch.setattr(sql_metrics, "SQL_DEBUG_ENDPOINT", True)
+    client.get("/folder/docs/files/", cookies=cookies)
+    response = client.get("/debug/sql", cookies=cookies)
+
+    assert response.status_code == 200
+    latest = response.json()["requests"][0]
+    assert latest["path"] == "/folder/docs/files/"
+    assert latest["status"] == 200
+    assert latest["queries"] >= 2
@@ -0,0 +1,124 @@
+import os
+
+from app.auth.jwt import AuthHandler
+from app.models import users as usersModels, folders as foldersModels
+from app.services import files, folders, storage
+
+auth_handler = AuthHandler()
+
+CSV = b"".join(b"%d,widget,%d.99,in stock\n" % (n, n % 50) for n in range(2000))
+
+
+def _login(client, db, monkeypatch):
+    monkeypatch.setattr(storage, "STORAGE_COMPRESSION", "gzip")
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="hashed"
+    )
+    db.add(user)
+    db.commit()
+    db.add(foldersModels.Folder(path="data", user_id=user.id))
+    db.commit()
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+
+
+def _blob(db, filename):
+    return (
+        db.query(foldersModels.Blob)
+        .join(foldersModels.File)
+        .filter(foldersModels.File.filename == filename)
+        .one()
+    )
+
+
+def test_compressible_upload_is_stored_gzipped(client, db, monkeypatch):
+    _login(client, db, monkeypatch)
+    client.post("/upload/data", files={"file": ("stock.csv", CSV, "text/csv")})
+
+    blob = _blob(db, "stock.csv")
+    path = storage.blob_path(blob.sha256)
+    assert blob.encoding == "gzip"
+    assert blob.size == len(CSV)
+    assert os.path.getsize(path) < len(CSV) / 4
+
+    # Clients accepting gzip get the stored bytes as they are
+    response = client.get(
+        "/download/data/stock.csv", headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Content-Length"] == str(os.path.getsize(path))
+    assert response.headers["ETag"].endswith('-gzip"')
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.content == CSV
+
+    # The others get the content decoded on the fly, ranges included
+    response = client.get(
+        "/download/data/stock.csv", headers={"Accept-Encoding": "identity"}
+    )
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Content-Length"] == str(len(CSV))
+    assert response.content == CSV
+
+    response = client.get(
+        "/download/data/stock.csv",
+        headers={"Accept-Encoding": "gzip;q=0", "Range": "bytes=1000-1099"},
+    )
+    assert response.status_code == 206
+    assert response.content == CSV[1000:1100]
+    assert response.headers["Content-Range"] == f"bytes 1000-1099/{len(CSV)}"
+
+    # Derived previews read the decoded content
+    response = client.get("/folder/data/stock.csv?variant=text")
+    assert response.content.startswith(b"0,widget,0.99,in stock\n")
+
+
+def test_incompressible_content_is_stored_as_is(client, db, monkeypatch):
+    _login(client, db, monkeypatch)
+    noise = os.urandom(32 * 1024)
+    archive = b"PK\x03\x04" + b"\x00" * 8192
+    client.post("/upload/data", files={"file": ("noise.bin", noise, "x/y")})
+    client.post("/upload/data", files={"file": ("docs.zip", archive, "x/y")})
+
+    assert _blob(db, "noise.bin").encoding is None
+    assert _blob(db, "docs.zip").encoding is None
+
+    response = client.get("/download/data/docs.zip")
+    assert "Content-Encoding" not in response.headers
+    assert response.content == archive
+
+
+def test_misleading_sample_is_stored_as_is(client, db, monkeypatch):
+    _login(client, db, monkeypatch)
+    monkeypatch.setattr(storage, "COMPRESSION_SAMPLE_BYTES", 256)
+    content = b"a" * 256 + os.urandom(1024 * 1024)
+    client.post("/upload/data", files={"file": ("mixed.bin", content, "x/y")})
+
+    assert _blob(db, "mixed.bin").encoding is None
+    assert client.get("/download/data/mixed.bin").content == content
+    assert os.listdir(storage.STAGING_FOLDER) == []
+
+
+def test_stored_content_is_not_encoded_again(client, db, monkeypatch):
+    _login(client, db, monkeypatch)
+    client.post("/upload/data", files={"file": ("stock.csv", CSV, "text/csv")})
+
+    encoded = []
+    monkeypatch.setattr(files, "encode_staged", encoded.append)
+    response = client.post("/upload/data", files={"file": ("copy.csv", CSV, "x/y")})
+    assert response.status_code == 200
+    assert encoded == []
+    assert _blob(db, "copy.csv").encoding == "gzip"
+
+    # Identical files of one batch are compressed once
+    def encode(stored):
+        encoded.append(stored.sha256)
+        return storage.encode_staged(stored)
+
+    monkeypatch.setattr(folders, "encode_staged", encode)
+    batch = [("files", (f"{n}.csv", CSV + b"new", "text/csv")) for n in range(3)]
+    response = client.post("/create_folder/", data={"folder_path": "data"}, files=batch)
+    assert response.status_code == 200
+    assert len(encoded) == 1
+    assert {_blob(db, f"{n}.csv").encoding for n in range(3)} == {"gzip"}
+    assert client.get("/download/data/2.csv").content == CSV + b"new"
+    assert os.listdir(storage.STAGING_FOLDER) == []
@@ -0,0 +1,154 @@
+import io
+import json
+import os
+import tarfile
+import zipfile
+
+from app.auth.jwt import AuthHandler
+from app.models import users as usersModels, folders as foldersModels
+from app.services import archives
+from app.services.storage import STAGING_FOLDER
+
+auth_handler = AuthHandler()
+
+
+def _login(client, db):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="hashed"
+    )
+    db.add(user)
+    db.commit()
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+
+
+def _zip(members) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def _upload(client, folder, data, name="archive.zip", progress=False):
+    return client.post(
+        f"/upload_archive/{folder}" + ("?progress=true" if progress else ""),
+        files={"archive": (name, data, "application/octet-stream")},
+    )
+
+
+def _staging_leftovers():
+    if not os.path.isdir(STAGING_FOLDER):
+        return []
+    return os.listdir(STAGING_FOLDER)
+
+
+def test_zip_is_extracted_into_folders_and_revisions(client, db):
+    _login(client, db)
+    client.post("/create_folder/", data={"folder_path": "imports"})
+    client.post("/upload/imports", files={"file": ("readme.txt", b"old", "x/y")})
+
+    data = _zip(
+        {
+            "readme.txt": b"new",
+            "Docs/guide.md": b"# Guide\n",
+            "Docs/sub/table.csv": b"a,b\n1,2\n",
+            "empty/": b"",
+        }
+    )
+    response = _upload(client, "imports", data)
+    assert response.status_code == 200
+    assert response.json() == {
+        "message": "Archive extracted successfully!",
+        "folders": 4,
+        "files": 3,
+        "bytes": 19,
+    }
+
+    paths = {path for (path,) in db.query(foldersModels.Folder.path)}
+    assert paths == {"imports", "imports/docs", "imports/docs/sub", "imports/empty"}
+
+    # Existing documents get a new revision
+    response = client.get("/download/imports/readme_v1.txt")
+    assert response.content == b"new"
+    response = client.get("/download/imports/docs/sub/table.csv")
+    assert response.content == b"a,b\n1,2\n"
+
+
+def test_tar_gz_is_extracted(client, db):
+    _login(client, db)
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, content in {"a/one.txt": b"1", "a/b/two.txt": b"22"}.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+        link = tarfile.TarInfo("a/link")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "/etc/passwd"
+        archive.addfile(link)
+
+    response = _upload(client, "backup", buffer.getvalue(), "backup.tar.gz")
+    assert response.status_code == 200
+    assert response.json()["files"] == 2
+    assert client.get("/download/backup/a/b/two.txt").content == b"22"
+
+
+def test_unsafe_paths_are_rejected(client, db):
+    _login(client, db)
+    for name in ("../evil.txt", "/etc/evil.txt", "ok/../../evil.txt", "C:\\evil"):
+        response = _upload(client, "imports", _zip({"fine.txt": b"x", name: b"x"}))
+        assert response.status_code == 400
+        assert "Unsafe path" in response.json()["detail"]
+
+    # Nothing was stored, and staged files were removed
+    assert db.query(foldersModels.File).count() == 0
+    assert db.query(foldersModels.Folder).count() == 0
+    assert _staging_leftovers() == []
+
+
+def test_archive_bombs_are_rejected(client, db, monkeypatch):
+    _login(client, db)
+
+    # 4 MB of zeros compress to a few KB
+    response = _upload(client, "imports", _zip({"zeros.bin": bytes(4 * 1024**2)}))
+    assert response.status_code == 413
+    assert "ratio" in response.json()["detail"]
+
+    monkeypatch.setattr(archives, "ARCHIVE_MAX_BYTES", 10)
+    response = _upload(client, "imports", _zip({"a.txt": b"x" * 8, "b.txt": b"x" * 8}))
+    assert response.status_code == 413
+
+    monkeypatch.setattr(archives, "ARCHIVE_MAX_ENTRIES", 2)
+    response = _upload(client, "imports", _zip({f"{n}.txt": b"" for n in range(3)}))
+    assert response.status_code == 413
+    assert "entries" in response.json()["detail"]
+
+    assert db.query(foldersModels.File).count() == 0
+    assert _staging_leftovers() == []
+
+
+def test_progress_is_streamed(client, db, monkeypatch):
+    monkeypatch.setattr(archives, "ARCHIVE_PROGRESS_INTERVAL", 0)
+    _login(client, db)
+
+    data = _zip({f"docs/{n}.txt": b"x" for n in range(3)})
+    response = _upload(client, "imports", data, progress=True)
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [event["phase"] for event in events[:-1]] == [
+        "extracting",
+        "extracting",
+        "extracting",
+        "storing",
+    ]
+    assert events[-2]["files"] == 3
+    assert events[-1]["event"] == "done"
+
+    response = _upload(client, "imports", b"not an archive", progress=True)
+    event = json.loads(response.text.splitlines()[-1])
+    assert event == {
+        "event": "error",
+        "status": 400,
+        "detail": "Unreadable or unsupported archive.",
+    }
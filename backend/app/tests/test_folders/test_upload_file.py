@@ -1,3 +1,4 @@
+from io import BytesIO
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 from app.models import users as usersModels, folders as foldersModels
@@ -79,3 +80,35 @@ def test_upload_file_unauthenticated(client: TestClient, test_file):
 
     assert response.status_code == 401
     assert response.json()["detail"] == "Token not found"
+
+
+def test_upload_large_file_streamed(client: TestClient, db: Session, auth_handler):
+    # Create a test user and folder
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="hashed"
+    )
+    db.add(user)
+    db.commit()
+    test_folder = foldersModels.Folder(path="test_folder", user_id=user.id)
+    db.add(test_folder)
+    db.commit()
+
+    folder_id = test_folder.id
+    token = auth_handler.create_access_token(data={"sub": user.email})
+
+    # Content spanning several upload chunks
+    content = bytes(range(256)) * (3 * 1024 * 16 + 7)
+    response = client.post(
+        "/upload/test_folder",
+        files={"file": ("large.bin", BytesIO(content), "application/octet-stream")},
+        cookies={"access_token": token},
+    )
+
+    assert response.status_code == 200
+    stored_file = (
+        db.query(foldersModels.File)
+        .filter(foldersModels.File.folder_id == folder_id)
+        .first()
+    )
+    with open(stored_file.file_path, "rb") as f:
+        assert f.read() == content
@@ -0,0 +1,125 @@
+import os
+
+import pytest
+
+from app.models import users as usersModels, folders as foldersModels
+from app.services import storage, uploads
+
+
+def _setup_user_and_folder(client, db, auth_handler):
+    user = usersModels.User(
+        username="testuser", email="test@example.com", hashed_password="hashed"
+    )
+    db.add(user)
+    db.commit()
+    db.add(foldersModels.Folder(path="test_folder", user_id=user.id))
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+
+
+def test_resumable_upload(client, db, auth_handler):
+    _setup_user_and_folder(client, db, auth_handler)
+    content = b"0123456789" * 100
+
+    # Create the session
+    response = client.post(
+        "/upload_sessions/",
+        json={"folder_path": "test_folder", "filename": "big.txt", "size": 1000},
+    )
+    assert response.status_code == 200
+    upload_id = response.json()["upload_id"]
+    assert response.json()["offset"] == 0
+
+    # Send the first chunk, then re-send it (idempotent) with the next bytes
+    response = client.put(
+        f"/upload_sessions/{upload_id}?offset=0", content=content[:400]
+    )
+    assert response.json()["offset"] == 400
+    response = client.put(
+        f"/upload_sessions/{upload_id}?offset=300", content=content[300:700]
+    )
+    assert response.json()["offset"] == 700
+
+    # A chunk past the current offset is rejected
+    response = client.put(
+        f"/upload_sessions/{upload_id}?offset=800", content=content[800:]
+    )
+    assert response.status_code == 409
+
+    # Completing early is refused, the offset can be queried to resume
+    assert client.post(f"/upload_sessions/{upload_id}/complete").status_code == 409
+    assert client.get(f"/upload_sessions/{upload_id}").json()["offset"] == 700
+
+    client.put(f"/upload_sessions/{upload_id}?offset=700", content=content[700:])
+    response = client.post(f"/upload_sessions/{upload_id}/complete")
+    assert response.status_code == 200
+    assert response.json()["file"] == "big.txt"
+
+    # The session is gone and the file is a regular revision
+    assert client.get(f"/upload_sessions/{upload_id}").status_code == 404
+    response = client.get("/download/test_folder/big.txt")
+    assert response.content == content
+
+
+def test_upload_session_folder_not_found(client, db, auth_handler):
+    _setup_user_and_folder(client, db, auth_handler)
+
+    response = client.post(
+        "/upload_sessions/",
+        json={"folder_path": "missing_folder", "filename": "big.txt"},
+    )
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Folder not found."
+
+
+def _start(client, size=None):
+    body = {"folder_path": "test_folder", "filename": "big.txt"}
+    if size is not None:
+        body["size"] = size
+    return client.post("/upload_sessions/", json=body).json()["upload_id"]
+
+
+def test_failed_completion_can_be_retried(client, db, auth_handler, monkeypatch):
+    _setup_user_and_folder(client, db, auth_handler)
+    upload_id = _start(client, 5)
+    client.put(f"/upload_sessions/{upload_id}?offset=0", content=b"hello")
+
+    # The commit fails after the content was staged: the partial is kept
+    def fail(*args):
+        raise RuntimeError("commit failed")
+
+    monkeypatch.setattr(uploads, "add_file_revision", fail)
+    with pytest.raises(RuntimeError):
+        client.post(f"/upload_sessions/{upload_id}/complete")
+    monkeypatch.undo()
+    assert os.path.exists(uploads.session_path(upload_id))
+    assert os.listdir(storage.STAGING_FOLDER) == []
+
+    response = client.post(f"/upload_sessions/{upload_id}/complete")
+    assert response.status_code == 200
+    assert not os.path.exists(uploads.session_path(upload_id))
+    assert client.get("/download/test_folder/big.txt").content == b"hello"
+
+
+def test_completion_into_trashed_folder_is_refused(client, db, auth_handler):
+    _setup_user_and_folder(client, db, auth_handler)
+    upload_id = _start(client)
+    client.put(f"/upload_sessions/{upload_id}?offset=0", content=b"hello")
+
+    assert client.delete("/delete_folder/test_folder").status_code == 202
+    response = client.post(f"/upload_sessions/{upload_id}/complete")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Folder not found."
+    assert client.get(f"/upload_sessions/{upload_id}").status_code == 200
+
+
+def test_chunk_for_swept_session_is_not_found(client, db, auth_handler):
+    _setup_user_and_folder(client, db, auth_handler)
+    upload_id = _start(client)
+    os.remove(uploads.session_path(upload_id))
+
+    response = client.put(f"/upload_sessions/{upload_id}?offset=0", content=b"hello")
+    assert response.status_code == 404
@@ -0,0 +1,19 @@
+from app.models.users import User
+
+
+def test_current_user_is_cached_and_invalidated(client, db, auth_handler):
+    user = User(username="testuser", email="test@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+
+    token = auth_handler.create_access_token(data={"sub": user.email})
+    client.cookies.set("access_token", token)
+    assert client.get("/folders/").status_code == 200
+
+    # Deleting the user through the ORM drops it from the cache
+    db.delete(user)
+    db.commit()
+
+    response = client.get("/folders/")
+    assert response.status_code == 401
+    assert response.json()["detail"] == "User not found."
@@ -0,0 +1,69 @@
+import time
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.auth import jwt as jwtModule
+
+
+def test_decode_token_is_cached(auth_handler, monkeypatch):
+    token = auth_handler.create_access_token(data={"sub": "test@example.com"})
+
+    assert auth_handler.decode_token(token).email == "test@example.com"
+    stats = auth_handler.token_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (0, 1, 1)
+
+    # A cache hit skips the signature check entirely
+    def fail(*args, **kwargs):
+        raise AssertionError("token verified twice")
+
+    monkeypatch.setattr(jwtModule.jwt, "decode", fail)
+    assert auth_handler.decode_token(token).email == "test@example.com"
+    assert auth_handler.token_cache_stats()["hits"] == 1
+
+
+def test_invalid_and_expired_tokens_are_not_cached(auth_handler):
+    expired = auth_handler.create_access_token(
+        data={"sub": "test@example.com"}, expires_delta=timedelta(seconds=-1)
+    )
+    for token in (expired, "not-a-token"):
+        with pytest.raises(HTTPException) as exc:
+            auth_handler.decode_token(token)
+        assert exc.value.status_code == 401
+
+    assert auth_handler.token_cache_stats()["size"] == 0
+
+
+def test_revoked_token_is_rejected(auth_handler):
+    token = auth_handler.create_access_token(data={"sub": "test@example.com"})
+    auth_handler.decode_token(token)
+
+    auth_handler.revoke_token(token)
+
+    with pytest.raises(HTTPException) as exc:
+        auth_handler.decode_token(token)
+    assert exc.value.detail == "Token revoked"
+
+
+def test_revoked_token_is_kept_until_it_expires(auth_handler, monkeypatch):
+    token = auth_handler.create_access_token(
+        data={"sub": "test@example.com"}, expires_delta=timedelta(hours=2)
+    )
+    auth_handler.revoke_token(token)
+    auth_handler.revoke_token("not-a-token")
+    assert len(jwtModule._revoked_tokens) == 1
+
+    # Still revoked past the default token lifetime
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 90 * 60)
+    with pytest.raises(HTTPException) as exc:
+        auth_handler.decode_token(token)
+    assert exc.value.detail == "Token revoked"
+
+    # Dropped once the token itself has expired
+    monkeypatch.setattr(time, "monotonic", lambda: now + 2 * 60 * 60 + 1)
+    auth_handler.revoke_token(
+        auth_handler.create_access_token(data={"sub": "other@example.com"})
+    )
+    assert len(jwtModule._revoked_tokens) == 1
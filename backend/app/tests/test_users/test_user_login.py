@@ -1,5 +1,9 @@
+from passlib.context import CryptContext
+
 from app.models.users import User
 from app.services.users import get_password_hash
+from app.utils import hashing, utils
+from app.utils.utils import pwd_context
 
 
 # Test for the login route
@@ -24,3 +28,62 @@ def test_login(client, db):
     assert response.json() == {"message": "Login successful"}
 
     assert "access_token" in response.cookies
+
+
+# Test that a hash made with an outdated cost is upgraded on login
+def test_login_rehashes_outdated_cost(client, db):
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("testpassword")
+    user = User(username="testuser", email="test@example.com", hashed_password=old_hash)
+    db.add(user)
+    db.commit()
+
+    login_data = {"email": "test@example.com", "password": "testpassword"}
+    response = client.post("/login/", json=login_data)
+    assert response.status_code == 200
+
+    db.refresh(user)
+    assert user.hashed_password != old_hash
+    assert not pwd_context.needs_update(user.hashed_password)
+    assert pwd_context.verify("testpassword", user.hashed_password)
+
+
+# Test that a hash made with a higher cost than configured is replaced too
+def test_login_rehashes_higher_cost(client, db, monkeypatch):
+    context = CryptContext(
+        schemes=["bcrypt"],
+        bcrypt__rounds=4,
+        bcrypt__min_rounds=4,
+        bcrypt__max_rounds=4,
+    )
+    monkeypatch.setattr(utils, "pwd_context", context)
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=5).hash("testpassword")
+    user = User(username="testuser", email="test@example.com", hashed_password=old_hash)
+    db.add(user)
+    db.commit()
+
+    login_data = {"email": "test@example.com", "password": "testpassword"}
+    response = client.post("/login/", json=login_data)
+    assert response.status_code == 200
+
+    db.refresh(user)
+    assert user.hashed_password != old_hash
+    assert not context.needs_update(user.hashed_password)
+
+
+# Test that logins are turned away when the password pool is saturated
+def test_login_rejected_when_hash_queue_full(client, db, monkeypatch):
+    monkeypatch.setattr(hashing, "PASSWORD_HASH_QUEUE_LIMIT", 0)
+
+    login_data = {"email": "test@example.com", "password": "testpassword"}
+    db.add(
+        User(
+            username="testuser",
+            email="test@example.com",
+            hashed_password=get_password_hash("testpassword"),
+        )
+    )
+    db.commit()
+
+    response = client.post("/login/", json=login_data)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
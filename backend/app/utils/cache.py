@@ -0,0 +1,99 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+# Bounded in-process cache with per-entry expiry and LRU eviction
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Set of keys that each expire on their own deadline. Unlike TTLCache nothing
+# is evicted early: a key stays until it expires, and expired keys are dropped
+# on the next add.
+class ExpiringSet:
+    def __init__(self):
+        self._expiry: Dict[Hashable, float] = {}
+        self._deadlines: List[Tuple[float, Hashable]] = []
+        self._lock = threading.Lock()
+
+    def add(self, key: Hashable, ttl: float):
+        now = time.monotonic()
+        expires_at = now + ttl
+        with self._lock:
+            self._purge(now)
+            if expires_at > self._expiry.get(key, now):
+                self._expiry[key] = expires_at
+                heapq.heappush(self._deadlines, (expires_at, key))
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            expires_at = self._expiry.get(key)
+        return expires_at is not None and expires_at > time.monotonic()
+
+    def _purge(self, now: float):
+        while self._deadlines and self._deadlines[0][0] <= now:
+            expires_at, key = heapq.heappop(self._deadlines)
+            if self._expiry.get(key) == expires_at:
+                del self._expiry[key]
+
+    def clear(self):
+        with self._lock:
+            self._expiry.clear()
+            self._deadlines.clear()
+
+    def __len__(self) -> int:
+        return len(self._expiry)
@@ -0,0 +1,98 @@
+import gzip
+import zlib
+from typing import BinaryIO, Optional
+
+# Content encodings a blob can be stored with; None stores the bytes as sent
+GZIP = "gzip"
+
+# Leading bytes of formats that are compressed already
+COMPRESSED_SIGNATURES = (
+    b"\x1f\x8b",  # gzip
+    b"PK\x03\x04",  # zip, docx, xlsx, jar, epub...
+    b"7z\xbc\xaf\x27\x1c",
+    b"BZh",
+    b"\xfd7zXZ\x00",
+    b"\x28\xb5\x2f\xfd",  # zstd
+    b"Rar!",
+    b"\xff\xd8\xff",  # jpeg
+    b"\x89PNG",
+    b"GIF8",
+    b"RIFF",  # webp, avi, wav
+    b"OggS",
+    b"fLaC",
+    b"ID3",  # mp3
+    b"\x1aE\xdf\xa3",  # mkv, webm
+)
+
+# Formats whose signature is at offset 4 (ISO base media: mp4, mov, heic)
+FTYP_OFFSET = 4
+
+
+def is_compressed_format(sample: bytes) -> bool:
+    return sample.startswith(COMPRESSED_SIGNATURES) or (
+        sample[FTYP_OFFSET : FTYP_OFFSET + 4] == b"ftyp"
+    )
+
+
+# Whether compressing a sample saves at least min_saving of its size
+def compresses_well(sample: bytes, min_saving: float) -> bool:
+    if not sample or is_compressed_format(sample):
+        return False
+    # Level 1 is enough to tell text from noise, at a fraction of the cost
+    return len(zlib.compress(sample, 1)) <= len(sample) * (1 - min_saving)
+
+
+# Gzip head and then the rest of source into out, in one pass (blocking).
+# Returns False as soon as the output reaches max_size, as storing the
+# content as is would then be smaller.
+def gzip_stream(
+    head: bytes,
+    source: BinaryIO,
+    out: BinaryIO,
+    level: int,
+    chunk_size: int,
+    max_size: int,
+) -> bool:
+    # mtime=0 keeps the output identical for identical content
+    with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=level, mtime=0) as encoder:
+        chunk = head
+        while chunk:
+            encoder.write(chunk)
+            if out.tell() >= max_size:
+                return False
+            chunk = source.read(chunk_size)
+    return out.tell() < max_size
+
+
+# Open stored content for reading its original bytes
+def open_decoded(path: str, encoding: Optional[str]) -> BinaryIO:
+    if encoding == GZIP:
+        return gzip.open(path, "rb")
+    if encoding is not None:
+        raise ValueError(f"Unknown content encoding {encoding!r}")
+    return open(path, "rb")
+
+
+# Whether an Accept-Encoding header allows the given coding (RFC 9110 12.5.3)
+def accepts_encoding(header: Optional[str], encoding: str) -> bool:
+    if not header:
+        return False
+
+    qualities = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    aliases = {encoding, f"x-{encoding}"}
+    for coding in aliases:
+        if coding in qualities:
+            return qualities[coding] > 0
+    return qualities.get("*", 0) > 0
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.utils.metrics import PASSWORD_HASH_SECONDS
+from app.utils.utils import get_password_hash, verify_and_update_password
+
+# bcrypt is CPU bound, so it runs in its own small pool instead of the event
+# loop or the shared threadpool used by sync routes and file I/O.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+
+# Hashes waiting or running at once. Past this, requests are turned away
+# with 503 instead of queueing behind seconds of bcrypt work.
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", 32))
+
+_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+_lock = threading.Lock()
+_pending = 0
+
+
+# Time bcrypt itself, not the wait for a worker
+def _timed(operation: str, fn, *args):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        PASSWORD_HASH_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+
+# Run a hashing function in the password pool, rejecting work when it is full
+async def _run(operation: str, fn, *args):
+    global _pending
+    with _lock:
+        if _pending >= PASSWORD_HASH_QUEUE_LIMIT:
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please try again.",
+                headers={"Retry-After": "1"},
+            )
+        _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            _executor, _timed, operation, fn, *args
+        )
+    finally:
+        with _lock:
+            _pending -= 1
+
+
+# Hash a password without blocking the event loop
+async def hash_password(password: str) -> str:
+    return await _run("hash", get_password_hash, password)
+
+
+# Verify a password without blocking the event loop.
+# The second value is a new hash when the stored one uses an outdated cost.
+async def check_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    return await _run(
+        "verify", verify_and_update_password, plain_password, hashed_password
+    )
+
+
+def pending_hashes() -> int:
+    return _pending
@@ -0,0 +1,278 @@
+import mimetypes
+import os
+import re
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from app.utils.codec import accepts_encoding, open_decoded
+from app.utils.metrics import count_download, record_transfer
+
+CHUNK_SIZE = 64 * 1024
+
+# Requests asking for more ranges than this get the whole file instead
+MAX_RANGES = 16
+
+RANGE_PATTERN = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+
+# A specific revision never changes, so clients may cache it for a year
+IMMUTABLE_CACHE = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE = "private, no-cache"
+
+
+# Strong validator for content identified by its SHA-256
+def content_etag(sha256: str) -> str:
+    return f'"{sha256}"'
+
+
+# Weak validator for files stored without a content hash
+def stat_etag(path: str) -> str:
+    stat = os.stat(path)
+    return f'W/"{int(stat.st_mtime)}-{stat.st_size}"'
+
+
+# Validator of a representation derived from the one identified by etag
+def derived_etag(etag: str, suffix: str) -> str:
+    return f'{etag[:-1]}-{suffix}"'
+
+
+def _http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _opaque(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+# If-None-Match uses the weak comparison
+def _etag_matches(header: str, etag: str) -> bool:
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or _opaque(etag) in map(_opaque, candidates)
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        since = _parse_http_date(if_modified_since)
+        modified = last_modified.replace(microsecond=0)
+        if modified.tzinfo is None:
+            modified = modified.replace(tzinfo=timezone.utc)
+        return since is not None and modified <= since
+    return False
+
+
+# If-Range needs a strong ETag match, or an exact date match
+def _range_allowed(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return not etag.startswith("W/") and if_range == etag
+    return if_range == _http_date(last_modified)
+
+
+# Parse a Range header into inclusive (start, end) pairs.
+# Returns None when the header should be ignored and [] when unsatisfiable.
+def parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    unit, _, ranges_spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not ranges_spec:
+        return None
+
+    specs = ranges_spec.split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        match = RANGE_PATTERN.match(spec)
+        if not match or match.groups() == ("", ""):
+            return None
+        first, last = match.groups()
+        if first == "":
+            # Suffix range: the last N bytes, none of an empty file
+            length = int(last)
+            if length == 0 or size == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        end = int(last) if last else size - 1
+        ranges.append((start, min(end, size - 1)))
+    return ranges
+
+
+# Read bytes start..end of a file, or of its decoded content with an encoding.
+# Seeking in decoded content decompresses up to the start of the range.
+def _read_range(
+    path: str, start: int, end: int, encoding: Optional[str] = None
+) -> Iterator[bytes]:
+    with open_decoded(path, encoding) as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _multipart_ranges(
+    path: str,
+    ranges: List[Tuple[int, int]],
+    size: int,
+    media_type: str,
+    boundary: str,
+    encoding: Optional[str] = None,
+) -> Iterator[bytes]:
+    for start, end in ranges:
+        yield (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        yield from _read_range(path, start, end, encoding)
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode("latin-1")
+
+
+def _multipart_length(
+    ranges: List[Tuple[int, int]], size: int, media_type: str, boundary: str
+) -> int:
+    length = len(f"--{boundary}--\r\n")
+    for start, end in ranges:
+        length += len(
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        )
+        length += end - start + 1 + 2
+    return length
+
+
+def content_disposition(disposition: str, filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
+# Serve a file with validators, conditional GET and byte range support.
+# A file stored with a content encoding is sent as stored to clients that
+# accept that encoding, and decoded on the fly for the others; size is then
+# the length of the decoded content.
+def conditional_file_response(
+    request: Request,
+    path: str,
+    *,
+    filename: str,
+    etag: str,
+    last_modified: datetime,
+    media_type: Optional[str] = None,
+    disposition: str = "attachment",
+    immutable: bool = False,
+    encoding: Optional[str] = None,
+    size: Optional[int] = None,
+) -> Response:
+    if media_type is None:
+        media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    # The encoded bytes are a representation of their own, with their own ETag
+    decode = None
+    if encoding is not None and accepts_encoding(
+        request.headers.get("accept-encoding"), encoding
+    ):
+        etag = derived_etag(etag, encoding)
+    elif encoding is not None:
+        decode = encoding
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": _http_date(last_modified),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE,
+    }
+    if encoding is not None:
+        headers["Vary"] = "Accept-Encoding"
+
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = content_disposition(disposition, filename)
+    if decode is None:
+        size = os.path.getsize(path)
+    if encoding is not None and decode is None:
+        headers["Content-Encoding"] = encoding
+
+    range_header = request.headers.get("range")
+    ranges = None
+    if range_header and _range_allowed(request, etag, last_modified):
+        ranges = parse_range(range_header, size)
+
+    if ranges is None:
+        headers["Content-Length"] = str(size)
+        # The whole file as stored: the server sends it (with sendfile where
+        # available). Without a Range header, FileResponse does not handle
+        # ranges of its own.
+        if decode is None and not range_header:
+            record_transfer("download", size)
+            return FileResponse(path, media_type=media_type, headers=headers)
+        return StreamingResponse(
+            count_download(_read_range(path, 0, size - 1, decode)),
+            media_type=media_type,
+            headers=headers,
+        )
+
+    if not ranges:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            count_download(_read_range(path, start, end, decode)),
+            status_code=206,
+            media_type=media_type,
+            headers=headers,
+        )
+
+    boundary = uuid.uuid4().hex
+    headers["Content-Length"] = str(
+        _multipart_length(ranges, size, media_type, boundary)
+    )
+    return StreamingResponse(
+        count_download(
+            _multipart_ranges(path, ranges, size, media_type, boundary, decode)
+        ),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
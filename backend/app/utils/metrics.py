@@ -0,0 +1,169 @@
+import os
+import time
+from typing import Iterator, Optional
+
+from fastapi import Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from starlette.routing import Match
+
+# With several worker processes, point PROMETHEUS_MULTIPROC_DIR at an empty
+# directory shared by the workers: each process writes its samples to mmap
+# files there and /metrics aggregates them, whichever worker serves it.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+THROUGHPUT_BUCKETS = tuple(2**power for power in range(16, 34, 2))
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests being served, by route template.",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+
+TRANSFER_BYTES = Counter(
+    "file_transfer_bytes",
+    "Bytes of file content received by uploads or sent by downloads.",
+    ["direction"],
+)
+TRANSFER_THROUGHPUT = Histogram(
+    "file_transfer_throughput_bytes_per_second",
+    "Throughput of each completed upload or download.",
+    ["direction"],
+    buckets=THROUGHPUT_BUCKETS,
+)
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_seconds",
+    "Time spent in bcrypt, excluding the wait for a hashing worker.",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+
+CHATBOT_UPSTREAM_SECONDS = Histogram(
+    "chatbot_upstream_seconds",
+    "Latency of chat completion calls to the upstream API.",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_connections_checked_out",
+    "Database connections currently in use.",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Connections each pool keeps open, before overflow.",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+# Route template of a request, so paths with ids do not become new series
+def route_template(scope) -> str:
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return UNMATCHED_ROUTE
+
+
+# Record transferred bytes; throughput is observed for whole transfers only
+def record_transfer(direction: str, size: int, seconds: Optional[float] = None):
+    TRANSFER_BYTES.labels(direction).inc(size)
+    if seconds:
+        TRANSFER_THROUGHPUT.labels(direction).observe(size / seconds)
+
+
+# Count the bytes of a response body as they are sent
+def count_download(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    counter = TRANSFER_BYTES.labels("download")
+    started = time.perf_counter()
+    sent = 0
+    for chunk in chunks:
+        counter.inc(len(chunk))
+        sent += len(chunk)
+        yield chunk
+    elapsed = time.perf_counter() - started
+    if elapsed:
+        TRANSFER_THROUGHPUT.labels("download").observe(sent / elapsed)
+
+
+# Track connections in use through pool events, for each engine of app.db
+def instrument_pool(engine, name: str):
+    pool = engine.pool
+    checked_out = DB_POOL_CHECKED_OUT.labels(name)
+    if hasattr(pool, "size"):
+        DB_POOL_SIZE.labels(name).set(pool.size())
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out.inc()
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        checked_out.dec()
+
+
+# Prometheus text exposition of every metric, merged across workers
+def metrics_response() -> Response:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+# ASGI middleware timing each request by route template. Each update is an
+# increment under a short per-series lock (an mmap write in multiprocess mode),
+# and label children are cached by prometheus_client after the first request.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope)
+        in_progress = REQUESTS_IN_PROGRESS.labels(method, route)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress.dec()
+            REQUEST_LATENCY.labels(method, route, str(status)).observe(
+                time.perf_counter() - started
+            )
@@ -0,0 +1,159 @@
+import base64
+import binascii
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import DateTime, and_, or_, tuple_
+
+# Largest page a listing may ask for, and the page size used when a cursor is
+# given without a limit. Listings asking for neither are not paginated, so
+# clients that do not follow X-Next-Cursor still get every row.
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))
+DEFAULT_PAGE_SIZE = min(int(os.getenv("DEFAULT_PAGE_SIZE", 1000)), MAX_PAGE_SIZE)
+
+
+class PageRequest(NamedTuple):
+    limit: Optional[int]  # None returns every row
+    cursor: Optional[str]
+    sort: str
+    prefix: Optional[str]
+    include_total: bool
+
+
+class Page(NamedTuple):
+    items: List[Any]
+    next_cursor: Optional[str]
+    total: Optional[int]
+
+
+# Page size of a request: unbounded when neither a limit nor a cursor is given
+def page_limit(limit: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    if limit is None:
+        return DEFAULT_PAGE_SIZE if cursor else None
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+# Query parameters shared by paginated listings
+def page_params(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    sort: str = Query("name"),
+    prefix: Optional[str] = Query(None),
+    include_total: bool = Query(False),
+) -> PageRequest:
+    return PageRequest(page_limit(limit, cursor), cursor, sort, prefix, include_total)
+
+
+# Expose the cursor and total of a page as response headers
+def set_page_headers(response: Response, page: Page):
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    if page.total is not None:
+        response.headers["X-Total-Count"] = str(page.total)
+
+
+def _invalid_cursor():
+    return HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def _encode(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def encode_cursor(sort: str, value, last_id: int) -> str:
+    raw = json.dumps([sort, _encode(value), last_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, column=None):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+        if column is not None and isinstance(column.type, DateTime) and value:
+            value = datetime.fromisoformat(value)
+    except (binascii.Error, ValueError, TypeError):
+        raise _invalid_cursor()
+
+    # A cursor only makes sense for the ordering that produced it
+    if cursor_sort != sort or not isinstance(last_id, int):
+        raise _invalid_cursor()
+    return value, last_id
+
+
+# Range matching strings starting with prefix, so the lookup can use an index
+def prefix_range(column, prefix: str):
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return column >= prefix, column < upper
+
+
+def _nullable(column) -> bool:
+    return getattr(getattr(column, "expression", column), "nullable", True)
+
+
+# Rows strictly after (value, last_id) in the listing order. NULL sort values
+# come first in ascending order and last in descending order, as ordered by
+# paginate, and are compared by id among themselves.
+def _after(column, id_column, value, last_id: int, descending: bool):
+    if value is None:
+        same_value = and_(
+            column.is_(None), id_column < last_id if descending else id_column > last_id
+        )
+        return same_value if descending else or_(same_value, column.isnot(None))
+
+    keys = tuple_(column, id_column)
+    bound = tuple_(value, last_id)
+    if not descending:
+        return keys > bound
+    if not _nullable(column):
+        return keys < bound
+    return or_(keys < bound, column.is_(None))
+
+
+# Fetch one page of a query with keyset pagination.
+# sort_columns maps the public sort keys to columns; "-key" sorts descending.
+def paginate(
+    query,
+    page: PageRequest,
+    sort_columns: Dict[str, Any],
+    id_column,
+    prefix_column,
+) -> Page:
+    descending = page.sort.startswith("-")
+    key = page.sort.lstrip("-")
+    column = sort_columns.get(key)
+    if column is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort key, expected one of: {', '.join(sort_columns)}.",
+        )
+
+    if page.prefix:
+        query = query.filter(*prefix_range(prefix_column, page.prefix))
+
+    total = query.order_by(None).count() if page.include_total else None
+
+    # Continue strictly after the last row of the previous page
+    if page.cursor:
+        value, last_id = decode_cursor(page.cursor, page.sort, column)
+        query = query.filter(_after(column, id_column, value, last_id, descending))
+
+    if descending:
+        query = query.order_by(column.desc().nulls_last(), id_column.desc())
+    else:
+        query = query.order_by(column.asc().nulls_first(), id_column.asc())
+
+    if page.limit is None:
+        return Page(query.all(), None, total)
+
+    # One extra row tells whether another page follows
+    rows = query.limit(page.limit + 1).all()
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[: page.limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(page.sort, getattr(last, column.key), last.id)
+
+    return Page(rows, next_cursor, total)
@@ -0,0 +1,207 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged as they happen
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", 100))
+
+# The same statement run this many times in one request is a likely N+1
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", 5))
+
+# Slowest statements kept per request, and requests kept for /debug/sql
+SQL_SLOWEST_KEPT = int(os.getenv("SQL_SLOWEST_KEPT", 3))
+SQL_DEBUG_HISTORY = int(os.getenv("SQL_DEBUG_HISTORY", 100))
+
+# /debug/sql shows statements, so it is only served when enabled
+SQL_DEBUG_ENDPOINT = os.getenv("SQL_DEBUG_ENDPOINT", "false").lower() == "true"
+
+# Transaction control is not counted as queries: whether it shows up at all
+# depends on the driver (pysqlite begins transactions implicitly)
+TRANSACTION_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+
+# Queries run on behalf of one request (or one block of code)
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.rows = 0
+        self.statements: Counter = Counter()
+        self.slowest: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, duration: float, rows: int):
+        with self._lock:
+            self.count += 1
+            self.duration += duration
+            self.rows += rows
+            self.statements[statement] += 1
+            self.slowest.append((duration, statement))
+            self.slowest.sort(reverse=True)
+            del self.slowest[SQL_SLOWEST_KEPT:]
+
+    def add_rows(self, rows: int):
+        with self._lock:
+            self.rows += rows
+
+    # Statement shapes repeated often enough to look like a query per item
+    def repeated(self, threshold: int = SQL_N_PLUS_ONE_THRESHOLD) -> List[tuple]:
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+    def summary(self) -> dict:
+        return {
+            "queries": self.count,
+            "db_ms": round(self.duration * 1000, 2),
+            "rows": self.rows,
+            "slowest": [
+                {"ms": round(duration * 1000, 2), "statement": statement}
+                for duration, statement in self.slowest
+            ],
+            "repeated": [
+                {"count": count, "statement": statement}
+                for statement, count in self.repeated()
+            ],
+        }
+
+
+_request_stats: ContextVar[Optional[QueryStats]] = ContextVar(
+    "request_query_stats", default=None
+)
+
+# Collectors opened by count_queries(), fed by queries from any thread
+_collectors: List[QueryStats] = []
+
+# Summaries of the most recent requests, newest last
+_history: deque = deque(maxlen=SQL_DEBUG_HISTORY)
+
+
+def _targets() -> List[QueryStats]:
+    current = _request_stats.get()
+    return ([current] if current is not None else []) + list(_collectors)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start"].pop()
+    if duration * 1000 >= SQL_SLOW_QUERY_MS:
+        logger.warning("Slow query (%.1f ms): %s", duration * 1000, statement)
+
+    if statement.lstrip().upper().startswith(TRANSACTION_CONTROL):
+        return
+
+    # Rows changed by DML; rows read are counted as the ORM loads them
+    rows = cursor.rowcount if cursor.description is None else 0
+    for stats in _targets():
+        stats.record(statement, duration, max(rows, 0))
+
+
+@event.listens_for(Session, "loaded_as_persistent")
+def _record_loaded(session, instance):
+    for stats in _targets():
+        stats.add_rows(1)
+
+
+# Count the queries run inside a block, e.g. to bound them in a test
+@contextmanager
+def count_queries():
+    stats = QueryStats()
+    _collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        _collectors.remove(stats)
+
+
+def recent_requests() -> List[dict]:
+    return list(reversed(_history))
+
+
+def clear_history():
+    _history.clear()
+
+
+def server_timing(stats: QueryStats) -> str:
+    return (
+        f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries, '
+        f'{stats.rows} rows"'
+    )
+
+
+def _log_request(method: str, path: str, stats: QueryStats):
+    for statement, count in stats.repeated():
+        logger.warning(
+            "Possible N+1 in %s %s: statement ran %d times: %s",
+            method,
+            path,
+            count,
+            statement,
+        )
+    if logger.isEnabledFor(logging.DEBUG):
+        for duration, statement in stats.slowest:
+            logger.debug(
+                "%s %s slowest query (%.1f ms): %s",
+                method,
+                path,
+                duration * 1000,
+                statement,
+            )
+
+
+# ASGI middleware recording the queries of each HTTP request. The totals are
+# sent in a Server-Timing header; queries run while a streaming body is being
+# sent are only included in the logs and /debug/sql.
+class SQLInstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _request_stats.set(stats)
+        status = None
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(stats).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+            _log_request(scope["method"], scope["path"], stats)
+            _history.append(
+                {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    **stats.summary(),
+                }
+            )
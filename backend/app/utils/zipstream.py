@@ -0,0 +1,85 @@
+import zipfile
+from datetime import datetime
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+from app.utils.codec import is_compressed_format, open_decoded
+
+CHUNK_SIZE = 64 * 1024
+
+# ZIP timestamps cannot be earlier than this
+ZIP_EPOCH = datetime(1980, 1, 1)
+
+
+# A file of the archive, or a directory when path is None
+class ZipEntry(NamedTuple):
+    name: str
+    path: Optional[str]
+    size: int  # Size of the original content
+    modified: datetime
+    encoding: Optional[str] = None  # Storage encoding of the file at path
+
+
+# Write-only file object handing the archive bytes back to the generator.
+# Without seek(), zipfile writes sizes in data descriptors after each entry
+# instead of going back to the local header, so nothing is rewritten.
+class _Sink:
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        if self._chunks:
+            data = b"".join(self._chunks)
+            self._chunks.clear()
+            yield data
+
+
+def _directory_info(name: str, modified: tuple) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name.rstrip("/") + "/", modified)
+    info.CRC = info.compress_size = info.file_size = 0
+    info.external_attr = (0o40755 << 16) | 0x10  # Unix mode and MS-DOS flag
+    return info
+
+
+# Stream a ZIP archive of the given files, holding one chunk at a time.
+# Entries whose content starts like a compressed format are stored as is,
+# the others deflated. ZIP64 records are used for entries, offsets or entry
+# counts past the classic limits.
+def stream_zip(entries: Iterable[ZipEntry]) -> Iterator[bytes]:
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as archive:
+        for entry in entries:
+            modified = max(entry.modified, ZIP_EPOCH).timetuple()[:6]
+            if entry.path is None:
+                archive.writestr(_directory_info(entry.name, modified), b"")
+                yield from sink.drain()
+                continue
+
+            with open_decoded(entry.path, entry.encoding) as source:
+                chunk = source.read(CHUNK_SIZE)
+                info = zipfile.ZipInfo(entry.name, modified)
+                info.compress_type = (
+                    zipfile.ZIP_STORED
+                    if is_compressed_format(chunk)
+                    else zipfile.ZIP_DEFLATED
+                )
+                # A known size lets zipfile decide on ZIP64 for the entry
+                info.file_size = entry.size
+                with archive.open(info, "w") as out:
+                    while chunk:
+                        out.write(chunk)
+                        yield from sink.drain()
+                        chunk = source.read(CHUNK_SIZE)
+            yield from sink.drain()
+    yield from sink.drain()
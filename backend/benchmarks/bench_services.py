@@ -0,0 +1,384 @@
+"""Throughput and latency of the storage and listing services on synthetic data.
+
+Each dataset size seeds a fresh SQLite database (many users, deep folder
+trees, one heavily versioned document) and times the services directly,
+without HTTP. Results are written as JSON; given a baseline from an earlier
+run, a p50 or p99 slowdown beyond --max-regression fails the run.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_services --sizes small,medium --output run.json
+    python -m benchmarks.bench_services --baseline run.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from io import BytesIO
+from typing import Callable, Dict, List, NamedTuple
+
+from fastapi import Request, UploadFile
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from app.auth.dependencies import CurrentUser
+from app.db import create_async_db_engine, create_db_engine
+from app.migrations import run_migrations
+from app.models import folders as foldersModels, users as usersModels
+from app.services.files import (
+    get_files_from_folder,
+    preview_file_from_path,
+    upload_user_file,
+)
+from app.services.folders import (
+    create_folder_service,
+    delete_folder_from_path,
+    get_user_folders,
+)
+from app.services.revisions import revision_filename
+from app.services.storage import blob_path
+from app.utils.pagination import PageRequest
+
+
+class Dataset(NamedTuple):
+    users: int
+    folders_per_user: int
+    depth: int
+    revisions: int
+
+
+DATASETS = {
+    "small": Dataset(users=10, folders_per_user=100, depth=4, revisions=1_000),
+    "medium": Dataset(users=50, folders_per_user=1_000, depth=6, revisions=10_000),
+    "large": Dataset(users=100, folders_per_user=5_000, depth=8, revisions=100_000),
+}
+
+# The user every operation runs as; the others only add rows to the tables
+BENCH_USER = CurrentUser(1, "bench", "bench@example.com")
+HOT_FOLDER = "hot"
+HOT_DOCUMENT = ("report", ".txt")
+CONTENT = b"benchmark content\n" * 64
+PAGE = PageRequest(
+    limit=100, cursor=None, sort="name", prefix=None, include_total=False
+)
+
+
+def _folder_paths(rng: random.Random, count: int, depth: int) -> List[str]:
+    paths = set()
+    while len(paths) < count:
+        levels = rng.randint(1, depth)
+        paths.add("/".join(f"d{rng.randint(0, 9)}" for _ in range(levels)))
+    # Every ancestor exists, as it would after create_folder
+    for path in list(paths):
+        parts = path.split("/")
+        paths.update("/".join(parts[:i]) for i in range(1, len(parts)))
+    return sorted(paths, key=lambda path: (path.count("/"), path))
+
+
+# Seed users, folder trees, a versioned document and folders to delete
+def seed(session_factory, dataset: Dataset, victims: int, rng: random.Random):
+    sha256 = hashlib.sha256(CONTENT).hexdigest()
+    path = blob_path(sha256)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(CONTENT)
+
+    users, folders, files = [], [], []
+    folder_ids: Dict[tuple, int] = {}
+
+    def add_folder(user_id: int, folder_path: str) -> int:
+        parent = folder_path.rpartition("/")[0]
+        folder_id = len(folders) + 1
+        folders.append(
+            {
+                "id": folder_id,
+                "path": folder_path,
+                "user_id": user_id,
+                "parent_id": folder_ids.get((user_id, parent)),
+            }
+        )
+        folder_ids[(user_id, folder_path)] = folder_id
+        return folder_id
+
+    def add_file(user_id: int, folder_id: int, base_name: str, revision: int):
+        files.append(
+            {
+                "filename": revision_filename(base_name, ".txt", revision),
+                "base_name": base_name,
+                "file_path": path,
+                "user_id": user_id,
+                "folder_id": folder_id,
+                "revision": revision,
+                "blob_id": 1,
+            }
+        )
+
+    for user_id in range(1, dataset.users + 1):
+        users.append(
+            {
+                "id": user_id,
+                "username": f"user{user_id}",
+                "email": f"user{user_id}@example.com",
+                "hashed_password": "x",
+            }
+        )
+        paths = _folder_paths(rng, dataset.folders_per_user, dataset.depth)
+        for folder_path in paths:
+            folder_id = add_folder(user_id, folder_path)
+            add_file(user_id, folder_id, "notes", 0)
+    users[0].update(username=BENCH_USER.username, email=BENCH_USER.email)
+
+    hot_id = add_folder(BENCH_USER.id, HOT_FOLDER)
+    for revision in range(dataset.revisions):
+        add_file(BENCH_USER.id, hot_id, HOT_DOCUMENT[0], revision)
+
+    add_folder(BENCH_USER.id, "victims")
+    for i in range(victims):
+        victim_id = add_folder(BENCH_USER.id, f"victims/{i}")
+        child_id = add_folder(BENCH_USER.id, f"victims/{i}/child")
+        for n in range(5):
+            add_file(BENCH_USER.id, victim_id, f"doc{n}", 0)
+            add_file(BENCH_USER.id, child_id, f"doc{n}", 0)
+
+    with session_factory() as db:
+        db.execute(insert(usersModels.User), users)
+        db.execute(
+            insert(foldersModels.Blob),
+            [
+                {
+                    "id": 1,
+                    "sha256": sha256,
+                    "size": len(CONTENT),
+                    "refcount": len(files),
+                }
+            ],
+        )
+        db.execute(insert(foldersModels.Folder), folders)
+        db.execute(insert(foldersModels.File), files)
+        db.execute(
+            insert(foldersModels.RevisionCounter),
+            [
+                {
+                    "folder_id": hot_id,
+                    "base_name": HOT_DOCUMENT[0],
+                    "last_revision": dataset.revisions - 1,
+                }
+            ],
+        )
+        db.commit()
+    return len(files)
+
+
+def _request() -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+
+
+def _upload(name: str) -> UploadFile:
+    return UploadFile(file=BytesIO(CONTENT), filename=name)
+
+
+# Send a response through ASGI, as the server would, discarding the body.
+# The client never disconnects, so receive() waits until the response is done.
+async def _drain(response):
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        pass
+
+    await response(_request().scope, receive, send)
+
+
+# Operations, each called with the iteration number
+def operations(session_factory, async_session_factory) -> Dict[str, Callable]:
+    async def upload(i):
+        async with async_session_factory() as db:
+            name = "".join(HOT_DOCUMENT)
+            await upload_user_file(HOT_FOLDER, _upload(name), db, BENCH_USER)
+
+    async def create_folder(i):
+        with session_factory() as db:
+            files = [_upload("a.txt"), _upload("b.txt")]
+            create_folder_service(f"created/{i}/inbox", BENCH_USER, db, files)
+
+    async def list_files(i):
+        with session_factory() as db:
+            get_files_from_folder(HOT_FOLDER, db, BENCH_USER, PAGE)
+
+    async def list_folders(i):
+        with session_factory() as db:
+            get_user_folders(db, BENCH_USER, PAGE)
+
+    async def preview(i):
+        with session_factory() as db:
+            filename = "".join(HOT_DOCUMENT)
+            response = preview_file_from_path(
+                HOT_FOLDER, filename, None, db, BENCH_USER, _request()
+            )
+        await _drain(response)
+
+    async def delete_folder(i):
+        with session_factory() as db:
+            delete_folder_from_path(f"victims/{i}", db, BENCH_USER)
+
+    return {
+        "upload_user_file": upload,
+        "create_folder_service": create_folder,
+        "get_files_from_folder": list_files,
+        "get_user_folders": list_folders,
+        "preview_file_from_path": preview,
+        "delete_folder_from_path": delete_folder,
+    }
+
+
+def _percentile(latencies: List[float], q: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def _measure(operation: Callable, iterations: int, warmup: int) -> dict:
+    for i in range(warmup):
+        await operation(iterations + i)
+
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        op_started = time.perf_counter()
+        await operation(i)
+        latencies.append(time.perf_counter() - op_started)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "iterations": iterations,
+        "ops_per_s": round(iterations / elapsed, 2),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+# Services write under ./uploads, so each size runs in its own directory
+async def run_size(name: str, dataset: Dataset, args) -> dict:
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as workdir:
+        os.chdir(workdir)
+        try:
+            return await _run_in(workdir, name, dataset, args)
+        finally:
+            os.chdir(cwd)
+
+
+async def _run_in(workdir: str, name: str, dataset: Dataset, args) -> dict:
+    url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    engine = create_db_engine(url)
+    run_migrations(engine)
+    session_factory = sessionmaker(autoflush=False, bind=engine)
+    async_engine = create_async_db_engine(url)
+    async_session_factory = async_sessionmaker(
+        async_engine, class_=AsyncSession, autoflush=False
+    )
+
+    # Deleted folders are consumed, so warmup deletions need their own victims
+    victims = args.iterations + args.warmup
+    started = time.perf_counter()
+    rows = seed(session_factory, dataset, victims, random.Random(args.seed))
+    print(f"[{name}] seeded {rows} files in {time.perf_counter() - started:.1f}s")
+
+    results = {}
+    for op_name, operation in operations(
+        session_factory, async_session_factory
+    ).items():
+        results[op_name] = await _measure(operation, args.iterations, args.warmup)
+        print(
+            f"[{name}] {op_name:<24} {results[op_name]['ops_per_s']:>10.1f} ops/s"
+            f"  p50 {results[op_name]['p50_ms']:>8.2f} ms"
+            f"  p99 {results[op_name]['p99_ms']:>8.2f} ms"
+        )
+
+    await async_engine.dispose()
+    engine.dispose()
+    return {"dataset": dataset._asdict(), "operations": results}
+
+
+# Operations whose p50 or p99 got slower than allowed, compared to a baseline
+def regressions(current: dict, baseline: dict, max_ratio: float, min_ms: float):
+    found = []
+    for size, result in current["results"].items():
+        base_ops = baseline.get("results", {}).get(size, {}).get("operations", {})
+        for op_name, stats in result["operations"].items():
+            base = base_ops.get(op_name)
+            if base is None:
+                continue
+            for key in ("p50_ms", "p99_ms"):
+                slower = stats[key] - base[key]
+                if slower > min_ms and stats[key] > base[key] * (1 + max_ratio):
+                    found.append(
+                        f"{size} {op_name} {key}: {base[key]:.2f} -> {stats[key]:.2f}"
+                    )
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="small,medium")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.25,
+        help="allowed slowdown of p50/p99 against the baseline (0.25 = 25%%)",
+    )
+    parser.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=0.5,
+        help="ignore slowdowns smaller than this, which are noise",
+    )
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "iterations": args.iterations,
+        },
+        "results": {},
+    }
+    for name in args.sizes.split(","):
+        report["results"][name] = asyncio.run(run_size(name, DATASETS[name], args))
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {output}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        found = regressions(report, baseline, args.max_regression, args.min_delta_ms)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+        print("No regression against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
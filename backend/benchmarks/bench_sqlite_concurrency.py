@@ -0,0 +1,179 @@
+"""Concurrent readers and writers against SQLite, before and after tuning.
+
+Compares the engine the app used to build (rollback journal, no pragmas)
+with the one from app.db.create_db_engine (WAL, busy_timeout, mmap, cache).
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_sqlite_concurrency --writers 4 --readers 8
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.db import create_db_engine
+
+SCHEMA = """
+CREATE TABLE files (
+    id INTEGER PRIMARY KEY,
+    folder_id INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    uploaded_at REAL NOT NULL
+)
+"""
+
+
+def baseline_engine(url: str):
+    return create_engine(url, connect_args={"check_same_thread": False})
+
+
+def tuned_engine(url: str):
+    return create_db_engine(url)
+
+
+def _seed(engine, rows: int):
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA))
+        conn.execute(text("CREATE INDEX ix_files_folder ON files (folder_id, filename)"))
+        conn.execute(
+            text(
+                "INSERT INTO files (folder_id, filename, uploaded_at) "
+                "VALUES (:folder_id, :filename, :uploaded_at)"
+            ),
+            [
+                {"folder_id": i % 50, "filename": f"seed-{i}.txt", "uploaded_at": 0}
+                for i in range(rows)
+            ],
+        )
+
+
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.reads = 0
+        self.locked = 0
+        self.latencies = []
+
+    def record(self, kind: str, elapsed: float):
+        with self.lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+            if kind == "writes":
+                self.latencies.append(elapsed)
+
+    def failed(self):
+        with self.lock:
+            self.locked += 1
+
+
+def _writer(engine, worker: int, deadline: float, counters: Counters):
+    n = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text(
+                        "INSERT INTO files (folder_id, filename, uploaded_at) "
+                        "VALUES (:folder_id, :filename, :uploaded_at)"
+                    ),
+                    {
+                        "folder_id": n % 50,
+                        "filename": f"w{worker}-{n}.txt",
+                        "uploaded_at": time.time(),
+                    },
+                )
+        except OperationalError as exc:
+            if "locked" not in str(exc):
+                raise
+            counters.failed()
+        else:
+            counters.record("writes", time.perf_counter() - start)
+        n += 1
+
+
+def _reader(engine, worker: int, deadline: float, counters: Counters):
+    n = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(
+                    text(
+                        "SELECT id, filename FROM files WHERE folder_id = :folder_id "
+                        "ORDER BY filename LIMIT 100"
+                    ),
+                    {"folder_id": (worker + n) % 50},
+                ).all()
+        except OperationalError as exc:
+            if "locked" not in str(exc):
+                raise
+            counters.failed()
+        else:
+            counters.record("reads", time.perf_counter() - start)
+        n += 1
+
+
+def run(name: str, factory, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = factory(url)
+        _seed(engine, args.rows)
+
+        counters = Counters()
+        deadline = time.perf_counter() + args.duration
+        threads = [
+            threading.Thread(target=_writer, args=(engine, i, deadline, counters))
+            for i in range(args.writers)
+        ] + [
+            threading.Thread(target=_reader, args=(engine, i, deadline, counters))
+            for i in range(args.readers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    latencies = sorted(counters.latencies) or [0.0]
+    return {
+        "engine": name,
+        "writes_per_s": counters.writes / args.duration,
+        "reads_per_s": counters.reads / args.duration,
+        "locked_errors": counters.locked,
+        "write_p95_ms": latencies[int((len(latencies) - 1) * 0.95)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    results = [
+        run("baseline", baseline_engine, args),
+        run("tuned", tuned_engine, args),
+    ]
+
+    print(
+        f"{'engine':<10}{'writes/s':>12}{'reads/s':>12}"
+        f"{'write p95 ms':>15}{'locked':>9}"
+    )
+    for result in results:
+        print(
+            f"{result['engine']:<10}{result['writes_per_s']:>12.1f}"
+            f"{result['reads_per_s']:>12.1f}{result['write_p95_ms']:>15.2f}"
+            f"{result['locked_errors']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+"""Concurrent load against the FastAPI app, synthetic or replayed from a trace.
+
+By default the app is driven in-process through httpx.ASGITransport, on a
+temporary database and upload directory. --target uvicorn serves it on a
+local socket from a background thread instead, and --url points at a server
+that is already running.
+
+Each client loops over a weighted mix of operations as one of --users
+synthetic accounts. --record writes the requests as a JSONL trace, and
+--replay sends a trace again at its recorded pace (scaled by --speed).
+
+Run from the backend directory:
+
+    python -m benchmarks.loadgen --clients 200 --duration 30 --record trace.jsonl
+    python -m benchmarks.loadgen --replay trace.jsonl --speed 2 --output report.json
+"""
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+DEFAULT_MIX = "login=1,list=4,upload=2,preview=3,download=3,delete=1"
+PASSWORD = "load-test-password"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation in --mix: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# Latencies, statuses and event-loop lag, bucketed by interval
+class Recorder:
+    def __init__(self, interval: float, trace_path: Optional[str]):
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.buckets: Dict[int, dict] = defaultdict(
+            lambda: {"latencies": [], "errors": 0, "lag": []}
+        )
+        self.lock = threading.Lock()
+        self.trace = open(trace_path, "w") if trace_path else None
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def _bucket(self) -> dict:
+        return self.buckets[int(self.elapsed() // self.interval)]
+
+    def request(self, op: str, status: Optional[int], latency: float, entry: dict):
+        error = status is None or status >= 500
+        with self.lock:
+            self.latencies[op].append(latency)
+            self.statuses[op][str(status) if status else "exception"] += 1
+            bucket = self._bucket()
+            bucket["latencies"].append(latency)
+            bucket["errors"] += error
+            if self.trace:
+                self.trace.write(json.dumps(entry) + "\n")
+
+    def lag(self, seconds: float):
+        with self.lock:
+            self._bucket()["lag"].append(seconds)
+
+    def close(self):
+        if self.trace:
+            self.trace.close()
+
+    def report(self) -> dict:
+        operations = {}
+        for op, latencies in sorted(self.latencies.items()):
+            statuses = self.statuses[op]
+            errors = sum(
+                count
+                for status, count in statuses.items()
+                if status == "exception" or int(status) >= 500
+            )
+            operations[op] = {
+                "requests": len(latencies),
+                "error_rate": round(errors / len(latencies), 4),
+                "statuses": dict(statuses),
+                "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+                "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+                "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+            }
+
+        timeline = []
+        for index in sorted(self.buckets):
+            bucket = self.buckets[index]
+            latencies = bucket["latencies"]
+            timeline.append(
+                {
+                    "t": round(index * self.interval, 2),
+                    "requests_per_s": round(len(latencies) / self.interval, 1),
+                    "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+                    "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+                    "errors": bucket["errors"],
+                    "max_loop_lag_ms": round(max(bucket["lag"], default=0) * 1000, 2),
+                }
+            )
+
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            "duration_s": round(self.elapsed(), 2),
+            "requests": total,
+            "requests_per_s": round(total / max(self.elapsed(), 1e-9), 1),
+            "operations": operations,
+            "timeline": timeline,
+        }
+
+
+# Sleep in short steps on a loop; any overshoot is time the loop was blocked
+async def monitor_loop_lag(recorder: Recorder, stop: asyncio.Event, step=0.05):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(step)
+        recorder.lag(max(0.0, time.perf_counter() - started - step))
+
+
+# One synthetic account: its session cookie, folder and uploaded files
+class SyntheticUser:
+    def __init__(self, index: int):
+        self.index = index
+        self.email = f"load{index}@example.com"
+        self.folder = f"load/user{index}"
+        self.token: Optional[str] = None
+        self.files: List[str] = []
+        self.uploads = 0
+
+    def headers(self) -> dict:
+        return {"Cookie": f"access_token={self.token}"} if self.token else {}
+
+
+async def send(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    op: str,
+    user: SyntheticUser,
+    method: str,
+    path: str,
+    json_body=None,
+    data=None,
+    upload: Optional[dict] = None,
+) -> Optional[httpx.Response]:
+    files = None
+    if upload:
+        content = os.urandom(upload["size"])
+        files = {upload["field"]: (upload["filename"], content, "text/plain")}
+
+    entry = {
+        "t": round(recorder.elapsed(), 4),
+        "op": op,
+        "user": user.index,
+        "method": method,
+        "path": path,
+    }
+    for key, value in (("json", json_body), ("data", data), ("upload", upload)):
+        if value is not None:
+            entry[key] = value
+
+    started = time.perf_counter()
+    try:
+        response = await client.request(
+            method,
+            path,
+            json=json_body,
+            data=data,
+            files=files,
+            headers=user.headers(),
+        )
+    except httpx.HTTPError:
+        recorder.request(op, None, time.perf_counter() - started, entry)
+        return None
+    recorder.request(op, response.status_code, time.perf_counter() - started, entry)
+    return response
+
+
+async def op_login(client, recorder, user):
+    response = await send(
+        client,
+        recorder,
+        "login",
+        user,
+        "POST",
+        "/login/",
+        json_body={"email": user.email, "password": PASSWORD},
+    )
+    if response is not None and response.status_code == 200:
+        user.token = response.cookies.get("access_token")
+
+
+async def op_list(client, recorder, user):
+    await send(client, recorder, "list", user, "GET", f"/folder/{user.folder}/files/")
+
+
+async def op_upload(client, recorder, user):
+    user.uploads += 1
+    filename = f"file{user.uploads % 20}.txt"
+    response = await send(
+        client,
+        recorder,
+        "upload",
+        user,
+        "POST",
+        f"/upload/{user.folder}",
+        upload={"field": "file", "filename": filename, "size": 4096},
+    )
+    if response is not None and response.status_code == 200:
+        user.files.append(response.json()["file"])
+
+
+async def op_preview(client, recorder, user):
+    if not user.files:
+        return await op_upload(client, recorder, user)
+    filename = random.choice(user.files)
+    await send(
+        client, recorder, "preview", user, "GET", f"/folder/{user.folder}/{filename}"
+    )
+
+
+async def op_download(client, recorder, user):
+    if not user.files:
+        return await op_upload(client, recorder, user)
+    filename = random.choice(user.files)
+    await send(
+        client, recorder, "download", user, "GET", f"/download/{user.folder}/{filename}"
+    )
+
+
+async def op_delete(client, recorder, user):
+    if not user.files:
+        return await op_upload(client, recorder, user)
+    filename = user.files.pop(random.randrange(len(user.files)))
+    await send(
+        client,
+        recorder,
+        "delete",
+        user,
+        "DELETE",
+        f"/delete_file/{user.folder}/{filename}",
+    )
+
+
+OPERATIONS = {
+    "login": op_login,
+    "list": op_list,
+    "upload": op_upload,
+    "preview": op_preview,
+    "download": op_download,
+    "delete": op_delete,
+}
+
+
+# Register, log in and create the folder of every synthetic user
+async def setup_users(client, count: int, concurrency: int) -> List[SyntheticUser]:
+    users = [SyntheticUser(index) for index in range(count)]
+    setup = Recorder(interval=1.0, trace_path=None)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def prepare(user: SyntheticUser):
+        async with semaphore:
+            await send(
+                client,
+                setup,
+                "register",
+                user,
+                "POST",
+                "/register/",
+                json_body={
+                    "username": f"load{user.index}",
+                    "email": user.email,
+                    "password": PASSWORD,
+                },
+            )
+            await op_login(client, setup, user)
+            await send(
+                client,
+                setup,
+                "create_folder",
+                user,
+                "POST",
+                "/create_folder/",
+                data={"folder_path": user.folder},
+            )
+
+    await asyncio.gather(*(prepare(user) for user in users))
+    return users
+
+
+async def run_mix(client, recorder, users, clients: int, duration: float, mix):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    deadline = time.perf_counter() + duration
+
+    async def worker(index: int):
+        user = users[index % len(users)]
+        while time.perf_counter() < deadline:
+            op = random.choices(names, weights)[0]
+            await OPERATIONS[op](client, recorder, user)
+
+    await asyncio.gather(*(worker(index) for index in range(clients)))
+
+
+# Send the requests of a trace at their recorded offsets
+async def replay(client, recorder, users, trace_path: str, speed: float):
+    with open(trace_path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    started = time.perf_counter()
+
+    async def replay_one(entry: dict):
+        delay = entry["t"] / speed - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        user = users[entry.get("user", 0) % len(users)]
+        await send(
+            client,
+            recorder,
+            entry.get("op", entry["method"].lower()),
+            user,
+            entry["method"],
+            entry["path"],
+            json_body=entry.get("json"),
+            data=entry.get("data"),
+            upload=entry.get("upload"),
+        )
+
+    await asyncio.gather(*(replay_one(entry) for entry in entries))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Serve the app with uvicorn on a background thread; returns its URL and loop
+def start_uvicorn(app):
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(
+        target=loop.run_until_complete, args=(server.serve(),), daemon=True
+    )
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server, loop
+
+
+# A throwaway database and upload directory for the in-process app
+def prepare_app():
+    workdir = tempfile.mkdtemp(prefix="loadgen-")
+    atexit.register(shutil.rmtree, workdir, True)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/load.db")
+    os.environ.setdefault("SECRET_KEY", os.urandom(16).hex())
+    os.environ.setdefault("OPENAI_API_KEY", "unused")
+    os.chdir(workdir)
+    from app.main import app, prepare_database
+
+    # The ASGI transport does not run startup handlers
+    prepare_database()
+    return app
+
+
+async def main_async(args) -> dict:
+    recorder = Recorder(args.interval, args.record)
+    stop = asyncio.Event()
+    server = None
+    app_loop = None
+
+    if args.url:
+        transport, base_url = httpx.AsyncHTTPTransport(), args.url
+    else:
+        app = prepare_app()
+        if args.target == "uvicorn":
+            base_url, server, app_loop = start_uvicorn(app)
+            transport = httpx.AsyncHTTPTransport()
+        else:
+            transport, base_url = httpx.ASGITransport(app=app), "http://loadgen"
+
+    # Lag is measured on the loop running the app, or on this one for --url
+    if app_loop is not None:
+        lag_future = asyncio.run_coroutine_threadsafe(
+            monitor_loop_lag(recorder, asyncio.Event()), app_loop
+        )
+    else:
+        lag_task = asyncio.create_task(monitor_loop_lag(recorder, stop))
+
+    limits = httpx.Limits(max_connections=args.clients)
+    async with httpx.AsyncClient(
+        transport=transport, base_url=base_url, limits=limits, timeout=args.timeout
+    ) as client:
+        users = await setup_users(client, args.users, min(args.users, 16))
+        recorder.started = time.perf_counter()
+        recorder.buckets.clear()
+        if args.replay:
+            await replay(client, recorder, users, args.replay, args.speed)
+        else:
+            mix = parse_mix(args.mix)
+            await run_mix(client, recorder, users, args.clients, args.duration, mix)
+
+    stop.set()
+    if app_loop is not None:
+        lag_future.cancel()
+        server.should_exit = True
+    else:
+        await lag_task
+    recorder.close()
+    return recorder.report()
+
+
+def print_report(report: dict):
+    print(
+        f"{report['requests']} requests in {report['duration_s']}s "
+        f"({report['requests_per_s']} req/s)"
+    )
+    print(
+        f"{'operation':<10}{'requests':>10}{'errors':>9}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    )
+    for op, stats in report["operations"].items():
+        print(
+            f"{op:<10}{stats['requests']:>10}{stats['error_rate']:>9.2%}"
+            f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+        )
+    print(
+        f"\n{'t':>6}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+        f"{'errors':>8}{'loop lag ms':>13}"
+    )
+    for point in report["timeline"]:
+        print(
+            f"{point['t']:>6}{point['requests_per_s']:>10}{point['p50_ms']:>10.1f}"
+            f"{point['p99_ms']:>10.1f}{point['errors']:>8}"
+            f"{point['max_loop_lag_ms']:>13.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--url", help="load a running server instead")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--record", help="write the requests sent as a JSONL trace")
+    parser.add_argument("--replay", help="send the requests of a JSONL trace")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--output", help="write the report to this JSON file")
+    parser.add_argument(
+        "--max-error-rate",
+        type=float,
+        default=0.01,
+        help="exit with status 1 when an operation has more 5xx or failed requests",
+    )
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    for option in ("record", "replay", "output"):
+        if getattr(args, option):
+            setattr(args, option, os.path.abspath(getattr(args, option)))
+
+    report = asyncio.run(main_async(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if any(
+        stats["error_rate"] > args.max_error_rate
+        for stats in report["operations"].values()
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()